@@ -0,0 +1,366 @@
+'''
+Flight Recorder
+
+2026-10-18
+PSU UAS
+
+Records every MAVLink message the dispatcher receives, plus camera frame
+timestamps, to an append-only telemetry log (.tlog) in ./flight_logs. Each
+record is an 8-byte big-endian microsecond timestamp followed by the raw
+MAVLink packet, the format Mission Planner and pymavlink read. Camera frames
+are stored as NAMED_VALUE_INT 'FRAME' packets from the camera component, so
+the file stays readable by standard tools.
+
+Records are collected in a fixed-size in-memory buffer. Full buffers, and
+every FLUSH_INTERVAL seconds whatever is buffered, are written by a writer
+thread, so a slow SD card never holds up the dispatcher's reader thread.
+
+A recording replays through the normal state machine by passing it as the
+connection string; messages are paced from their recorded timestamps at N
+times real speed:
+    python uas_state_machine.py --connection ./flight_logs/flight_<date>.tlog --replay-speed 60
+During a replay ReplayCamera stands in for the camera: each capture returns
+the next recorded pass, with its recorded frame times and the frames the
+image archiver kept for it (images_<date> beside the recording).
+'''
+
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+from datetime import datetime
+from collections import deque
+import threading
+import cv2
+import struct
+import time
+import os
+
+
+# ============== Parameters =================
+BUFFER_SIZE = 64 * 1024     # bytes held in memory between writes
+FLUSH_INTERVAL = 2.0        # seconds between writes when the buffer isn't full
+MAX_PENDING = 64            # full buffers waiting for the writer before the oldest is dropped
+REPLAY_FRAME_TIMEOUT = 30   # seconds a replayed capture waits for its pass to come up
+LOG_DIR = "./flight_logs"
+
+FRAME_NAME = 'FRAME'
+GCS_SYSTEM_ID = 255
+MAV_COMP_ID_CAMERA = 100
+
+TIMESTAMP = struct.Struct('>Q')
+
+
+class FlightRecorder:
+
+    def __init__(self, dispatcher, filename=None, logger=None, buffer_size=BUFFER_SIZE, name=None):
+        '''
+            dispatcher: MessageDispatcher to record from
+            filename: .tlog path, or None for a timestamped file in ./flight_logs
+            logger: logger to report on
+            buffer_size: bytes held in memory between writes
+            name: vehicle name added to the default filename
+        '''
+        if filename is None:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            tag = f"{name}_" if name else ""
+            filename = os.path.join(LOG_DIR, f"flight_{tag}{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.tlog")
+
+        self.dispatcher = dispatcher
+        self.filename = filename
+        self.logger = logger
+
+        self._buffer = bytearray(buffer_size)
+        self._used = 0
+        self._lock = threading.Condition()
+        self._pending = deque()     # full buffers waiting for the writer
+        self._file = None
+        self._writer = None
+        self._running = False
+
+        # encoder for the frame markers
+        self._encoder = mavlink.MAVLink(None, srcSystem=GCS_SYSTEM_ID, srcComponent=MAV_COMP_ID_CAMERA)
+        self._boot = time.monotonic()
+
+        self.messages = 0
+        self.frames = 0
+        self.bytes_written = 0
+        self.dropped = 0            # bytes lost because the writer fell too far behind
+
+
+    def start(self):
+        '''
+            Open the recording and start recording.
+        '''
+        if self._running:
+            return
+        self._file = open(self.filename, 'ab')
+        self._running = True
+        self._writer = threading.Thread(target=self._write_loop, name='flight-recorder', daemon=True)
+        self._writer.start()
+        self.dispatcher.add_listener(self.record_message)
+        if self.logger:
+            self.logger.info(f"[Recorder] Recording to {self.filename}")
+
+
+    def stop(self):
+        '''
+            Stop recording and write out what is buffered.
+        '''
+        if not self._running:
+            return
+        self.dispatcher.remove_listener(self.record_message)
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+        self._writer.join()
+        self._writer = None
+        self._file.close()
+        self._file = None
+        if self.logger:
+            dropped = f", {self.dropped} bytes dropped" if self.dropped else ""
+            self.logger.info(f"[Recorder] Recorded {self.messages} messages and {self.frames} frames ({self.bytes_written} bytes{dropped}).")
+
+
+    def record_message(self, msg):
+        '''
+            Record one received message. Runs on the dispatcher's reader thread.
+        '''
+        packet = msg.get_msgbuf()
+        stamp = getattr(msg, '_timestamp', None) or time.time()
+        self._append(stamp, packet)
+        self.messages += 1
+
+
+    def record_frame(self, index, timestamp=None):
+        '''
+            Record that camera frame index was captured.
+            timestamp: capture time in seconds since the epoch, or None for now
+        '''
+        if timestamp is None:
+            timestamp = time.time()
+        time_boot_ms = int((time.monotonic() - self._boot) * 1000) & 0xFFFFFFFF
+        packet = self._encoder.named_value_int_encode(time_boot_ms, FRAME_NAME.encode(), index).pack(self._encoder)
+        self._append(timestamp, packet)
+        self.frames += 1
+
+
+    def _append(self, stamp, packet):
+        '''
+            Copy a record into the buffer; never touches the file.
+        '''
+        record = TIMESTAMP.pack(int(stamp * 1e6)) + bytes(packet)
+        with self._lock:
+            if not self._running:
+                return
+
+            if self._used + len(record) > len(self._buffer):
+                self._hand_over()
+            if len(record) > len(self._buffer):
+                self._queue(bytes(record))
+            else:
+                self._buffer[self._used:self._used + len(record)] = record
+                self._used += len(record)
+
+
+    def _hand_over(self):
+        '''
+            Queue the buffered records for the writer. Caller must hold the lock.
+        '''
+        if self._used:
+            self._queue(bytes(self._buffer[:self._used]))
+            self._used = 0
+
+
+    def _queue(self, data):
+        if len(self._pending) >= MAX_PENDING:
+            self.dropped += len(self._pending.popleft())
+        self._pending.append(data)
+        self._lock.notify()
+
+
+    def _write_loop(self):
+        '''
+            Write queued buffers, and everything buffered every FLUSH_INTERVAL,
+            until stopped; then write out the rest.
+        '''
+        running = True
+        while running:
+            with self._lock:
+                if self._running and not self._pending:
+                    self._lock.wait(FLUSH_INTERVAL)
+                running = self._running
+                if not self._pending or not running:
+                    # nothing filled up in time, or stopping: write out what there is
+                    self._hand_over()
+                chunks = list(self._pending)
+                self._pending.clear()
+
+            for data in chunks:
+                self._file.write(data)
+                self.bytes_written += len(data)
+            if chunks:
+                self._file.flush()
+
+
+def read_recording(filename):
+    '''
+        Read a recording back.
+        yields:
+            (timestamp, message) in recorded order; frame markers are
+            NAMED_VALUE_INT messages named 'FRAME'
+    '''
+    parser = mavlink.MAVLink(None)
+    parser.robust_parsing = True
+
+    with open(filename, 'rb') as file:
+        while True:
+            header = file.read(TIMESTAMP.size)
+            if len(header) < TIMESTAMP.size:
+                return
+            stamp = TIMESTAMP.unpack(header)[0] / 1e6
+
+            # feed bytes until the parser completes one packet
+            msg = None
+            while msg is None:
+                byte = file.read(1)
+                if not byte:
+                    return
+                msg = parser.parse_char(byte)
+            yield stamp, msg
+
+
+def is_frame(msg):
+    '''
+        True if msg is a camera frame marker written by record_frame.
+    '''
+    return msg.get_type() == 'NAMED_VALUE_INT' and msg.name.rstrip('\x00') == FRAME_NAME
+
+
+def pace_replay(master, speed):
+    '''
+        Pace a log file connection so messages arrive at speed times the rate
+        they were recorded. Must be applied before the dispatcher starts.
+        A log file is opened read-only, so everything sent during a replay
+        (commands, mode changes, mission uploads) is discarded instead.
+        master: mavutil connection opened on a .tlog file
+        speed: replay speed multiplier
+    '''
+    master.write = lambda buf: None
+    recv = master.recv_match
+    origin = []   # (recorded time, wall time) of the first message
+
+    def recv_match(condition=None, type=None, blocking=False, timeout=None):
+        msg = recv(condition=condition, type=type, blocking=False)
+        if msg is None:
+            # end of the recording; behave like a quiet link
+            if blocking:
+                time.sleep(min(timeout or 0.1, 0.1))
+            return None
+
+        stamp = getattr(msg, '_timestamp', None)
+        if stamp is not None:
+            if not origin:
+                origin.append((stamp, time.monotonic()))
+            recorded, wall = origin[0]
+            delay = wall + (stamp - recorded) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return msg
+
+    master.recv_match = recv_match
+
+
+def recorded_passes(filename):
+    '''
+        Frame capture times of each detection pass in a recording, in order.
+        A pass starts at frame 0.
+        returns:
+            list of lists of timestamps
+    '''
+    passes = []
+    for stamp, msg in read_recording(filename):
+        if is_frame(msg):
+            if msg.value == 0 or not passes:
+                passes.append([])
+            passes[-1].append(stamp)
+    return passes
+
+
+def images_dir_for(recording):
+    '''
+        Directory the image archiver uses for the flight recorded in recording:
+        flight_<tag><date>.tlog -> images_<tag><date>, beside it.
+    '''
+    directory, name = os.path.split(os.path.splitext(recording)[0])
+    if name.startswith('flight_'):
+        name = name[len('flight_'):]
+    return os.path.join(directory, f"images_{name}")
+
+
+class ReplayCamera:
+
+    def __init__(self, recording, dispatcher, image_dir=None, logger=None):
+        '''
+            Stands in for the camera during a replay. Each capture returns the
+            next recorded pass once the replay has reached it.
+            recording: .tlog being replayed
+            dispatcher: MessageDispatcher the replay is fed through
+            image_dir: archived frames of the flight, or None for images_dir_for(recording)
+            logger: logger to report on
+        '''
+        self.passes = recorded_passes(recording)
+        self.image_dir = image_dir or images_dir_for(recording)
+        self.logger = logger
+
+        self.images = []
+        self.capture_times = []
+
+        self._cond = threading.Condition()
+        self._captured = 0      # passes returned so far
+        self._replayed = 0      # frame markers the replay has delivered
+        dispatcher.add_listener(self._on_message)
+
+
+    def _on_message(self, msg):
+        if is_frame(msg):
+            with self._cond:
+                self._replayed += 1
+                self._cond.notify_all()
+
+
+    def capture_images(self, count=None, interval=None, timeout=REPLAY_FRAME_TIMEOUT):
+        '''
+            Wait until the replay has delivered the next recorded pass, then
+            make its frames and capture times current. count and interval
+            are those of the real camera and are ignored.
+            returns:
+                number of frames
+        '''
+        number = self._captured
+        self._captured += 1
+        if number >= len(self.passes):
+            if self.logger:
+                self.logger.warning(f"[Replay] Pass {number + 1} is not in the recording.")
+            self.images, self.capture_times = [], []
+            return 0
+
+        needed = sum(len(times) for times in self.passes[:number + 1])
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._replayed >= needed, timeout):
+                if self.logger:
+                    self.logger.warning(f"[Replay] Pass {number + 1} did not come up within {timeout}s.")
+
+        self.capture_times = list(self.passes[number])
+        self.images = self._load(number + 1, len(self.capture_times))
+        return len(self.images)
+
+
+    def _load(self, number, count):
+        '''
+            Frames the archiver kept for pass number, or none if it didn't keep them all.
+        '''
+        directory = os.path.join(self.image_dir, f"pass_{number}")
+        images = [cv2.imread(os.path.join(directory, f"frame_{index:03d}.jpg")) for index in range(count)]
+        if any(image is None for image in images):
+            if self.logger:
+                self.logger.warning(f"[Replay] Frames of pass {number} not found in {directory}.")
+            return []
+        return images
@@ -0,0 +1,211 @@
+'''
+Geometry Module
+
+2026-10-18
+PSU UAS
+
+Local East-North-Up (ENU) projection for geometry on the mission path.
+A projection is built once per anchor point (normally the plan's home
+coordinates) and cached; forward and inverse transforms, distances,
+bearings and fence checks all run on NumPy arrays of points, so large
+batches cost about as much as a single point.
+
+The transform goes through Earth-centered Earth-fixed (ECEF) coordinates
+on the WGS84 ellipsoid, so it is exact rather than a flat-earth
+approximation.
+'''
+
+from functools import lru_cache
+import numpy as np
+
+
+# ============== WGS84 =================
+WGS84_A = 6378137.0                     # semi-major axis, meters
+WGS84_F = 1 / 298.257223563             # flattening
+WGS84_E2 = WGS84_F * (2 - WGS84_F)      # first eccentricity squared
+
+INVERSE_ITERATIONS = 4                  # latitude iterations in inverse (sub-millimeter)
+
+
+def geodetic_to_ecef(lat, lon, alt=0.0):
+    '''
+        Convert geodetic coordinates to ECEF.
+        lat, lon: degrees; alt: meters above the ellipsoid
+        returns:
+            x, y, z arrays in meters
+    '''
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    alt = np.asarray(alt, dtype=float)
+
+    sin_lat = np.sin(lat)
+    cos_lat = np.cos(lat)
+    radius = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat * sin_lat)
+
+    x = (radius + alt) * cos_lat * np.cos(lon)
+    y = (radius + alt) * cos_lat * np.sin(lon)
+    z = (radius * (1 - WGS84_E2) + alt) * sin_lat
+    return x, y, z
+
+
+def ecef_to_geodetic(x, y, z):
+    '''
+        Convert ECEF to geodetic coordinates (iterative, vectorized).
+        returns:
+            lat, lon in degrees and alt in meters
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    z = np.asarray(z, dtype=float)
+
+    lon = np.arctan2(y, x)
+    p = np.hypot(x, y)
+    lat = np.arctan2(z, p * (1 - WGS84_E2))
+
+    for _ in range(INVERSE_ITERATIONS):
+        sin_lat = np.sin(lat)
+        radius = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat * sin_lat)
+        alt = p * np.cos(lat) + z * sin_lat - WGS84_A * WGS84_A / radius
+        lat = np.arctan2(z, p * (1 - WGS84_E2 * radius / (radius + alt)))
+
+    sin_lat = np.sin(lat)
+    radius = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat * sin_lat)
+    alt = p * np.cos(lat) + z * sin_lat - WGS84_A * WGS84_A / radius
+    return np.degrees(lat), np.degrees(lon), alt
+
+
+class LocalProjection:
+
+    def __init__(self, lat, lon, alt=0.0):
+        '''
+            lat, lon, alt: anchor point in degrees and meters; the origin of
+                the local frame
+        '''
+        self.origin = (float(lat), float(lon), float(alt))
+        self._ecef_origin = np.array(geodetic_to_ecef(lat, lon, alt), dtype=float)
+
+        sin_lat, cos_lat = np.sin(np.radians(lat)), np.cos(np.radians(lat))
+        sin_lon, cos_lon = np.sin(np.radians(lon)), np.cos(np.radians(lon))
+
+        # rows are the east, north and up unit vectors in ECEF
+        self._rotation = np.array([
+            [-sin_lon, cos_lon, 0.0],
+            [-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat],
+            [cos_lat * cos_lon, cos_lat * sin_lon, sin_lat],
+        ])
+
+
+    def forward(self, lat, lon, alt=0.0):
+        '''
+            Project geodetic coordinates into the local frame.
+            lat, lon: degrees (scalars or arrays); alt: meters
+            returns:
+                east, north, up arrays in meters
+        '''
+        x, y, z = geodetic_to_ecef(lat, lon, alt)
+        offset = np.stack(np.broadcast_arrays(x, y, z)) - self._ecef_origin.reshape(3, *([1] * np.ndim(x)))
+        east, north, up = np.tensordot(self._rotation, offset, axes=1)
+        return east, north, up
+
+
+    def inverse(self, east, north, up=0.0):
+        '''
+            Convert local coordinates back to geodetic.
+            returns:
+                lat, lon in degrees and alt in meters
+        '''
+        enu = np.stack(np.broadcast_arrays(
+            np.asarray(east, dtype=float), np.asarray(north, dtype=float), np.asarray(up, dtype=float),
+        ))
+        ecef = np.tensordot(self._rotation.T, enu, axes=1) + self._ecef_origin.reshape(3, *([1] * (enu.ndim - 1)))
+        return ecef_to_geodetic(*ecef)
+
+
+    def distance(self, lat1, lon1, lat2, lon2):
+        '''
+            Horizontal distance in meters between pairs of points
+            (arrays broadcast against each other).
+        '''
+        east1, north1, _ = self.forward(lat1, lon1)
+        east2, north2, _ = self.forward(lat2, lon2)
+        return np.hypot(east2 - east1, north2 - north1)
+
+
+    def bearing(self, lat1, lon1, lat2, lon2):
+        '''
+            Bearing in degrees clockwise from north from point 1 to point 2.
+        '''
+        east1, north1, _ = self.forward(lat1, lon1)
+        east2, north2, _ = self.forward(lat2, lon2)
+        return np.degrees(np.arctan2(east2 - east1, north2 - north1)) % 360
+
+
+    def offset(self, lat, lon, distance, bearing):
+        '''
+            Points distance meters away from lat/lon along bearing (degrees).
+            returns:
+                lat, lon arrays in degrees
+        '''
+        east, north, up = self.forward(lat, lon)
+        angle = np.radians(bearing)
+        lat, lon, _ = self.inverse(east + distance * np.sin(angle), north + distance * np.cos(angle), up)
+        return lat, lon
+
+
+    def contains(self, fence_lat, fence_lon, lat, lon):
+        '''
+            Which points lie inside a fence polygon.
+            fence_lat, fence_lon: polygon vertices in degrees
+            lat, lon: points to test
+            returns:
+                boolean array, one per point
+        '''
+        fence_east, fence_north, _ = self.forward(fence_lat, fence_lon)
+        east, north, _ = self.forward(lat, lon)
+        return points_in_polygon(east, north, fence_east, fence_north)
+
+
+def get_projection(lat, lon, alt=0.0):
+    '''
+        Cached LocalProjection anchored at lat, lon, alt.
+    '''
+    # one cache key per anchor, however it is passed (positional, default alt, ints, NumPy scalars)
+    return _cached_projection(float(lat), float(lon), float(alt))
+
+
+@lru_cache(maxsize=16)
+def _cached_projection(lat, lon, alt):
+    return LocalProjection(lat, lon, alt)
+
+
+def points_in_polygon(x, y, polygon_x, polygon_y):
+    '''
+        Even-odd test of points against a polygon in a planar frame.
+        Points are tested against every edge at once.
+        returns:
+            boolean array, one per point
+    '''
+    x = np.atleast_1d(np.asarray(x, dtype=float))[:, None]
+    y = np.atleast_1d(np.asarray(y, dtype=float))[:, None]
+    x1 = np.asarray(polygon_x, dtype=float)[None, :]
+    y1 = np.asarray(polygon_y, dtype=float)[None, :]
+    x2 = np.roll(x1, -1, axis=1)
+    y2 = np.roll(y1, -1, axis=1)
+
+    straddles = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    crosses = straddles & (x < crossing)
+    return np.count_nonzero(crosses, axis=1) % 2 == 1
+
+
+def coordinate_arrays(coordinates):
+    '''
+        Gather Coordinate objects into arrays for batch transforms.
+        returns:
+            lat, lon, alt arrays
+    '''
+    lat = np.fromiter((c.lat for c in coordinates), dtype=float)
+    lon = np.fromiter((c.lon for c in coordinates), dtype=float)
+    alt = np.fromiter((c.alt for c in coordinates), dtype=float)
+    return lat, lon, alt
@@ -0,0 +1,358 @@
+'''
+Image Archiver
+
+2026-10-18
+PSU UAS
+
+Archives the frames of each detection pass off the flight-critical path.
+Frames are handed over after detection has used them; low-priority worker
+threads encode them at the configured JPEG quality, write thumbnails and a
+contact sheet per pass into the flight's image directory.
+
+The queue of passes is bounded, and submitting never blocks: if archival
+falls behind, the pass is skipped and counted rather than slowing down
+detection. Workers also pause while the archiver is paused (around
+detection) or the CPU is busy, except while stop() drains the queue.
+Busy is the CPU share used by everything but the worker itself since its
+last check (from /proc/stat), so a detection burst holds archival back
+within a fraction of a second; the 1-minute load average is only a
+fallback where /proc/stat is missing.
+
+stop() is bounded: once the drain deadline passes, a pass being archived
+is abandoned at its next frame, and stop() waits at most STOP_GRACE more
+for the workers before leaving them behind.
+'''
+
+from datetime import datetime
+import numpy as np
+import threading
+import queue
+import math
+import time
+import cv2
+import os
+
+
+# ============== Parameters =================
+JPEG_QUALITY = 85
+THUMBNAIL_WIDTH = 320
+CONTACT_SHEET_COLUMNS = 5
+QUEUE_DEPTH = 4             # passes waiting to be archived
+WORKERS = 1
+BUSY_LOAD = 0.8             # share of all CPUs in use above which workers wait
+BUSY_WAIT = 0.5             # seconds between checks while paused or busy
+CPU_SAMPLE = 0.1            # seconds to measure over when the last check is missing or stale
+CPU_SAMPLE_AGE = 1.0        # seconds after which the last check is stale
+DRAIN_TIMEOUT = 30.0        # seconds stop() waits for queued passes
+STOP_GRACE = 5.0            # seconds stop() then waits for the pass being archived
+WORKER_NICENESS = 19
+LOG_DIR = "./flight_logs"
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')  # /proc/stat units per second
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+
+def read_cpu_ticks():
+    '''
+        CPU time since boot summed over all CPUs, from /proc/stat.
+        returns:
+            (busy, total) in clock ticks, or None where /proc/stat isn't available
+    '''
+    try:
+        with open('/proc/stat', 'r') as file:
+            fields = [int(value) for value in file.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    if len(fields) < 4:
+        return None
+    total = sum(fields[:8])     # user .. steal; guest time is already counted in user
+    idle = sum(fields[3:5])     # idle, iowait
+    return total - idle, total
+
+
+class ImageArchiver:
+
+    def __init__(self, out_dir=None, logger=None, quality=JPEG_QUALITY, thumbnail_width=THUMBNAIL_WIDTH,
+                 workers=WORKERS, queue_depth=QUEUE_DEPTH, name=None):
+        '''
+            out_dir: directory to archive into, or None for a timestamped
+                directory in ./flight_logs
+            logger: logger to report on
+            quality: JPEG quality of the full-size frames (0-100)
+            thumbnail_width: width in pixels of thumbnails and contact sheet tiles
+            workers: number of archival threads
+            queue_depth: passes that may wait before new ones are skipped
+            name: vehicle name added to the default directory
+        '''
+        if out_dir is None:
+            tag = f"{name}_" if name else ""
+            out_dir = os.path.join(LOG_DIR, f"images_{tag}{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+
+        self.out_dir = out_dir
+        self.logger = logger
+        self.quality = quality
+        self.thumbnail_width = thumbnail_width
+        self.worker_count = workers
+
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._resume = threading.Event()
+        self._resume.set()
+        self._abandon = threading.Event()   # set when stop() gives up on the pass in progress
+        self._workers = []
+        self._running = False
+        self._draining = False
+        self._lock = threading.Lock()       # guards the counters, which every thread updates
+        self._cpu_samples = threading.local()
+
+        self.passes = 0
+        self.archived = 0
+        self.skipped = 0
+
+
+    def start(self):
+        '''
+            Start the archival workers.
+        '''
+        if self._running:
+            return
+        self._running = True
+        self._abandon.clear()
+        for index in range(self.worker_count):
+            worker = threading.Thread(target=self._work, name=f'image-archiver-{index}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+
+    def stop(self, drain=True, timeout=DRAIN_TIMEOUT):
+        '''
+            Stop the workers.
+            drain: archive the passes still queued first, without waiting
+                for the CPU to go idle
+            timeout: seconds to drain for; passes still queued after that
+                are skipped
+        '''
+        if not self._running:
+            return
+        self._draining = True
+        self.resume()
+        if drain:
+            self._wait_for_tasks(time.monotonic() + timeout)
+
+        # past the deadline: skip what is queued and abandon the pass in progress
+        self._abandon.set()
+        self._discard()
+        finished = self._wait_for_tasks(time.monotonic() + STOP_GRACE)
+
+        self._running = False
+        deadline = time.monotonic() + (STOP_GRACE if finished else 0)
+        for worker in self._workers:
+            worker.join(timeout=max(deadline - time.monotonic(), 0))
+        stuck = sum(worker.is_alive() for worker in self._workers)
+        self._workers = []
+        self._draining = False
+
+        if self.logger:
+            if stuck:
+                self.logger.warning(f"[Archive] {stuck} archive workers still busy after stop; leaving them behind.")
+            self.logger.info(f"[Archive] Archived {self.archived} passes, skipped {self.skipped}.")
+
+
+    def _wait_for_tasks(self, deadline):
+        '''
+            Wait until every queued pass is done, or the deadline passes.
+            returns:
+                True if every pass is done
+        '''
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+
+    def _discard(self):
+        '''
+            Skip the passes still waiting in the queue.
+        '''
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self.skipped += 1
+            self._queue.task_done()
+
+
+    def pause(self):
+        '''
+            Hold the workers between frames, e.g. while detection runs.
+        '''
+        self._resume.clear()
+
+
+    def resume(self):
+        '''
+            Let the workers continue.
+        '''
+        self._resume.set()
+
+
+    def submit(self, images, label=None):
+        '''
+            Queue a pass of frames for archival. Never blocks.
+            images: frames (BGR arrays) or paths to image files
+            label: name of the pass directory, or None for pass_<n>
+            returns:
+                True if queued, False if the queue is full and the pass was skipped
+        '''
+        with self._lock:
+            self.passes += 1
+            number = self.passes
+        label = label or f"pass_{number}"
+
+        try:
+            # keep our own list; the camera may clear or refill its buffer
+            self._queue.put_nowait((label, list(images)))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.skipped += 1
+            if self.logger:
+                self.logger.warning(f"[Archive] Archive queue full, skipping {label}.")
+            return False
+
+
+    def _work(self):
+        self._lower_priority()
+        while self._running:
+            try:
+                label, images = self._queue.get(timeout=BUSY_WAIT)
+            except queue.Empty:
+                continue
+            try:
+                complete = self._archive(label, images)
+                with self._lock:
+                    if complete:
+                        self.archived += 1
+                    else:
+                        self.skipped += 1
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"[Archive] Failed to archive {label}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+    @staticmethod
+    def _lower_priority():
+        '''
+            Drop this thread to the lowest CPU priority where supported
+            (per-thread on Linux).
+        '''
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WORKER_NICENESS)
+        except (AttributeError, OSError):
+            pass
+
+
+    def _wait_for_idle(self):
+        '''
+            Block while paused or while the CPU is busy, unless draining.
+        '''
+        while self._running and not self._draining:
+            if self._resume.is_set() and not self._cpu_busy():
+                return
+            self._resume.wait(BUSY_WAIT)
+            if self._resume.is_set():
+                time.sleep(BUSY_WAIT)
+
+
+    def _cpu_busy(self):
+        '''
+            Whether everything but this worker kept the CPUs busy since the
+            worker last checked (or over CPU_SAMPLE, when that check is
+            missing or stale).
+        '''
+        ticks = read_cpu_ticks()
+        if ticks is None:
+            try:
+                return os.getloadavg()[0] / (os.cpu_count() or 1) > BUSY_LOAD
+            except (AttributeError, OSError):
+                return False
+
+        now = time.monotonic()
+        last = getattr(self._cpu_samples, 'last', None)
+        if last is None or now - last[0] > CPU_SAMPLE_AGE:
+            last = (now, ticks, time.thread_time())
+            time.sleep(CPU_SAMPLE)
+            now, ticks = time.monotonic(), read_cpu_ticks() or ticks
+        own = time.thread_time()
+        self._cpu_samples.last = (now, ticks, own)
+
+        total = ticks[1] - last[1][1]
+        if total <= 0:
+            return False
+        # the worker's own encoding doesn't count against it
+        busy = ticks[0] - last[1][0] - (own - last[2]) * CLOCK_TICKS
+        return busy / total > BUSY_LOAD
+
+
+    def _archive(self, label, images):
+        directory = os.path.join(self.out_dir, label)
+        os.makedirs(directory, exist_ok=True)
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)]
+        thumbnails = []
+
+        for index, image in enumerate(images):
+            self._wait_for_idle()
+            if self._abandon.is_set():
+                return False
+
+            if isinstance(image, str):
+                image = cv2.imread(image)
+                if image is None:
+                    continue
+
+            ok, encoded = cv2.imencode('.jpg', image, params)
+            if ok:
+                encoded.tofile(os.path.join(directory, f"frame_{index:03d}.jpg"))
+
+            height, width = image.shape[:2]
+            size = (self.thumbnail_width, max(1, round(height * self.thumbnail_width / width)))
+            thumbnail = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode('.jpg', thumbnail, params)
+            if ok:
+                encoded.tofile(os.path.join(directory, f"thumb_{index:03d}.jpg"))
+            thumbnails.append(thumbnail)
+
+        if thumbnails:
+            self._wait_for_idle()
+            ok, encoded = cv2.imencode('.jpg', contact_sheet(thumbnails), params)
+            if ok:
+                encoded.tofile(os.path.join(directory, "contact_sheet.jpg"))
+        return True
+
+
+def contact_sheet(thumbnails, columns=CONTACT_SHEET_COLUMNS):
+    '''
+        Tile thumbnails into one image, left to right, top to bottom.
+        Tiles are padded to the largest thumbnail; grayscale tiles are
+        converted to BGR.
+    '''
+    tiles = [cv2.cvtColor(t, cv2.COLOR_GRAY2BGR) if t.ndim == 2 else t[:, :, :3] for t in thumbnails]
+    tile_height = max(t.shape[0] for t in tiles)
+    tile_width = max(t.shape[1] for t in tiles)
+    columns = min(columns, len(tiles))
+    rows = math.ceil(len(tiles) / columns)
+
+    sheet = np.zeros((rows * tile_height, columns * tile_width, 3), dtype=tiles[0].dtype)
+    for index, tile in enumerate(tiles):
+        row, column = divmod(index, columns)
+        y, x = row * tile_height, column * tile_width
+        sheet[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+    return sheet
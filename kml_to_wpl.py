@@ -1,33 +1,334 @@
-kml = input('Paste KML coordinate list: ')
-fname = input('Enter filename (without extension): ')
-alt = input('Enter altitude (default 30): ') or 30
-takeoff = input('Takeoff? (y/n): ') or 'n'
+'''
+KML to QGC WPL Converter
 
-out = "QGC WPL 110\n"
+2026-10-18
+PSU UAS
 
+Converts .kml/.kmz files exported from Google Earth into QGC WPL files the
+missions are loaded from. Each Placemark LineString becomes a waypoint
+mission and each Polygon becomes a list of 5001 fence vertices. The output
+file is named after the Placemark, so a KML with placemarks named takeoff,
+detect, airdrop, land and geofence regenerates a whole plan directory.
 
-coords = kml.split(' ')
+A Placemark named takeoff (see TAKEOFF_NAMES) gets a home item and a
+takeoff command at its first point, like the takeoff.txt files.
 
-length = len(coords) if takeoff.lower() == 'n' else len(coords) + 1
+--simplify drops nearly collinear points from hand-traced paths and fences
+(see path_simplify); fences only ever grow.
 
-i=0 
-seq = 0
-while i < len(coords):
-    coord = coords[i].split(',')
-    lon = f"{float(coord[0]):.6f}"
-    lat = f"{float(coord[1]):.6f}"
-    
-    if i == 0 and takeoff.lower() == 'y':
-        out += f"{seq}\t0\t3\t16\t0\t0\t0\t0\t{lat}\t{lon}\t0\t1\n"
-        seq += 1
-        out += f"{seq}\t0\t3\t22\t0\t0\t0\t0\t{lat}\t{lon}\t10\t1\n"
+Usage:
+    python kml_to_wpl.py comp.kml -o ./comp-left->west
+    python kml_to_wpl.py ./kml_exports -o ./plans --altitude 25
+    python kml_to_wpl.py comp.kml -o ./comp-left->west --simplify 2
+'''
+
+from mission_upload import format_mission_items
+from path_simplify import simplify_path, simplify_fence
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+import argparse
+import warnings
+import zipfile
+import os
+import re
+
+
+# ============== Parameters =================
+DEFAULT_ALTITUDE = 30
+TAKEOFF_ALTITUDE = 10
+FENCE_ALTITUDE = 0
+TAKEOFF_NAMES = ('takeoff',)
+
+# MAVLink commands
+MAV_CMD_NAV_WAYPOINT = 16
+MAV_CMD_NAV_TAKEOFF = 22
+MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION = 5001
+MAV_FRAME_GLOBAL = 0
+MAV_FRAME_GLOBAL_RELATIVE_ALT = 3
+
+# item kinds
+MISSION = 'mission'
+FENCE = 'fence'
+
+
+def _local(tag):
+    '''
+        Strip the XML namespace from a tag.
+    '''
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_coordinates(text):
+    '''
+        Parse a KML coordinate list ("lon,lat[,alt] lon,lat[,alt] ...").
+        returns:
+            (n, 3) array of lon, lat, alt; alt is 0 where the KML omits it
+    '''
+    tuples = text.split()
+    if not tuples:
+        return np.empty((0, 3))
+
+    dims = tuples[0].count(',') + 1
+    values = np.array(','.join(tuples).split(','), dtype=float).reshape(-1, dims)
+
+    coords = np.zeros((len(values), 3))
+    coords[:, :dims] = values[:, :3]
+    return coords
+
+
+def iter_placemarks(source):
+    '''
+        Stream the geometries out of a KML document.
+        source: path or file object of a .kml document
+        yields:
+            (name, kind, coords) with kind MISSION for a LineString and FENCE
+            for a Polygon's outer boundary
+    '''
+    name = None
+    geometries = []
+    in_outer = False
+    line_start = 0
+    count = 0
+
+    for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+        tag = _local(elem.tag)
+
+        if event == 'start':
+            if tag == 'Placemark':
+                name = None
+                geometries = []
+            elif tag == 'outerBoundaryIs':
+                in_outer = True
+            elif tag == 'LineString':
+                line_start = len(geometries)
+            continue
+
+        if tag == 'name' and name is None:
+            name = (elem.text or '').strip()
+
+        elif tag == 'outerBoundaryIs':
+            in_outer = False
+
+        elif tag == 'coordinates':
+            geometries.append((in_outer, elem.text or ''))
+
+        elif tag == 'LineString':
+            # a LineString without <coordinates> has nothing to convert
+            if len(geometries) > line_start:
+                outer, text = geometries.pop()
+                geometries.append((MISSION, text))
+
+        elif tag == 'Polygon':
+            # keep the outer ring; inner rings (holes) have no fence equivalent here
+            rings = [g for g in geometries if g[0] is True]
+            geometries = [g for g in geometries if g[0] not in (True, False)]
+            if rings:
+                geometries.append((FENCE, rings[0][1]))
+
+        elif tag == 'Placemark':
+            count += 1
+            base = name or f"placemark_{count}"
+            shapes = [g for g in geometries if g[0] in (MISSION, FENCE) and g[1].strip()]
+            for index, (kind, text) in enumerate(shapes):
+                label = base if len(shapes) == 1 else f"{base}_{index + 1}"
+                yield label, kind, parse_coordinates(text)
+            name = None
+            geometries = []
+            elem.clear()
+
+
+def iter_kml_sources(path):
+    '''
+        Yield readable KML documents from a .kml or .kmz path.
+    '''
+    if path.lower().endswith('.kmz'):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if member.lower().endswith('.kml'):
+                    with archive.open(member) as source:
+                        yield source
     else:
-        out += f"{seq}\t0\t3\t16\t0\t0\t0\t0\t{lat}\t{lon}\t{alt}\t1\n"
-    
-    i += 1
-    seq += 1
-
-with open(f"{fname}.txt", 'w') as f:
-    f.write(out)
-    
-    
\ No newline at end of file
+        with open(path, 'rb') as source:
+            yield source
+
+
+def mission_items(coords, altitude=DEFAULT_ALTITUDE, takeoff=False, takeoff_altitude=TAKEOFF_ALTITUDE):
+    '''
+        Build waypoint items for a path.
+        coords: (n, 3) array of lon, lat, alt
+        altitude: waypoint altitude, or None to keep the KML altitudes
+        takeoff: prepend a home item and a takeoff command at the first point
+        returns:
+            (m, 12) array of mission item columns
+    '''
+    n = len(coords)
+    lon, lat = coords[:, 0], coords[:, 1]
+    alt = coords[:, 2] if altitude is None else np.full(n, float(altitude))
+
+    command = np.full(n, MAV_CMD_NAV_WAYPOINT)
+    if takeoff and n:
+        # home at ground level, then climb out over the same point
+        lon = np.concatenate(([lon[0]], lon))
+        lat = np.concatenate(([lat[0]], lat))
+        alt = np.concatenate(([0, takeoff_altitude], alt[1:]))
+        command = np.concatenate(([MAV_CMD_NAV_WAYPOINT, MAV_CMD_NAV_TAKEOFF], command[1:]))
+        n += 1
+
+    items = np.zeros((n, 12))
+    items[:, 0] = np.arange(n)
+    items[:, 2] = MAV_FRAME_GLOBAL_RELATIVE_ALT
+    items[:, 3] = command
+    items[:, 8] = lat
+    items[:, 9] = lon
+    items[:, 10] = alt
+    items[:, 11] = 1
+    return items
+
+
+def fence_items(coords, altitude=FENCE_ALTITUDE):
+    '''
+        Build 5001 inclusion fence vertices for a polygon ring.
+        coords: (n, 3) array of lon, lat, alt; a closing point equal to the
+            first is dropped
+        returns:
+            (m, 12) array of mission item columns
+    '''
+    if len(coords) > 1 and np.array_equal(coords[0, :2], coords[-1, :2]):
+        coords = coords[:-1]
+    n = len(coords)
+
+    # frame 0 and autocontinue 0, as the fence files the autopilot is loaded from (fence-items.txt)
+    items = np.zeros((n, 12))
+    items[:, 0] = np.arange(n)
+    items[:, 2] = MAV_FRAME_GLOBAL
+    items[:, 3] = MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION
+    items[:, 4] = n     # vertex count
+    items[:, 8] = coords[:, 1]
+    items[:, 9] = coords[:, 0]
+    items[:, 10] = altitude
+    return items
+
+
+def _filename(name):
+    '''
+        Turn a Placemark name into a safe file name.
+    '''
+    return re.sub(r'[^\w\-.>]+', '_', name.strip()).strip('_') or 'placemark'
+
+
+def _output_path(out_dir, name, path, taken):
+    '''
+        Output file for a placemark. A name already written in this run is
+        prefixed with its source file name (and numbered if that clashes
+        too) rather than overwriting the earlier file.
+    '''
+    filename = os.path.join(out_dir, f"{_filename(name)}.txt")
+    if filename in taken:
+        stem = _filename(os.path.splitext(os.path.basename(path))[0])
+        base = os.path.join(out_dir, f"{stem}_{_filename(name)}")
+        filename = f"{base}.txt"
+        number = 2
+        while filename in taken:
+            filename = f"{base}_{number}.txt"
+            number += 1
+        warnings.warn(f"Placemark '{name}' in {path} clashes with an earlier output; writing {filename}")
+    taken.add(filename)
+    return filename
+
+
+def convert_file(path, out_dir, altitude=DEFAULT_ALTITUDE, takeoff_altitude=TAKEOFF_ALTITUDE, fence_altitude=FENCE_ALTITUDE, tolerance=None, taken=None):
+    '''
+        Convert every LineString and Polygon in a .kml/.kmz file.
+        path: input file
+        out_dir: directory the .txt files are written to
+        altitude: waypoint altitude, or None to keep the KML altitudes
+        tolerance: simplify paths and fences to this many meters, or None
+        taken: output paths already written in this run, shared between files
+        returns:
+            list of (written file path, number of points simplified away)
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    taken = set() if taken is None else taken
+    written = []
+
+    for source in iter_kml_sources(path):
+        for name, kind, coords in iter_placemarks(source):
+            removed = 0
+            if tolerance and kind == FENCE:
+                vertices = len(fence_items(coords))
+                lat, lon = simplify_fence(coords[:, 1], coords[:, 0], tolerance)
+                removed = vertices - len(lat)
+                coords = np.column_stack((lon, lat, np.zeros(len(lat))))
+            elif tolerance:
+                mask = simplify_path(coords[:, 1], coords[:, 0], tolerance)
+                removed = len(coords) - int(mask.sum())
+                coords = coords[mask]
+
+            if kind == FENCE:
+                items = fence_items(coords, fence_altitude)
+            else:
+                takeoff = name.lower() in TAKEOFF_NAMES
+                items = mission_items(coords, altitude, takeoff, takeoff_altitude)
+
+            filename = _output_path(out_dir, name, path, taken)
+            with open(filename, 'w') as file:
+                file.write(format_mission_items(items))
+            written.append((filename, removed))
+
+    return written
+
+
+def convert_plan(paths, out_dir, **kwargs):
+    '''
+        Convert several .kml/.kmz files, or directories of them, into one
+        plan directory.
+        returns:
+            list of (written file path, number of points simplified away)
+    '''
+    written = []
+    taken = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(path, f) for f in os.listdir(path)
+                if f.lower().endswith(('.kml', '.kmz'))
+            )
+        else:
+            files = [path]
+
+        for filename in files:
+            written.extend(convert_file(filename, out_dir, taken=taken, **kwargs))
+    return written
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Convert KML/KMZ placemarks to QGC WPL missions and fences.")
+    parser.add_argument("inputs", nargs='+', help="KML/KMZ files, or directories of them.")
+    parser.add_argument("-o", "--output", default=".", help="Directory to write the .txt files to. Default is the current directory.")
+    parser.add_argument("--altitude", type=float, default=DEFAULT_ALTITUDE, help=f"Waypoint altitude. Default is {DEFAULT_ALTITUDE}.")
+    parser.add_argument("--kml-altitude", action='store_true', help="Use the altitudes in the KML instead of --altitude.")
+    parser.add_argument("--takeoff-altitude", type=float, default=TAKEOFF_ALTITUDE, help=f"Altitude of the takeoff command. Default is {TAKEOFF_ALTITUDE}.")
+    parser.add_argument("--simplify", type=float, default=None, metavar="METERS", help="Remove nearly collinear points, keeping every removed point within METERS of the result.")
+    parser.add_argument("--fence-altitude", type=float, default=FENCE_ALTITUDE, help=f"Altitude column of fence items. Default is {FENCE_ALTITUDE}.")
+
+    args = parser.parse_args()
+
+    written = convert_plan(
+        args.inputs,
+        args.output,
+        altitude=None if args.kml_altitude else args.altitude,
+        takeoff_altitude=args.takeoff_altitude,
+        fence_altitude=args.fence_altitude,
+        tolerance=args.simplify,
+    )
+
+    for filename, removed in written:
+        if args.simplify:
+            print(f"Wrote {filename} ({removed} points simplified away)")
+        else:
+            print(f"Wrote {filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+'''
+Link Watchdog
+
+2026-10-18
+PSU UAS
+
+Tracks the health of the MAVLink link from the dispatcher's reader thread:
+heartbeat interval, per-message-type rates, dropped sequence numbers and
+command ack round-trip latency, each kept in a fixed-size ring buffer.
+Raises an early-warning event when the link degrades, well before the hard
+timeouts in the state actions expire. Callbacks run on every state change;
+Operation uses one to abort and cancel pending waits when the link is lost.
+
+Until the first heartbeat arrives, its age is counted from start(), so a
+link that never comes up is reported lost like one that goes quiet.
+'''
+
+from collections import deque
+import threading
+import time
+
+
+# ============== Parameters =================
+RING_SIZE = 64              # samples kept per metric
+CHECK_INTERVAL = 0.5        # seconds between background health checks
+
+HEARTBEAT_WARN_AGE = 3.0    # seconds without a heartbeat before warning
+HEARTBEAT_LOST_AGE = 10.0   # seconds without a heartbeat before the link is lost
+DROP_RATIO_WARN = 0.2       # fraction of recent packets lost before warning
+ACK_LATENCY_WARN = 2.0      # seconds of command ack latency before warning
+ACK_EXPIRY = 5.0            # seconds before an unanswered command is given up on
+
+MAV_TYPE_GCS = 6
+
+# ============== Link states ================
+LINK_OK = 0
+LINK_DEGRADED = 1
+LINK_LOST = 2
+
+LINK_STATES = {
+    LINK_OK: "OK",
+    LINK_DEGRADED: "DEGRADED",
+    LINK_LOST: "LOST",
+}
+
+
+class LinkWatchdog:
+
+    def __init__(self, dispatcher, logger=None, ring_size=RING_SIZE, clock=time.monotonic):
+        '''
+            dispatcher: MessageDispatcher feeding this watchdog
+            logger: logger to report on
+            ring_size: samples kept per metric
+            clock: monotonic time source, in seconds
+        '''
+        self.dispatcher = dispatcher
+        self.logger = logger
+        self.ring_size = ring_size
+        self.clock = clock
+
+        self._lock = threading.Lock()
+
+        self._started = clock()     # heartbeat ages count from here until the first one arrives
+        self._last_heartbeat = None
+        self._heartbeat_intervals = deque(maxlen=ring_size)
+        self._arrivals = {}         # type -> deque of arrival times
+        self._last_seq = {}         # (system, component) -> last sequence number
+        self._seq_window = deque(maxlen=ring_size * 4)  # 1 per received packet, 0 per dropped one
+        self.received = 0
+        self.dropped = 0
+        self.unacked = 0
+
+        self._pending_commands = {} # command id -> send time
+        self._ack_latencies = deque(maxlen=ring_size)
+
+        self.state = LINK_OK
+        self.reasons = []
+        self.warning = threading.Event()    # set while the link is degraded or lost
+        self._callbacks = []
+
+        self._command_long_send = None
+        self._thread = None
+        self._running = False
+
+
+    def start(self):
+        '''
+            Start watching the link.
+        '''
+        if self._running:
+            return
+        self._running = True
+        with self._lock:
+            self._started = self.clock()
+        self.dispatcher.add_listener(self.on_message)
+
+        # time command acks by wrapping the outgoing COMMAND_LONG sender
+        mav = self.dispatcher.master.mav
+        self._command_long_send = mav.command_long_send
+
+        def command_long_send(target_system, target_component, command, *args, **kwargs):
+            self.command_sent(command)
+            return self._command_long_send(target_system, target_component, command, *args, **kwargs)
+
+        mav.command_long_send = command_long_send
+
+        self._thread = threading.Thread(target=self._check_loop, name='link-watchdog', daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        '''
+            Stop watching the link.
+        '''
+        self._running = False
+        self.dispatcher.remove_listener(self.on_message)
+        if self._command_long_send:
+            self.dispatcher.master.mav.command_long_send = self._command_long_send
+            self._command_long_send = None
+        if self._thread:
+            self._thread.join(timeout=CHECK_INTERVAL + 1)
+            self._thread = None
+
+
+    def add_callback(self, callback):
+        '''
+            Call callback(state, reasons) whenever the link state changes.
+        '''
+        self._callbacks.append(callback)
+
+
+    def command_sent(self, command):
+        '''
+            Record that a command was sent, to time its COMMAND_ACK.
+        '''
+        with self._lock:
+            self._pending_commands[command] = self.clock()
+
+
+    def on_message(self, msg, now=None):
+        '''
+            Update metrics for one received message. Runs on the reader thread.
+        '''
+        if now is None:
+            now = self.clock()
+        msg_type = msg.get_type()
+
+        with self._lock:
+            arrivals = self._arrivals.get(msg_type)
+            if arrivals is None:
+                arrivals = self._arrivals[msg_type] = deque(maxlen=self.ring_size)
+            arrivals.append(now)
+
+            # sequence numbers are per sender and wrap at 256
+            source = (msg.get_srcSystem(), msg.get_srcComponent())
+            seq = msg.get_seq()
+            last = self._last_seq.get(source)
+            if last is not None:
+                gap = (seq - last - 1) % 256
+                if gap:
+                    self.dropped += gap
+                    self._seq_window.extend([0] * min(gap, self._seq_window.maxlen))
+            self._last_seq[source] = seq
+            self.received += 1
+            self._seq_window.append(1)
+
+            if msg_type == 'HEARTBEAT' and msg.type != MAV_TYPE_GCS:
+                if self._last_heartbeat is not None:
+                    self._heartbeat_intervals.append(now - self._last_heartbeat)
+                self._last_heartbeat = now
+
+            elif msg_type == 'COMMAND_ACK':
+                sent = self._pending_commands.pop(msg.command, None)
+                if sent is not None:
+                    self._ack_latencies.append(now - sent)
+
+        # heartbeats and acks are what clear a warning, so re-check on them
+        if msg_type in ('HEARTBEAT', 'COMMAND_ACK'):
+            self.check(now)
+
+
+    def _check_loop(self):
+        while self._running:
+            self.check()
+            time.sleep(CHECK_INTERVAL)
+
+
+    def check(self, now=None):
+        '''
+            Re-evaluate link health and fire callbacks on a state change.
+            returns:
+                LINK_OK, LINK_DEGRADED or LINK_LOST
+        '''
+        if now is None:
+            now = self.clock()
+
+        reasons = []
+        state = LINK_OK
+
+        with self._lock:
+            if self._last_heartbeat is not None:
+                age = now - self._last_heartbeat
+                reason = f"no heartbeat for {age:.1f}s"
+            else:
+                age = now - self._started
+                reason = f"no heartbeat since start ({age:.1f}s)"
+            if age >= HEARTBEAT_LOST_AGE:
+                state = LINK_LOST
+                reasons.append(reason)
+            elif age >= HEARTBEAT_WARN_AGE:
+                state = LINK_DEGRADED
+                reasons.append(reason)
+
+            drop_ratio = self._drop_ratio()
+            if drop_ratio >= DROP_RATIO_WARN:
+                state = max(state, LINK_DEGRADED)
+                reasons.append(f"{drop_ratio:.0%} of recent packets dropped")
+
+            for command, sent in list(self._pending_commands.items()):
+                if now - sent >= ACK_EXPIRY:
+                    del self._pending_commands[command]
+                    self.unacked += 1
+
+            # the latest ack, plus any unanswered command at its age so far
+            latencies = [now - t for t in self._pending_commands.values()]
+            if self._ack_latencies:
+                latencies.append(self._ack_latencies[-1])
+            if latencies and max(latencies) >= ACK_LATENCY_WARN:
+                state = max(state, LINK_DEGRADED)
+                reasons.append(f"command ack latency {max(latencies):.1f}s")
+
+            changed = state != self.state
+            self.state = state
+            self.reasons = reasons
+
+            # under the lock, so the event always agrees with state
+            if state == LINK_OK:
+                self.warning.clear()
+            else:
+                self.warning.set()
+
+        if changed:
+            if self.logger:
+                if state == LINK_OK:
+                    self.logger.info("[Watchdog] Link recovered.")
+                else:
+                    self.logger.warning(f"[Watchdog] Link {LINK_STATES[state]}: {', '.join(reasons)}")
+            for callback in self._callbacks:
+                try:
+                    callback(state, reasons)
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f"[Watchdog] Callback raised: {e}")
+
+        return state
+
+
+    def _drop_ratio(self):
+        if not self._seq_window:
+            return 0.0
+        return 1 - sum(self._seq_window) / len(self._seq_window)
+
+
+    def snapshot(self, now=None):
+        '''
+            Current link metrics.
+            returns:
+                dict of metric name to value; times in seconds, rates in Hz
+        '''
+        if now is None:
+            now = self.clock()
+        with self._lock:
+            intervals = list(self._heartbeat_intervals)
+            latencies = list(self._ack_latencies)
+
+            rates = {}
+            for msg_type, arrivals in self._arrivals.items():
+                span = arrivals[-1] - arrivals[0]
+                rates[msg_type] = (len(arrivals) - 1) / span if span > 0 else 0.0
+
+            return {
+                'state': LINK_STATES[self.state],
+                'reasons': list(self.reasons),
+                'heartbeat_age': now - self._last_heartbeat if self._last_heartbeat is not None else None,
+                'heartbeat_interval_mean': sum(intervals) / len(intervals) if intervals else None,
+                'heartbeat_interval_max': max(intervals) if intervals else None,
+                'message_rates': rates,
+                'received': self.received,
+                'dropped': self.dropped,
+                'drop_ratio': self._drop_ratio(),
+                'ack_latency_mean': sum(latencies) / len(latencies) if latencies else None,
+                'ack_latency_max': max(latencies) if latencies else None,
+                'pending_commands': len(self._pending_commands),
+                'unacked_commands': self.unacked,
+            }
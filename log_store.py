@@ -0,0 +1,520 @@
+'''
+Flight Log Store
+
+2026-10-18
+PSU UAS
+
+Columnar store of the text flight logs (./flight_logs/log_*.txt) for
+questions across many flights, e.g. the median time from TAKEOFF to DETECT,
+how often "Max detection attempts reached" fires, or which plan has the
+slowest landings.
+
+Ingestion is incremental: each run parses only the log files that are new
+or have changed since the last run, and saves them as one compressed NumPy
+chunk (.npz) with three tables:
+    flights     one row per log file: vehicle, plan, start and end time, aborted,
+                complete (the log reaches "Operation ended")
+    states      one row per mission state entered: state, start time, duration
+    events      one row per log line: time, level, current state, module, message
+
+Strings (modules and messages) are stored once per chunk and referenced by
+integer codes, so queries run as NumPy operations over whole columns.
+
+A log that stops before "Operation ended" (a crash, power loss, or a flight
+still running) has no end for its last state; that state's duration is NaN
+and is left out of duration queries.
+
+Usage:
+    python log_store.py                 # ingest new logs, then print the report
+    python log_store.py --no-ingest
+'''
+
+from logging_config import MODULE_TAG
+import numpy as np
+import argparse
+import logging
+import json
+import re
+import os
+
+
+# ============== Parameters =================
+LOG_DIR = "./flight_logs"
+STORE_DIR = os.path.join(LOG_DIR, "analytics")
+MANIFEST = "manifest.json"
+STORE_VERSION = 2           # bump when the chunk layout changes; older stores are re-ingested
+
+# names logged by uas_state_machine.translate_mission_state, in state order
+STATES = ("PREFLIGHT", "TAKEOFF WAIT", "TAKEOFF", "DETECT", "AIRDROP", "LANDING", "MISSION COMPLETE", "Unknown State")
+NO_STATE = -1
+
+LEVELS = {name: logging.getLevelName(name) for name in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')}
+
+LINE = re.compile(r'^(\d{4}-\d\d-\d\d) (\d\d:\d\d:\d\d),(\d{3}) - ([A-Z]+)\t- (.*)$', re.MULTILINE)
+LOG_NAME = re.compile(r'^log_(?:(.+)_)?\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d\.txt$')
+STATE_MESSAGE = re.compile(r'^\[States\] Current mission state: (.*)$')
+PLAN_MESSAGE = re.compile(r'^\[Actions\] Mission plan loaded: (.*)$')
+ENDED_MESSAGE = "[States] Operation ended."
+ABORTED_MESSAGE = "[States] Operation aborted."
+
+# added by logging_config.CoalescingFilter to a record standing in for repeats
+REPEATED_SUFFIX = re.compile(r' \(repeated \d+ more times in [\d.]+s\)$')
+
+
+def parse_log(text):
+    '''
+        Parse the text of one log file into columns. Lines that don't start
+        with a log record header (e.g. traceback lines) are skipped.
+        Older logs wrote coalesced repeats after the records that follow
+        them, with the time of the last repeat; records are put back in
+        time order and the repeat count is stripped from their messages.
+        returns:
+            dict of times (seconds since the epoch), levels, modules and
+            messages arrays, one entry per record
+    '''
+    records = LINE.findall(text)
+    if not records:
+        return None
+    dates, clocks, millis, levels, messages = zip(*records)
+    messages = [REPEATED_SUFFIX.sub('', message) for message in messages]
+
+    stamps = np.char.add(np.char.add(np.array(dates), 'T'), np.array(clocks)).astype('datetime64[s]')
+    times = stamps.astype(np.int64) + np.array(millis, dtype=np.int64) / 1000
+    order = np.argsort(times, kind='stable')
+
+    modules = []
+    for message in messages:
+        match = MODULE_TAG.match(message)
+        modules.append(match.group(1) if match else '')
+
+    return {
+        'times': times[order],
+        'levels': np.array([LEVELS.get(level, 0) for level in levels], dtype=np.int8)[order],
+        'modules': np.array(modules)[order],
+        'messages': np.array(messages)[order],
+    }
+
+
+def build_flight(flight, filename, records):
+    '''
+        Derive the flight, state and event rows of one parsed log.
+        returns:
+            dict of table columns for this flight
+    '''
+    times = records['times']
+    messages = records['messages']
+
+    # state entries, and the state each record was logged in
+    entries = []
+    codes = []
+    plan = ''
+    end = times[-1]
+    aborted = False
+    complete = False
+    for index, message in enumerate(messages):
+        match = STATE_MESSAGE.match(message)
+        if match:
+            name = match.group(1)
+            entries.append(index)
+            codes.append(STATES.index(name) if name in STATES else len(STATES) - 1)
+            continue
+        match = PLAN_MESSAGE.match(message)
+        if match:
+            # plans are named by their directory, e.g. ./backyard/plan.txt -> backyard
+            plan = os.path.basename(os.path.dirname(match.group(1).strip())) or match.group(1).strip()
+        elif message == ENDED_MESSAGE:
+            end = times[index]
+            complete = True
+        elif message == ABORTED_MESSAGE:
+            aborted = True
+
+    entries = np.array(entries, dtype=np.int64)
+    codes = np.array(codes, dtype=np.int8)
+    starts = times[entries]
+    durations = np.diff(np.append(starts, max(end, starts[-1]) if len(starts) else end))
+    if not complete and len(durations):
+        # the log stops mid-state; when that state would have ended is unknown
+        durations[-1] = np.nan
+
+    event_state = np.full(len(times), NO_STATE, dtype=np.int8)
+    if len(entries):
+        # index of the latest state entry at or before each record
+        latest = np.searchsorted(entries, np.arange(len(times)), side='right') - 1
+        event_state = np.where(latest >= 0, codes[np.maximum(latest, 0)], NO_STATE).astype(np.int8)
+
+    name = LOG_NAME.match(filename)
+    return {
+        'flight_id': np.array([flight], dtype=np.int32),
+        'flight_file': np.array([filename]),
+        'flight_vehicle': np.array([(name.group(1) or '') if name else '']),
+        'flight_plan': np.array([plan]),
+        'flight_start': np.array([times[0]]),
+        'flight_end': np.array([end]),
+        'flight_aborted': np.array([aborted]),
+        'flight_complete': np.array([complete]),
+
+        'state_flight': np.full(len(entries), flight, dtype=np.int32),
+        'state_code': codes,
+        'state_start': starts,
+        'state_duration': durations,
+
+        'event_flight': np.full(len(times), flight, dtype=np.int32),
+        'event_time': times,
+        'event_level': records['levels'],
+        'event_state': event_state,
+        'event_module': records['modules'],
+        'event_message': records['messages'],
+    }
+
+
+def _concatenate(parts):
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def _encode(columns, key):
+    '''
+        Replace a string column with integer codes and a vocabulary.
+    '''
+    vocabulary, codes = np.unique(columns.pop(key), return_inverse=True)
+    columns[key] = codes.astype(np.int32)
+    columns[key + '_vocab'] = vocabulary
+
+
+class LogStore:
+
+    def __init__(self, directory=STORE_DIR, log_dir=LOG_DIR):
+        '''
+            directory: where chunks and the manifest are kept
+            log_dir: where the text logs are
+        '''
+        self.directory = directory
+        self.log_dir = log_dir
+        self._tables = None
+
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, MANIFEST)
+
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path(), 'r') as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            manifest = {}
+        if manifest.get('version') != STORE_VERSION:
+            # no store yet, or one written by an older version: every log is ingested again
+            manifest = {
+                'version': STORE_VERSION,
+                'next_flight': manifest.get('next_flight', 0),
+                'next_chunk': manifest.get('next_chunk', 0),
+                'files': {},
+            }
+        return manifest
+
+
+    def _write_manifest(self, manifest):
+        temporary = self._manifest_path() + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(manifest, file, indent=1)
+        os.replace(temporary, self._manifest_path())
+
+
+    def ingest(self):
+        '''
+            Ingest the log files that are new or have changed since the last
+            ingest into one new chunk. A changed file (e.g. the log of a
+            flight that was still running) replaces its earlier rows.
+            returns:
+                number of files ingested
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self._read_manifest()
+        known = manifest['files']
+
+        try:
+            names = sorted(name for name in os.listdir(self.log_dir) if LOG_NAME.match(name))
+        except FileNotFoundError:
+            names = []
+
+        parts = []
+        ingested = {}
+        for name in names:
+            stat = os.stat(os.path.join(self.log_dir, name))
+            entry = known.get(name)
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                continue
+
+            with open(os.path.join(self.log_dir, name), 'r', errors='replace') as file:
+                records = parse_log(file.read())
+            flight = manifest['next_flight']
+            manifest['next_flight'] += 1
+            ingested[name] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'flight': flight}
+            if records is not None:
+                parts.append(build_flight(flight, name, records))
+
+        if not ingested:
+            return 0
+
+        chunk = manifest['next_chunk']
+        manifest['next_chunk'] += 1
+        if parts:
+            columns = _concatenate(parts)
+            for key in ('flight_file', 'flight_vehicle', 'flight_plan', 'event_module', 'event_message'):
+                _encode(columns, key)
+            path = os.path.join(self.directory, f"chunk_{chunk:05d}.npz")
+            np.savez_compressed(path + '.tmp.npz', **columns)
+            os.replace(path + '.tmp.npz', path)
+
+        for entry in ingested.values():
+            entry['chunk'] = chunk if parts else None
+        known.update(ingested)
+        self._write_manifest(manifest)
+
+        # chunks whose every flight has been replaced are no longer needed
+        live = {entry['chunk'] for entry in known.values()}
+        for name in os.listdir(self.directory):
+            match = re.match(r'^chunk_(\d+)\.npz$', name)
+            if match and int(match.group(1)) not in live:
+                os.remove(os.path.join(self.directory, name))
+
+        self._tables = None
+        return len(ingested)
+
+
+    def load(self):
+        '''
+            Load every chunk into one set of columns, with string codes
+            merged across chunks. Cached until the next ingest.
+            returns:
+                dict of column name -> array
+        '''
+        if self._tables is not None:
+            return self._tables
+
+        manifest = self._read_manifest()
+        live_flights = np.array(sorted(entry['flight'] for entry in manifest['files'].values()), dtype=np.int32)
+        live_chunks = {entry['chunk'] for entry in manifest['files'].values()}
+
+        chunks = []
+        for name in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []:
+            match = re.match(r'^chunk_(\d+)\.npz$', name)
+            if match and int(match.group(1)) in live_chunks:
+                with np.load(os.path.join(self.directory, name)) as data:
+                    chunks.append({key: data[key] for key in data.files})
+
+        tables = {}
+        if chunks:
+            # merge the per-chunk vocabularies and recode
+            for key in ('flight_file', 'flight_vehicle', 'flight_plan', 'event_module', 'event_message'):
+                vocabulary = np.unique(np.concatenate([chunk[key + '_vocab'] for chunk in chunks]))
+                for chunk in chunks:
+                    chunk[key] = np.searchsorted(vocabulary, chunk.pop(key + '_vocab'))[chunk[key]].astype(np.int32)
+                tables[key + '_vocab'] = vocabulary
+            tables.update(_concatenate(chunks))
+
+            # drop rows of flights that were re-ingested since
+            for table in ('flight', 'state', 'event'):
+                keep = np.isin(tables[f'{table}_id' if table == 'flight' else f'{table}_flight'], live_flights)
+                for key in list(tables):
+                    if key.startswith(table + '_') and not key.endswith('_vocab'):
+                        tables[key] = tables[key][keep]
+
+            # flights sorted by id; rows of the other tables refer to them by position
+            order = np.argsort(tables['flight_id'])
+            for key in list(tables):
+                if key.startswith('flight_') and not key.endswith('_vocab'):
+                    tables[key] = tables[key][order]
+            tables['state_index'] = np.searchsorted(tables['flight_id'], tables['state_flight'])
+            tables['event_index'] = np.searchsorted(tables['flight_id'], tables['event_flight'])
+
+        self._tables = tables
+        return tables
+
+
+    # ============== Queries =================
+
+    def flight_count(self):
+        tables = self.load()
+        return len(tables['flight_id']) if tables else 0
+
+
+    def flights(self):
+        '''
+            returns:
+                list of (file, vehicle, plan, duration, aborted, complete), one per flight
+        '''
+        tables = self.load()
+        if not tables:
+            return []
+        return list(zip(
+            tables['flight_file_vocab'][tables['flight_file']].tolist(),
+            tables['flight_vehicle_vocab'][tables['flight_vehicle']].tolist(),
+            tables['flight_plan_vocab'][tables['flight_plan']].tolist(),
+            (tables['flight_end'] - tables['flight_start']).tolist(),
+            tables['flight_aborted'].tolist(),
+            tables['flight_complete'].tolist(),
+        ))
+
+
+    def transition_times(self, from_state, to_state):
+        '''
+            Seconds from first entering from_state to first entering
+            to_state afterwards, for every flight that did both.
+            from_state, to_state: names from STATES, e.g. 'TAKEOFF', 'DETECT'
+            returns:
+                array of seconds
+        '''
+        tables = self.load()
+        if not tables:
+            return np.array([])
+        count = len(tables['flight_id'])
+        codes, starts, index = tables['state_code'], tables['state_start'], tables['state_index']
+
+        first = np.full(count, np.inf)
+        mask = codes == STATES.index(from_state)
+        np.minimum.at(first, index[mask], starts[mask])
+
+        reached = np.full(count, np.inf)
+        mask = (codes == STATES.index(to_state)) & (starts >= first[index])
+        np.minimum.at(reached, index[mask], starts[mask])
+
+        done = np.isfinite(first) & np.isfinite(reached)
+        return reached[done] - first[done]
+
+
+    def state_durations(self, state):
+        '''
+            Total seconds each flight spent in a state. A state the log
+            stops in has no known duration and is left out.
+            returns:
+                (flight positions, seconds) for flights that entered it
+        '''
+        tables = self.load()
+        if not tables:
+            return np.array([], dtype=np.int64), np.array([])
+        totals = np.zeros(len(tables['flight_id']))
+        entered = np.zeros(len(tables['flight_id']), dtype=bool)
+        mask = (tables['state_code'] == STATES.index(state)) & np.isfinite(tables['state_duration'])
+        np.add.at(totals, tables['state_index'][mask], tables['state_duration'][mask])
+        entered[tables['state_index'][mask]] = True
+        positions = np.flatnonzero(entered)
+        return positions, totals[positions]
+
+
+    def state_duration_by_plan(self, state, statistic=np.median):
+        '''
+            A statistic of the per-flight time in a state, grouped by plan.
+            returns:
+                dict of plan -> (statistic in seconds, number of flights),
+                slowest first
+        '''
+        positions, seconds = self.state_durations(state)
+        if not len(positions):
+            return {}
+        tables = self.load()
+        plans = tables['flight_plan'][positions]
+
+        result = {}
+        for plan in np.unique(plans):
+            values = seconds[plans == plan]
+            result[str(tables['flight_plan_vocab'][plan])] = (float(statistic(values)), len(values))
+        return dict(sorted(result.items(), key=lambda item: item[1][0], reverse=True))
+
+
+    def slowest(self, state, count=5):
+        '''
+            The flights that spent longest in a state.
+            returns:
+                list of (file, plan, seconds), slowest first
+        '''
+        positions, seconds = self.state_durations(state)
+        tables = self.load()
+        order = np.argsort(seconds)[::-1][:count]
+        return [
+            (
+                str(tables['flight_file_vocab'][tables['flight_file'][positions[i]]]),
+                str(tables['flight_plan_vocab'][tables['flight_plan'][positions[i]]]),
+                float(seconds[i]),
+            )
+            for i in order
+        ]
+
+
+    def _event_mask(self, text, level=None, state=None):
+        tables = self.load()
+        matching = np.flatnonzero(np.char.find(tables['event_message_vocab'], text) >= 0)
+        mask = np.isin(tables['event_message'], matching)
+        if level is not None:
+            mask &= tables['event_level'] == LEVELS.get(level, level)
+        if state is not None:
+            mask &= tables['event_state'] == STATES.index(state)
+        return mask
+
+
+    def event_count(self, text, level=None, state=None):
+        '''
+            Number of log records containing text, across all flights.
+            level: only records of this level (name or number)
+            state: only records logged in this mission state
+        '''
+        if not self.load():
+            return 0
+        return int(np.count_nonzero(self._event_mask(text, level, state)))
+
+
+    def event_flights(self, text, level=None, state=None):
+        '''
+            Number of flights with at least one record containing text.
+        '''
+        tables = self.load()
+        if not tables:
+            return 0
+        return len(np.unique(tables['event_index'][self._event_mask(text, level, state)]))
+
+
+def report(store):
+    '''
+        Print the standard cross-flight report.
+    '''
+    count = store.flight_count()
+    print(f"Flights: {count}")
+    if not count:
+        return
+    flights = store.flights()
+    print(f"Aborted: {sum(flight[4] for flight in flights)}")
+    incomplete = count - sum(flight[5] for flight in flights)
+    if incomplete:
+        print(f"Incomplete (no 'Operation ended'): {incomplete}")
+
+    times = store.transition_times('TAKEOFF', 'DETECT')
+    if len(times):
+        print(f"TAKEOFF -> DETECT: median {np.median(times):.1f}s over {len(times)} flights")
+
+    text = "Max detection attempts reached"
+    print(f"'{text}': {store.event_count(text)} times in {store.event_flights(text)} flights")
+
+    landings = store.state_duration_by_plan('LANDING')
+    if landings:
+        print("Median landing time by plan:")
+        for plan, (seconds, flights) in landings.items():
+            print(f"    {plan or '(unknown)'}: {seconds:.1f}s over {flights} flights")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Ingest flight logs into a columnar store and report across flights.")
+    parser.add_argument("--logs", default=LOG_DIR, help=f"Directory of log_*.txt files. Default is {LOG_DIR}.")
+    parser.add_argument("--store", default=None, help="Directory of the store. Default is 'analytics' inside the log directory.")
+    parser.add_argument("--no-ingest", action='store_true', help="Report on what is already ingested.")
+
+    args = parser.parse_args()
+
+    store = LogStore(args.store or os.path.join(args.logs, "analytics"), args.logs)
+    if not args.no_ingest:
+        print(f"Ingested {store.ingest()} new or changed log files.")
+    report(store)
+
+
+if __name__ == "__main__":
+    main()
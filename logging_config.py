@@ -1,17 +1,186 @@
 import logging
 import colorlog
 from datetime import datetime
+import threading
+import time
 import os
+import re
 
-def configure_logging():
+# Identical messages within this many seconds are coalesced into one record
+COALESCE_WINDOW = 5.0
+
+# Per-module rate limits in records per second, keyed by the [Module] tag
+# at the start of a message (or the logger name), e.g. {'Flight': 5}.
+# Only records below WARNING are ever rate limited.
+RATE_LIMITS = {}
+
+# Records from these modules, and any record at WARNING or above, are never
+# coalesced or rate limited: they must appear in the log in order, e.g. the
+# state transitions the log store reads back.
+UNCOALESCED_MODULES = ('States',)
+
+MODULE_TAG = re.compile(r'^\[(\w+)\]')
+
+
+class CoalescingFilter(logging.Filter):
+    """
+    Coalesces identical messages logged within a time window into one
+    record with a repeat count, and applies per-module rate limits.
+    Nothing is dropped silently: every suppressed message is counted and
+    reported in a follow-up record. Warnings and above, and records from
+    UNCOALESCED_MODULES, always pass straight through.
+
+    Attach one filter to each handler, passing the handler as target:
+    handler filters also see records propagated from child loggers, which
+    logger filters don't. Follow-up records are stamped with the time they
+    are written, so the log stays in time order.
+    """
+
+    def __init__(self, target, window=COALESCE_WINDOW, rate_limits=None):
+        super().__init__()
+        self.target = target    # the handler (or logger) follow-up records are written to
+        self.window = window
+        self.rate_limits = dict(RATE_LIMITS if rate_limits is None else rate_limits)
+
+        self._lock = threading.RLock()
+        self._recent = {}   # (logger, level, message) -> [window start, repeats, last repeated record, first record time]
+        self._buckets = {}  # module -> [tokens, last refill, suppressed, last suppressed record]
+
+        # totals, for reporting
+        self.suppressed = 0
+        self.suppressed_by_module = {}
+
+    def filter(self, record):
+        # summaries emitted by this filter pass straight through
+        if getattr(record, 'coalesced', False):
+            return True
+
+        now = time.monotonic()
+        if record.levelno >= logging.WARNING or self._module(record) in UNCOALESCED_MODULES:
+            with self._lock:
+                summaries = self._expire(now)
+            for summary in summaries:
+                self._emit(summary, record.created)
+            return True
+
+        with self._lock:
+            key = (record.name, record.levelno, record.getMessage())
+            entry = self._recent.get(key)
+            summaries = self._expire(now, skip=key)
+
+            if entry and now - entry[0] < self.window:
+                # a repeat inside the window: hold it back and count it
+                entry[1] += 1
+                entry[2] = record
+                self._count(record)
+                allowed = False
+
+            else:
+                allowed = self._take_token(record, now, summaries)
+                if allowed:
+                    if entry and entry[1]:
+                        # the window just closed on this message; report its repeats first
+                        summaries.append(self._repeat_summary(entry))
+                    self._recent[key] = [now, 0, None, record.created]
+
+        for summary in summaries:
+            self._emit(summary, record.created)
+        return allowed
+
+    def flush(self):
+        # report everything still held back, e.g. at the end of a flight
+        with self._lock:
+            summaries = self._expire(float('inf'))
+            for module, bucket in self._buckets.items():
+                if bucket[2]:
+                    summaries.append(self._rate_summary(module, bucket))
+        now = time.time()
+        for summary in summaries:
+            self._emit(summary, now)
+
+    def _module(self, record):
+        match = MODULE_TAG.match(str(record.msg))
+        return match.group(1) if match else record.name
+
+    def _count(self, record):
+        module = self._module(record)
+        self.suppressed += 1
+        self.suppressed_by_module[module] = self.suppressed_by_module.get(module, 0) + 1
+
+    def _expire(self, now, skip=None):
+        # close the windows that have run out; repeats are reported as summaries
+        summaries = []
+        for key, entry in list(self._recent.items()):
+            if key == skip or now - entry[0] < self.window:
+                continue
+            del self._recent[key]
+            if entry[1]:
+                summaries.append(self._repeat_summary(entry))
+        return summaries
+
+    def _repeat_summary(self, entry):
+        # the span actually covered, from the first record to the last repeat
+        _, repeats, last, first = entry
+        return self._copy(last, f"{last.getMessage()} (repeated {repeats} more times in {last.created - first:.1f}s)")
+
+    def _take_token(self, record, now, summaries):
+        # token bucket per module; warnings and above always pass
+        module = self._module(record)
+        limit = self.rate_limits.get(module)
+        if not limit or record.levelno >= logging.WARNING:
+            return True
+
+        bucket = self._buckets.get(module)
+        if bucket is None:
+            bucket = self._buckets[module] = [float(limit), now, 0, None]
+        bucket[0] = min(float(limit), bucket[0] + (now - bucket[1]) * limit)
+        bucket[1] = now
+
+        if bucket[0] < 1:
+            bucket[2] += 1
+            bucket[3] = record
+            self._count(record)
+            return False
+
+        bucket[0] -= 1
+        if bucket[2]:
+            summaries.append(self._rate_summary(module, bucket))
+        return True
+
+    def _rate_summary(self, module, bucket):
+        summary = self._copy(bucket[3], f"[{module}] {bucket[2]} messages suppressed by rate limit ({self.rate_limits[module]}/s)")
+        bucket[2] = 0
+        bucket[3] = None
+        return summary
+
+    @staticmethod
+    def _copy(record, message):
+        summary = logging.makeLogRecord(record.__dict__)
+        summary.msg = message
+        summary.args = None
+        summary.coalesced = True
+        return summary
+
+    def _emit(self, record, created):
+        # written now, so stamped now rather than with the held-back record's time
+        record.created = created
+        record.msecs = int((created - int(created)) * 1000) + 0.0
+        record.relativeCreated = (created - logging._startTime) * 1000
+        self.target.handle(record)
+
+
+def configure_logging(name=None, coalesce_window=COALESCE_WINDOW, rate_limits=None):
     # Ensure the flight_logs directory exists
     os.makedirs("./flight_logs", exist_ok=True)
 
-    # Create a log file with a timestamp
-    log_filename = f"./flight_logs/log_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.txt"
+    # Create a log file with a timestamp, tagged with the vehicle name if given
+    tag = f"{name}_" if name else ""
+    log_filename = f"./flight_logs/log_{tag}{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.txt"
 
-    # Get the logger
-    logger = logging.getLogger()
+    # Get the logger; named loggers (one per vehicle) keep their records out of the root logger
+    logger = logging.getLogger(name)
+    if name:
+        logger.propagate = False
 
     # Check if the logger already has handlers to avoid duplicates
     if not logger.handlers:
@@ -22,7 +191,7 @@ def configure_logging():
         # Configure the console handler with colors
         console_handler = colorlog.StreamHandler()
         console_handler.setFormatter(colorlog.ColoredFormatter(
-            '%(log_color)s%(asctime)s - %(levelname)s - %(message)s',
+            '%(log_color)s%(asctime)s - ' + (f'{name} - ' if name else '') + '%(levelname)s - %(message)s',
             log_colors={
                 'DEBUG': 'cyan',
                 'INFO': 'green',
@@ -32,9 +201,22 @@ def configure_logging():
             }
         ))
 
+        # Coalesce repeated messages from wait loops and retries; on the handlers,
+        # so records from child loggers (e.g. a vehicle's 'name.module' loggers) are covered too
+        for handler in (file_handler, console_handler):
+            handler.addFilter(CoalescingFilter(handler, coalesce_window, rate_limits))
+
         # Add handlers to the logger
         logger.setLevel(logging.INFO)
         logger.addHandler(file_handler)
         logger.addHandler(console_handler)
 
-    return logger
\ No newline at end of file
+    return logger
+
+
+def flush_logging(logger):
+    # Report any coalesced or rate-limited messages still held back
+    for handler in logger.handlers:
+        for log_filter in handler.filters:
+            if isinstance(log_filter, CoalescingFilter):
+                log_filter.flush()
@@ -0,0 +1,483 @@
+'''
+MAVLink Message Dispatcher
+
+2026-10-18
+PSU UAS
+
+Owns the only reader of the MAVLink link. Incoming messages are demultiplexed
+by type into subscriber queues, a latest-value cache and a short per-type
+backlog, so several waits can run at once and no message is thrown away just
+because nobody was asking for it at the time.
+
+Once attached, the connection's recv_match is served from the backlog, so the
+existing MAVez waits keep working unchanged on top of the dispatcher. Each
+message is handed to at most one recv_match call, as on the raw link. A call
+sees the messages that arrived since its thread last sent something, so a
+reply that comes back before the caller gets to recv_match is still
+delivered, while a stale ack from an earlier exchange can't satisfy a new
+wait. A thread that has never sent sees messages from the start of its call.
+When replaying a recording, sends go nowhere and replies arrive on the
+recording's schedule, so in replay mode recv_match returns every unconsumed
+message in recorded order, as a buffered link would, whatever the timing.
+
+cancel_waits ends every pending wait at once, including recv_match calls
+blocked inside MAVez, so an abort doesn't sit out a 100 s wait timeout.
+'''
+
+from concurrent.futures import Future
+from collections import deque
+from pymavlink import mavutil
+import threading
+import queue
+import time
+
+
+# ============== Parameters =================
+BACKLOG_LENGTH = 64         # messages kept per type for recv_match callers
+SUBSCRIBER_QUEUE_SIZE = 256 # default depth of a subscriber queue
+READ_TIMEOUT = 0.1          # seconds the reader blocks on the link per read
+
+# MAVLink constants used by the wait helpers
+MAV_LANDED_STATE_ON_GROUND = 1
+
+# ============== Error codes ================
+TIMEOUT_ERROR = 701
+DISPATCHER_STOPPED = 702
+WAIT_CANCELLED = 703
+
+ERRORS = {
+    0: "No error",
+    TIMEOUT_ERROR: "Timed out waiting for message",
+    DISPATCHER_STOPPED: "Dispatcher stopped before message arrived",
+    WAIT_CANCELLED: "Wait was cancelled",
+}
+
+ANY_TYPE = '*'
+
+
+class MessageDispatcher:
+
+    def __init__(self, master, logger=None, backlog=BACKLOG_LENGTH, replay=False):
+        '''
+            master: mavutil connection (e.g. flight.controller.master)
+            logger: logger to report on
+            backlog: messages kept per type for recv_match callers
+            replay: master is a recording; recv_match ignores when things were sent
+        '''
+        self.master = master
+        self.logger = logger
+        self.backlog_length = backlog
+        self.replay = replay
+
+        self._recv = master.recv_match  # the real link reader
+        self._cond = threading.Condition()
+        self._write = None      # the real link writer, while attached
+        self._order = 0         # arrival number of the next message
+        self._cursors = {}      # thread id -> arrival number at its latest exchange's first send
+        self._replied = set()   # thread ids that have called recv_match since their last send
+        self._generation = 0    # bumped by cancel_waits
+
+        self.latest = {}        # type -> most recent message
+        self._backlog = {}      # type -> deque of (order, message)
+        self._subscribers = {}  # type -> list of queues
+        self._listeners = []    # callables run on the reader thread
+        self._waiters = []      # [types, predicate, future, deadline]
+
+        self._thread = None
+        self._running = False
+        self._attached = False
+
+
+    def start(self, attach=True):
+        '''
+            Start the reader thread.
+            attach: serve the connection's recv_match from the dispatcher
+        '''
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._read_loop, name='mavlink-dispatcher', daemon=True)
+        self._thread.start()
+
+        if attach:
+            self.master.recv_match = self.recv_match
+            self._write = self.master.write
+            self.master.write = self._mark_send
+            self._attached = True
+
+        if self.logger:
+            self.logger.info("[Dispatcher] Reader thread started.")
+
+
+    def stop(self):
+        '''
+            Stop the reader thread and give the link back to pymavlink.
+            Pending waits resolve to None.
+        '''
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=2 * READ_TIMEOUT + 1)
+            self._thread = None
+
+        if self._attached:
+            self.master.recv_match = self._recv
+            self.master.write = self._write
+            self._attached = False
+
+        with self._cond:
+            waiters, self._waiters = self._waiters, []
+            self._cond.notify_all()
+        for _, _, future, _ in waiters:
+            if not future.done():
+                future.set_result(None)
+
+        if self.logger:
+            self.logger.info("[Dispatcher] Reader thread stopped.")
+
+
+    def _read_loop(self):
+        '''
+            Pull messages off the link and fan them out until stopped.
+        '''
+        while self._running:
+            try:
+                msg = self._recv(blocking=True, timeout=READ_TIMEOUT)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"[Dispatcher] Link read failed: {e}")
+                time.sleep(READ_TIMEOUT)
+                continue
+
+            if msg is not None and msg.get_type() != 'BAD_DATA':
+                self.dispatch(msg)
+
+            self._expire_waiters()
+
+
+    def dispatch(self, msg):
+        '''
+            Deliver a message to the cache, backlog, subscribers and waiters.
+            Called by the reader thread; public so recorded messages can be
+            fed in the same way.
+        '''
+        msg_type = msg.get_type()
+        resolved = []
+
+        with self._cond:
+            self.latest[msg_type] = msg
+
+            backlog = self._backlog.get(msg_type)
+            if backlog is None:
+                backlog = self._backlog[msg_type] = deque(maxlen=self.backlog_length)
+            backlog.append((self._order, msg))
+            self._order += 1
+
+            subscribers = self._subscribers.get(msg_type, []) + self._subscribers.get(ANY_TYPE, [])
+            listeners = list(self._listeners)
+
+            remaining = []
+            for waiter in self._waiters:
+                types, predicate, future, _ = waiter
+                if (types is None or msg_type in types) and self._matches(predicate, msg):
+                    resolved.append((future, msg))
+                else:
+                    remaining.append(waiter)
+            self._waiters = remaining
+
+            self._cond.notify_all()
+
+        for sub in subscribers:
+            self._offer(sub, msg)
+
+        for listener in listeners:
+            try:
+                listener(msg)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"[Dispatcher] Listener raised: {e}")
+
+        for future, result in resolved:
+            if not future.done():
+                future.set_result(result)
+
+
+    def _matches(self, predicate, msg):
+        if predicate is None:
+            return True
+        try:
+            return bool(predicate(msg))
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"[Dispatcher] Wait predicate raised: {e}")
+            return False
+
+
+    @staticmethod
+    def _offer(sub, msg):
+        '''
+            Put a message on a subscriber queue, dropping the oldest if full.
+        '''
+        while True:
+            try:
+                sub.put_nowait(msg)
+                return
+            except queue.Full:
+                try:
+                    sub.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+    def _expire_waiters(self):
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            remaining = []
+            for waiter in self._waiters:
+                if waiter[3] is not None and now >= waiter[3]:
+                    expired.append(waiter[2])
+                else:
+                    remaining.append(waiter)
+            self._waiters = remaining
+        for future in expired:
+            if not future.done():
+                future.set_result(None)
+
+
+    def subscribe(self, msg_type=ANY_TYPE, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        '''
+            Subscribe to a message type.
+            msg_type: MAVLink message name, or '*' for every message
+            maxsize: queue depth; the oldest message is dropped when full
+            returns:
+                queue.Queue receiving every matching message
+        '''
+        sub = queue.Queue(maxsize=maxsize)
+        with self._cond:
+            self._subscribers.setdefault(msg_type, []).append(sub)
+        return sub
+
+
+    def unsubscribe(self, sub):
+        '''
+            Remove a queue returned by subscribe.
+        '''
+        with self._cond:
+            for subs in self._subscribers.values():
+                if sub in subs:
+                    subs.remove(sub)
+
+
+    def add_listener(self, callback):
+        '''
+            Call callback(msg) for every message, on the reader thread.
+            Listeners must be quick; use subscribe for anything slow.
+        '''
+        with self._cond:
+            self._listeners.append(callback)
+
+
+    def remove_listener(self, callback):
+        '''
+            Remove a callback registered with add_listener.
+        '''
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+
+    def get_latest(self, msg_type):
+        '''
+            Most recent message of a type, or None if none has arrived.
+        '''
+        return self.latest.get(msg_type)
+
+
+    def wait_for(self, msg_type, predicate=None, timeout=None):
+        '''
+            Wait for a message without blocking.
+            msg_type: message name, list of names, or None for any
+            predicate: callable(msg) -> bool, or None to accept any message
+            timeout: seconds, or None to wait until stopped
+            returns:
+                Future resolving to the message, or None on timeout;
+                cancelled by cancel_waits
+        '''
+        future = Future()
+        if not self._running:
+            future.set_result(None)
+            return future
+
+        if isinstance(msg_type, str):
+            types = {msg_type}
+        elif msg_type is None:
+            types = None
+        else:
+            types = set(msg_type)
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            self._waiters.append([types, predicate, future, deadline])
+        return future
+
+
+    def _to_response(self, future):
+        '''
+            Map a wait_for future onto the 0 / error code convention.
+        '''
+        response = Future()
+
+        def done(f):
+            if f.cancelled():
+                response.set_result(WAIT_CANCELLED)
+            elif f.result() is not None:
+                response.set_result(0)
+            elif self._running:
+                response.set_result(TIMEOUT_ERROR)
+            else:
+                response.set_result(DISPATCHER_STOPPED)
+
+        future.add_done_callback(done)
+        return response
+
+
+    def wait_for_waypoint_reached(self, seq, timeout=None):
+        '''
+            Wait for MISSION_ITEM_REACHED with the given autopilot sequence number.
+            returns:
+                Future resolving to 0 on success, or an error code
+        '''
+        return self._to_response(self.wait_for('MISSION_ITEM_REACHED', lambda msg: msg.seq == seq, timeout))
+
+
+    def wait_for_landed(self, timeout=None):
+        '''
+            Wait for EXTENDED_SYS_STATE to report the vehicle on the ground.
+            returns:
+                Future resolving to 0 on success, or an error code
+        '''
+        return self._to_response(self.wait_for(
+            'EXTENDED_SYS_STATE',
+            lambda msg: msg.landed_state == MAV_LANDED_STATE_ON_GROUND,
+            timeout,
+        ))
+
+
+    def wait_for_channel_input(self, channel, value, value_tolerance=100, timeout=None):
+        '''
+            Wait for an RC channel to read within tolerance of a PWM value.
+            returns:
+                Future resolving to 0 on success, or an error code
+        '''
+        field = f'chan{channel}_raw'
+        return self._to_response(self.wait_for(
+            'RC_CHANNELS',
+            lambda msg: abs(getattr(msg, field) - value) <= value_tolerance,
+            timeout,
+        ))
+
+
+    def _mark_send(self, buf):
+        '''
+            Write to the link, noting where the sending thread's exchange
+            starts: the first send after a recv_match opens a new exchange,
+            whose replies may arrive before the next recv_match call.
+        '''
+        thread = threading.get_ident()
+        with self._cond:
+            if thread in self._replied or thread not in self._cursors:
+                self._cursors[thread] = self._order
+                self._replied.discard(thread)
+        return self._write(buf)
+
+
+    def recv_match(self, condition=None, type=None, blocking=False, timeout=None):
+        '''
+            Drop-in replacement for mavutil's recv_match, served from the backlog.
+            Returns messages that arrived since the calling thread's latest
+            send (or since the call, if it has never sent; in replay mode,
+            any not yet returned), oldest first; each message is returned once. Messages of a requested type that fail
+            the condition are consumed, as they would be on the raw link;
+            other types are left for their own readers.
+        '''
+        if isinstance(type, str):
+            types = [type]
+        else:
+            types = type
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        thread = threading.get_ident()
+
+        with self._cond:
+            since = 0 if self.replay else self._cursors.get(thread, self._order)
+            self._replied.add(thread)
+            generation = self._generation
+            while True:
+                msg = self._take(types, condition, since)
+                if msg is not None or not blocking:
+                    return msg
+
+                if deadline is None:
+                    self._cond.wait(READ_TIMEOUT)
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+
+                if self._generation != generation:
+                    return None
+                if not self._running:
+                    return self._take(types, condition, since)
+
+
+    def cancel_waits(self):
+        '''
+            End every pending wait now, e.g. when the link is lost: wait_for
+            futures are cancelled and blocked recv_match calls return None.
+            Waits started afterwards behave normally.
+        '''
+        with self._cond:
+            self._generation += 1
+            waiters, self._waiters = self._waiters, []
+            self._cond.notify_all()
+        for _, _, future, _ in waiters:
+            future.cancel()
+
+
+    def _take(self, types, condition, since):
+        '''
+            Pop the oldest backlog message matching types and condition that
+            arrived at or after since. Caller must hold the lock.
+        '''
+        backlogs = self._backlog.values() if types is None else [self._backlog[t] for t in types if t in self._backlog]
+
+        while True:
+            oldest = None
+            for backlog in backlogs:
+                for position, (order, _) in enumerate(backlog):
+                    if order >= since:
+                        if oldest is None or order < oldest[0]:
+                            oldest = (order, backlog, position)
+                        break
+            if oldest is None:
+                return None
+
+            _, backlog, position = oldest
+            _, msg = backlog[position]
+            del backlog[position]
+            if condition is None:
+                return msg
+
+            # evaluate against the link state as it was when this message arrived
+            messages = dict(self.master.messages)
+            messages[msg.get_type()] = msg
+            if mavutil.evaluate_condition(condition, messages):
+                return msg
+
+
+    def decode_error(self, error_code):
+        '''
+            Decode a dispatcher error code.
+        '''
+        return ERRORS.get(error_code, f"Unknown error code: {error_code}")
@@ -0,0 +1,467 @@
+'''
+Incremental Mission Upload
+
+2026-10-18
+PSU UAS
+
+Uploads missions by diffing against the last mission the autopilot
+acknowledged. Only the changed items are sent, using partial-list writes
+(MISSION_WRITE_PARTIAL_LIST); anything the diff can't cover, or a partial
+write the autopilot rejects, falls back to a full upload. Each item costs a
+round trip over the telemetry radio, so counters record how many were saved.
+
+The diff is only safe while the uploader knows what the autopilot holds.
+watch() follows uploads made by other code on the same link (MAVez's Flight):
+any MISSION_COUNT they send invalidates the confirmed mission, and when every
+item of that upload is seen and accepted, those items become the confirmed
+mission, so the next upload can still be partial.
+
+Mission items are tuples in QGC WPL column order:
+    (seq, current, frame, command, param1, param2, param3, param4, lat, lon, alt, autocontinue)
+'''
+
+from pymavlink import mavutil
+import inspect
+
+
+# ============== Parameters =================
+ITEM_TIMEOUT = 3            # seconds to wait for each request / ack
+MAX_RETRIES = 2             # resends of a handshake message before giving up
+
+MISSION_TYPE = mavutil.mavlink.MAV_MISSION_TYPE_MISSION
+
+WPL_HEADER = "QGC WPL 110\n"
+# seq, current, frame, command, param1-4, lat, lon, alt, autocontinue
+ITEM_FORMAT = "%d\t%d\t%d\t%d\t%g\t%g\t%g\t%g\t%.6f\t%.6f\t%g\t%d"
+# fence items, as fence-items.txt: every float column to 6 decimals
+FENCE_ITEM_FORMAT = "%d\t%d\t%d\t%d\t%.6f\t%.6f\t%.6f\t%.6f\t%.6f\t%.6f\t%.6f\t%d"
+FENCE_COMMANDS = range(5001, 5005)  # MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION .. CIRCLE_EXCLUSION
+
+# ============== Error codes ================
+UPLOAD_TIMEOUT = 801
+UPLOAD_REJECTED = 802
+FILE_NOT_FOUND = 803
+FILE_INVALID = 804
+SET_CURRENT_FAILED = 805
+
+ERRORS = {
+    0: "No error",
+    UPLOAD_TIMEOUT: "Timed out waiting for the autopilot during upload",
+    UPLOAD_REJECTED: "Autopilot rejected the mission",
+    FILE_NOT_FOUND: "Mission file not found",
+    FILE_INVALID: "Mission file is not valid QGC WPL",
+    SET_CURRENT_FAILED: "Autopilot did not accept the new current mission item",
+}
+
+
+def parse_mission_line(line):
+    '''
+        Parse one QGC WPL line into a mission item tuple.
+        Trailing comments after the 12 columns are ignored.
+    '''
+    parts = line.split('#')[0].split()
+    return (
+        int(parts[0]), int(parts[1]), int(parts[2]), int(parts[3]),
+        float(parts[4]), float(parts[5]), float(parts[6]), float(parts[7]),
+        float(parts[8]), float(parts[9]), float(parts[10]), int(parts[11]),
+    )
+
+
+def load_mission_items(filename):
+    '''
+        Load the mission items from a QGC WPL file.
+        returns:
+            list of mission item tuples, or an error code
+    '''
+    try:
+        with open(filename, 'r') as file:
+            lines = file.readlines()
+    except FileNotFoundError:
+        return FILE_NOT_FOUND
+
+    if not lines or not lines[0].startswith('QGC WPL'):
+        return FILE_INVALID
+
+    items = []
+    for line in lines[1:]:
+        if not line.strip():
+            continue
+        try:
+            items.append(parse_mission_line(line))
+        except (ValueError, IndexError):
+            return FILE_INVALID
+    return items
+
+
+def format_mission_items(items):
+    '''
+        Format mission items (tuples, or rows of an item array) as the text
+        of a QGC WPL file.
+    '''
+    rows = '\n'.join(
+        (FENCE_ITEM_FORMAT if int(row[3]) in FENCE_COMMANDS else ITEM_FORMAT) % tuple(row)
+        for row in items
+    )
+    return WPL_HEADER + rows + ('\n' if rows else '')
+
+
+def items_from_mission(mission):
+    '''
+        Mission item tuples of a MAVez Mission, e.g. one built by
+        Flight.build_airdrop_mission. Integer positions are in degE7.
+    '''
+    items = []
+    for item in mission.mission_items:
+        x, y = item.x, item.y
+        if isinstance(x, int) and isinstance(y, int):
+            x, y = x / 1e7, y / 1e7
+        items.append((
+            int(item.seq), int(item.current), int(item.frame), int(item.command),
+            float(item.param1), float(item.param2), float(item.param3), float(item.param4),
+            x, y, float(item.z), int(item.auto_continue),
+        ))
+    return items
+
+
+def changed_ranges(old, new):
+    '''
+        Contiguous index ranges of new that differ from old.
+        Runs separated by a single unchanged item are merged, since resending
+        one item costs the same round trip as opening another partial write.
+        returns:
+            list of (start, end) inclusive ranges, or None if a partial
+            write can't express the change (item count differs)
+    '''
+    if old is None or len(old) != len(new):
+        return None
+
+    ranges = []
+    for index, (before, after) in enumerate(zip(old, new)):
+        if before == after:
+            continue
+        if ranges and index - ranges[-1][1] <= 2:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return [tuple(r) for r in ranges]
+
+
+class MissionUploader:
+
+    def __init__(self, master, logger=None, mission_type=MISSION_TYPE):
+        '''
+            master: mavutil connection (e.g. flight.controller.master)
+            logger: logger to report on
+            mission_type: MAV_MISSION_TYPE of the missions uploaded
+        '''
+        self.master = master
+        self.logger = logger
+        self.mission_type = mission_type
+
+        self.confirmed = None   # items of the last mission the autopilot acknowledged
+
+        # uploads by other senders, followed by watch()
+        self._dispatcher = None
+        self._senders = {}      # mav method name -> original
+        self._sending = False   # our own upload is in progress
+        self._observed = None   # [count, {seq: item}] of another sender's upload
+
+        self.stats = {
+            'uploads': 0,
+            'full_uploads': 0,
+            'partial_uploads': 0,
+            'fallbacks': 0,
+            'items_sent': 0,
+            'round_trips': 0,
+            'round_trips_saved': 0,
+        }
+
+
+    def invalidate(self):
+        '''
+            Forget the confirmed mission, e.g. after another tool wrote to the
+            autopilot. The next upload will be a full one.
+        '''
+        self.confirmed = None
+
+
+    def watch(self, dispatcher):
+        '''
+            Follow mission uploads made by other code on this link.
+            dispatcher: MessageDispatcher reading the same link
+        '''
+        if self._dispatcher:
+            return
+        self._dispatcher = dispatcher
+        mav = self.master.mav
+
+        for name in ('mission_count_send', 'mission_item_int_send', 'mission_item_send'):
+            original = getattr(mav, name)
+            self._senders[name] = original
+
+            def sender(*args, _name=name, _original=original, **kwargs):
+                if not self._sending:
+                    self._observe(_name, args, kwargs)
+                return _original(*args, **kwargs)
+
+            setattr(mav, name, sender)
+
+        dispatcher.add_listener(self._on_message)
+
+
+    def unwatch(self):
+        '''
+            Stop following other senders.
+        '''
+        if not self._dispatcher:
+            return
+        for name, original in self._senders.items():
+            setattr(self.master.mav, name, original)
+        self._senders = {}
+        self._dispatcher.remove_listener(self._on_message)
+        self._dispatcher = None
+
+
+    def _observe(self, name, args, kwargs):
+        '''
+            Record an outgoing mission message from another sender.
+        '''
+        try:
+            call = inspect.signature(self._senders[name]).bind(*args, **kwargs)
+        except TypeError:
+            # sent in a form we can't read; the mission stays unconfirmed
+            self.invalidate()
+            self._observed = None
+            return
+        call.apply_defaults()
+        fields = call.arguments
+        if fields['mission_type'] != self.mission_type:
+            return
+
+        if name == 'mission_count_send':
+            # someone else is rewriting the mission; it no longer matches ours
+            self.invalidate()
+            self._observed = [fields['count'], {}]
+            return
+
+        if self._observed is None:
+            return
+        x, y = fields['x'], fields['y']
+        if name == 'mission_item_int_send':
+            x, y = x / 1e7, y / 1e7
+        self._observed[1][fields['seq']] = (
+            fields['seq'], fields['current'], fields['frame'], fields['command'],
+            fields['param1'], fields['param2'], fields['param3'], fields['param4'],
+            x, y, fields['z'], fields['autocontinue'],
+        )
+
+
+    def _on_message(self, msg):
+        '''
+            Confirm another sender's upload once the autopilot accepts it.
+            Runs on the dispatcher's reader thread.
+        '''
+        if msg.get_type() != 'MISSION_ACK' or self._observed is None or self._sending:
+            return
+        if getattr(msg, 'mission_type', self.mission_type) != self.mission_type:
+            return
+
+        count, items = self._observed
+        self._observed = None
+        if msg.type == mavutil.mavlink.MAV_MISSION_ACCEPTED and len(items) == count and set(items) == set(range(count)):
+            self.confirmed = [items[seq] for seq in range(count)]
+
+
+    def upload_file(self, filename):
+        '''
+            Upload a QGC WPL mission file.
+            returns:
+                0 on success, or an error code
+        '''
+        items = load_mission_items(filename)
+        if isinstance(items, int):
+            if self.logger:
+                self.logger.error(f"[Upload] {self.decode_error(items)}: {filename}")
+            return items
+        return self.upload(items)
+
+
+    def upload(self, items):
+        '''
+            Upload a mission, sending only what changed since the last
+            confirmed upload when possible.
+            items: list of mission item tuples
+            returns:
+                0 on success, or an error code
+        '''
+        items = [tuple(item) for item in items]
+        self._observed = None
+        self._sending = True
+        try:
+            return self._upload(items)
+        finally:
+            self._sending = False
+
+
+    def _upload(self, items):
+        self.stats['uploads'] += 1
+        full_cost = len(items) + 1  # MISSION_COUNT plus one request per item
+
+        ranges = changed_ranges(self.confirmed, items)
+        if ranges is not None:
+            if not ranges:
+                if self.logger:
+                    self.logger.info("[Upload] Mission unchanged, nothing to send.")
+                self.stats['round_trips_saved'] += full_cost
+                return 0
+
+            cost = sum(end - start + 2 for start, end in ranges)
+            if cost < full_cost:
+                response = self._upload_partial(items, ranges)
+                if not response:
+                    self.confirmed = items
+                    self.stats['partial_uploads'] += 1
+                    self.stats['round_trips_saved'] += full_cost - cost
+                    if self.logger:
+                        self.logger.info(f"[Upload] Sent {cost - len(ranges)} of {len(items)} items in {len(ranges)} partial write(s).")
+                    return 0
+
+                if self.logger:
+                    self.logger.warning(f"[Upload] Partial upload failed ({self.decode_error(response)}), falling back to full upload.")
+                self.stats['fallbacks'] += 1
+
+        response = self._upload_full(items)
+        if response:
+            # the autopilot may hold a half-written mission now
+            self.confirmed = None
+            if self.logger:
+                self.logger.error(f"[Upload] Full upload failed: {self.decode_error(response)}")
+            return response
+
+        self.confirmed = items
+        self.stats['full_uploads'] += 1
+        if self.logger:
+            self.logger.info(f"[Upload] Sent full mission of {len(items)} items.")
+        return 0
+
+
+    def _upload_full(self, items):
+        def start():
+            self.master.mav.mission_count_send(
+                self.master.target_system, self.master.target_component,
+                len(items), self.mission_type,
+            )
+        return self._serve_requests(items, start, 0, len(items) - 1)
+
+
+    def _upload_partial(self, items, ranges):
+        for first, last in ranges:
+            def start(first=first, last=last):
+                self.master.mav.mission_write_partial_list_send(
+                    self.master.target_system, self.master.target_component,
+                    first, last, self.mission_type,
+                )
+            response = self._serve_requests(items, start, first, last)
+            if response:
+                return response
+        return 0
+
+
+    def _serve_requests(self, items, start, first, last):
+        '''
+            Open a write with start(), then answer item requests until the
+            autopilot acks. The opening message is resent if nothing comes back.
+        '''
+        start()
+        self.stats['round_trips'] += 1
+        retries = 0
+        expected = set(range(first, last + 1))
+
+        while True:
+            msg = self.master.recv_match(
+                type=['MISSION_REQUEST_INT', 'MISSION_REQUEST', 'MISSION_ACK'],
+                blocking=True, timeout=ITEM_TIMEOUT,
+            )
+
+            if msg is None:
+                if retries >= MAX_RETRIES:
+                    return UPLOAD_TIMEOUT
+                retries += 1
+                start()
+                continue
+
+            if getattr(msg, 'mission_type', self.mission_type) != self.mission_type:
+                continue
+
+            if msg.get_type() == 'MISSION_ACK':
+                if msg.type != mavutil.mavlink.MAV_MISSION_ACCEPTED:
+                    return UPLOAD_REJECTED
+                # a stale ack from an earlier exchange can arrive before any request
+                if expected:
+                    continue
+                return 0
+
+            if msg.seq < first or msg.seq > last:
+                continue
+
+            self._send_item(items[msg.seq], msg.seq)
+            expected.discard(msg.seq)
+            retries = 0
+
+
+    def _send_item(self, item, seq):
+        _, current, frame, command, p1, p2, p3, p4, lat, lon, alt, autocontinue = item
+        self.master.mav.mission_item_int_send(
+            self.master.target_system, self.master.target_component,
+            seq, frame, command, current, autocontinue,
+            p1, p2, p3, p4,
+            int(round(lat * 1e7)), int(round(lon * 1e7)), alt,
+            self.mission_type,
+        )
+        self.stats['items_sent'] += 1
+        self.stats['round_trips'] += 1
+
+
+    def set_current(self, seq, reset=False):
+        '''
+            Make seq the current mission item (MAV_CMD_DO_SET_MISSION_CURRENT)
+            and wait for the autopilot to acknowledge it.
+            reset: also reset the mission, as MAVez does after sending one
+            returns:
+                0 on success, or an error code
+        '''
+        command = mavutil.mavlink.MAV_CMD_DO_SET_MISSION_CURRENT
+        for _ in range(MAX_RETRIES + 1):
+            self.master.mav.command_long_send(
+                self.master.target_system, self.master.target_component,
+                command, 0, seq, 1 if reset else 0, 0, 0, 0, 0, 0,
+            )
+            msg = self.master.recv_match(
+                condition=f'COMMAND_ACK.command=={command}', type='COMMAND_ACK',
+                blocking=True, timeout=ITEM_TIMEOUT,
+            )
+            if msg is None:
+                continue
+            if msg.result != mavutil.mavlink.MAV_RESULT_ACCEPTED:
+                return SET_CURRENT_FAILED
+            return 0
+        return UPLOAD_TIMEOUT
+
+
+    def summary(self):
+        '''
+            One-line report of the upload counters.
+        '''
+        stats = self.stats
+        return (
+            f"{stats['uploads']} uploads ({stats['partial_uploads']} partial, {stats['full_uploads']} full, "
+            f"{stats['fallbacks']} fallbacks), {stats['items_sent']} items sent, "
+            f"{stats['round_trips_saved']} round trips saved"
+        )
+
+
+    def decode_error(self, error_code):
+        '''
+            Decode an upload error code.
+        '''
+        return ERRORS.get(error_code, f"Unknown error code: {error_code}")
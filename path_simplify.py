@@ -0,0 +1,489 @@
+'''
+Path Simplification
+
+2026-10-18
+PSU UAS
+
+Removes nearly collinear points from hand-traced paths and fences using
+Douglas-Peucker in local metric coordinates. Every removed point stays
+within the tolerance (meters) of the simplified path.
+
+Fences are simplified one-sided: an edge that would cut inside the original
+boundary is pushed outward until it clears it, so an inclusion fence only
+ever grows (and an exclusion fence only ever shrinks). Away from sharp
+corners the boundary moves by no more than the tolerance; at a corner the
+pushed edges meet at most MITER_LIMIT tolerances out, past which the corner
+is bevelled instead. The result is then checked against every original
+vertex, and any vertex that would end up on the wrong side of the fence is
+kept.
+
+Simplifying renumbers the items after every removed one, so the plan's
+item indices (detect_index, airdrop_index) are always kept and remapped
+along with their missions: simplify_plan does this for a loaded plan (a plan
+with simplify_tolerance is simplified when it is loaded), and --plan does it
+for a plan directory on disk.
+
+Usage:
+    python path_simplify.py --plan ./tri-park-3/plan.txt --tolerance 2
+    python path_simplify.py ./tri-park-3/detect.txt --tolerance 2 --keep 1
+    python path_simplify.py fence-items.txt --tolerance 3 -o fence-simple.txt
+'''
+
+from mission_upload import load_mission_items, format_mission_items, FILE_NOT_FOUND, FILE_INVALID
+from plan_bundle import validate_plan, PLAN_INDICES, COLUMNS
+from geometry import get_projection, points_in_polygon
+import numpy as np
+import argparse
+
+
+# ============== Parameters =================
+DEFAULT_TOLERANCE = 2.0     # meters
+MITER_LIMIT = 2.0           # corner offset limit, in tolerances
+BOUNDARY_EPSILON = 1e-3     # meters; a vertex this close to the fence counts as on it
+
+MAV_CMD_NAV_WAYPOINT = 16
+FENCE_COMMANDS = {
+    5001: True,     # MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION: expand
+    5002: False,    # MAV_CMD_NAV_FENCE_POLYGON_VERTEX_EXCLUSION: shrink
+}
+
+
+def to_local(lat, lon, origin=None):
+    '''
+        Project lat/lon (degrees) to local east/north meters.
+        origin: (lat, lon) of the projection, or None for the mean point
+        returns:
+            (n, 2) array of east, north, and the origin used
+    '''
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    if origin is None:
+        origin = (float(lat.mean()), float(lon.mean()))
+    east, north, _ = get_projection(*origin).forward(lat, lon)
+    return np.column_stack((east, north)), origin
+
+
+def from_local(points, origin):
+    '''
+        Inverse of to_local.
+        returns:
+            lat, lon arrays in degrees
+    '''
+    lat, lon, _ = get_projection(*origin).inverse(points[:, 0], points[:, 1])
+    return lat, lon
+
+
+def _signed_distances(points, a, b):
+    '''
+        Signed perpendicular distance of points from the line a->b.
+        Positive is to the right of the direction of travel.
+    '''
+    direction = b - a
+    length = np.hypot(direction[0], direction[1])
+    offset = points - a
+    if length == 0:
+        return np.hypot(offset[:, 0], offset[:, 1])
+    return (offset[:, 0] * direction[1] - offset[:, 1] * direction[0]) / length
+
+
+def _douglas_peucker(points, first, last, tolerance, keep, outward=None):
+    '''
+        Mark the points of points[first:last + 1] to keep.
+        outward: None for a symmetric tolerance, or +1 / -1 for the side of
+            the line the simplified edge is allowed to move towards
+    '''
+    stack = [(first, last)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        distances = _signed_distances(points[start + 1:end], points[start], points[end])
+        if outward is None:
+            split = int(np.argmax(np.abs(distances)))
+            deviation = abs(distances[split])
+        else:
+            # the edge is later pushed out past the outermost point, so the
+            # deviation is the spread between the outermost and innermost points
+            signed = distances * outward
+            deviation = max(signed.max(), 0.0) - min(signed.min(), 0.0)
+            split = int(np.argmax(signed))
+
+        if deviation > tolerance:
+            split += start + 1
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+
+def simplify_path(lat, lon, tolerance=DEFAULT_TOLERANCE, keep=None):
+    '''
+        Simplify an open path.
+        lat, lon: arrays of degrees
+        tolerance: maximum distance in meters of a removed point from the result
+        keep: optional boolean array of points that must be kept
+        returns:
+            boolean array of the points kept
+    '''
+    points, _ = to_local(lat, lon)
+    n = len(points)
+    mask = np.zeros(n, dtype=bool) if keep is None else np.array(keep, dtype=bool)
+    if n <= 2:
+        mask[:] = True
+        return mask
+
+    mask[0] = mask[-1] = True
+
+    # forced points split the path into independent runs
+    anchors = np.flatnonzero(mask)
+    for start, end in zip(anchors[:-1], anchors[1:]):
+        _douglas_peucker(points, start, end, tolerance, mask)
+    return mask
+
+
+def _orientation(points):
+    '''
+        +1 if the right of the direction of travel is outside the ring
+        (counter-clockwise), -1 if it is inside (clockwise).
+    '''
+    x, y = points[:, 0], points[:, 1]
+    area = np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)
+    return 1 if area > 0 else -1
+
+
+def _line_intersection(p, d, q, e):
+    '''
+        Intersection of lines p + t*d and q + s*e, or None if parallel.
+    '''
+    cross = d[0] * e[1] - d[1] * e[0]
+    if abs(cross) < 1e-12:
+        return None
+    t = ((q[0] - p[0]) * e[1] - (q[1] - p[1]) * e[0]) / cross
+    return p + t * d
+
+
+def simplify_fence(lat, lon, tolerance=DEFAULT_TOLERANCE, expand=True):
+    '''
+        Simplify a closed polygon so the result only grows (or only shrinks).
+        lat, lon: arrays of degrees; a closing point equal to the first is ignored
+        tolerance: maximum distance in meters of a removed vertex from the result
+        expand: True for inclusion fences, False for exclusion fences
+        returns:
+            lat, lon arrays of the simplified polygon
+    '''
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    if len(lat) > 1 and lat[0] == lat[-1] and lon[0] == lon[-1]:
+        lat, lon = lat[:-1], lon[:-1]
+    if len(lat) <= 3:
+        return lat.copy(), lon.copy()
+
+    points, origin = to_local(lat, lon)
+    n = len(points)
+
+    # signed distances are positive to the right; flip so positive is the
+    # side the fence may move towards
+    outward = _orientation(points) * (1 if expand else -1)
+
+    # walk the ring from vertex 0 back to itself, split at the far vertex
+    ring = np.vstack((points, points[:1]))
+    far = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    mask = np.zeros(n + 1, dtype=bool)
+    mask[[0, far, n]] = True
+    _douglas_peucker(ring, 0, far, tolerance, mask, outward)
+    _douglas_peucker(ring, far, n, tolerance, mask, outward)
+
+    # an edge pushed out at a sharp corner can still cut a neighbouring
+    # vertex off; keep any vertex that would be lost and rebuild. A kept
+    # vertex can only be lost through the pushed edges beside it, so then
+    # its neighbours are kept too. With every vertex kept nothing is pushed
+    # and the original ring comes back, so this always ends.
+    while True:
+        vertices = _offset_polygon(ring, mask, outward, tolerance)
+        lost = np.flatnonzero(_lost_vertices(points, vertices, expand))
+        if not len(lost):
+            break
+        if mask[lost].all():
+            lost = np.concatenate(((lost - 1) % n, (lost + 1) % n))
+        if mask[lost].all():
+            # lost to an edge further away; fall back to the original ring
+            mask[:] = True
+            continue
+        mask[lost] = True
+
+    return from_local(vertices, origin)
+
+
+def _offset_polygon(ring, mask, outward, tolerance):
+    '''
+        Build the polygon of the kept vertices, each kept edge pushed out
+        past every vertex it replaced.
+        returns:
+            (m, 2) array of local vertices
+    '''
+    anchors = np.flatnonzero(mask)
+    edges = []
+    for start, end in zip(anchors[:-1], anchors[1:]):
+        a, b = ring[start], ring[end]
+        direction = b - a
+        length = np.hypot(direction[0], direction[1])
+        normal = np.array([direction[1], -direction[0]]) / length * outward
+        push = 0.0
+        if end - start > 1:
+            push = max(float((_signed_distances(ring[start + 1:end], a, b) * outward).max()), 0.0)
+        edges.append((a + normal * push, direction, normal * push))
+
+    vertices = []
+    for index, (point, direction, shift) in enumerate(edges):
+        prev_point, prev_direction, prev_shift = edges[index - 1]
+        corner = point - shift  # the original vertex the two edges share
+        if not shift.any() and not prev_shift.any():
+            vertices.append(corner)
+            continue
+
+        meet = _line_intersection(prev_point, prev_direction, point, direction)
+        if meet is not None and np.hypot(*(meet - corner)) <= MITER_LIMIT * tolerance:
+            vertices.append(meet)
+        else:
+            # bevel: end the previous edge and start this one at their offsets
+            vertices.append(corner + prev_shift)
+            vertices.append(corner + shift)
+
+    return np.array(vertices)
+
+
+def _boundary_distances(points, polygon):
+    '''
+        Distance of each point from the nearest edge of a closed polygon.
+    '''
+    a = polygon[None, :, :]
+    b = np.roll(polygon, -1, axis=0)[None, :, :]
+    p = points[:, None, :]
+    edge = b - a
+    length2 = np.maximum((edge ** 2).sum(axis=2), 1e-18)
+    t = np.clip(((p - a) * edge).sum(axis=2) / length2, 0, 1)
+    nearest = a + t[..., None] * edge
+    return np.hypot(*(p - nearest).transpose(2, 0, 1)).min(axis=1)
+
+
+def _lost_vertices(points, polygon, expand):
+    '''
+        Original vertices on the wrong side of the simplified polygon:
+        outside it when expanding, inside it when shrinking. Vertices on
+        the boundary (within BOUNDARY_EPSILON) count as kept.
+    '''
+    if not len(polygon):
+        return np.zeros(len(points), dtype=bool)
+    inside = points_in_polygon(points[:, 0], points[:, 1], polygon[:, 0], polygon[:, 1])
+    wrong = ~inside if expand else inside
+    if wrong.any():
+        wrong[wrong] = _boundary_distances(points[wrong], polygon) > BOUNDARY_EPSILON
+    return wrong
+
+
+def simplify_items(items, tolerance=DEFAULT_TOLERANCE, keep=()):
+    '''
+        Simplify a list of mission items (see mission_upload.load_mission_items).
+        Only runs of plain waypoints at one altitude with default parameters
+        are thinned; every other command is kept. Fence polygons are
+        simplified with simplify_fence.
+        keep: sequence numbers that must survive, e.g. the plan's detect_index
+        returns:
+            (new items, {old seq: new seq} for the kept items, number removed)
+    '''
+    items = [tuple(item) for item in items]
+    keep = set(keep)
+    output = []
+    mapping = {}
+    index = 0
+
+    while index < len(items):
+        command = items[index][3]
+
+        if command in FENCE_COMMANDS:
+            count = max(int(items[index][4]), 1)
+            polygon = items[index:index + count]
+            if keep.intersection(item[0] for item in polygon):
+                # a polygon with a kept vertex is left as it is
+                for item in polygon:
+                    mapping[item[0]] = len(output)
+                    output.append(item)
+                index += count
+                continue
+
+            lat, lon = simplify_fence(
+                [item[8] for item in polygon], [item[9] for item in polygon],
+                tolerance, expand=FENCE_COMMANDS[command],
+            )
+            template = polygon[0]
+            for vertex_lat, vertex_lon in zip(lat, lon):
+                output.append(template[:4] + (float(len(lat)),) + template[5:8]
+                              + (float(vertex_lat), float(vertex_lon)) + template[10:])
+            index += count
+            continue
+
+        # gather a run of plain waypoints sharing an altitude
+        end = index
+        while (end + 1 < len(items)
+               and items[end + 1][3] == MAV_CMD_NAV_WAYPOINT == command
+               and items[end + 1][10] == items[index][10]
+               and not any(items[end + 1][4:8]) and not any(items[index][4:8])):
+            end += 1
+
+        run = items[index:end + 1]
+        if len(run) > 2:
+            forced = [item[0] in keep for item in run]
+            mask = simplify_path([item[8] for item in run], [item[9] for item in run], tolerance, forced)
+        else:
+            mask = [True] * len(run)
+
+        for item, kept in zip(run, mask):
+            if kept:
+                mapping[item[0]] = len(output)
+                output.append(item)
+        index = end + 1
+
+    removed = len(items) - len(output)
+    output = [(seq,) + item[1:] for seq, item in enumerate(output)]
+    return output, mapping, removed
+
+
+def write_mission_items(filename, items):
+    '''
+        Write mission items as a QGC WPL file.
+    '''
+    with open(filename, 'w') as file:
+        file.write(format_mission_items(items))
+
+
+def simplify_file(filename, tolerance=DEFAULT_TOLERANCE, out=None, keep=()):
+    '''
+        Simplify a QGC WPL file in place, or into out.
+        keep: sequence numbers that must survive
+        returns:
+            (number of items removed, {old seq: new seq} of the kept items),
+            or an error code
+    '''
+    items = load_mission_items(filename)
+    if isinstance(items, int):
+        return items
+
+    simplified, mapping, removed = simplify_items(items, tolerance, keep)
+    if removed or out:
+        write_mission_items(out or filename, simplified)
+    return removed, {seq: mapping[seq] for seq in keep}
+
+
+def simplify_missions(missions, fields, tolerance=DEFAULT_TOLERANCE):
+    '''
+        Simplify a plan's missions, keeping the items the plan's indices
+        (PLAN_INDICES) point at and renumbering the indices to match.
+        missions: dict of mission key -> list of mission items
+        fields: plan fields (strings)
+        returns:
+            (dict of mission key -> new items, new fields, number of items removed)
+    '''
+    fields = dict(fields)
+    simplified = {}
+    removed = 0
+    for key, items in missions.items():
+        indices = [index_key for index_key, mission_key in PLAN_INDICES.items()
+                   if mission_key == key and index_key in fields]
+        new, mapping, count = simplify_items(items, tolerance, keep=[int(fields[index_key]) for index_key in indices])
+        for index_key in indices:
+            fields[index_key] = str(mapping[int(fields[index_key])])
+        simplified[key] = new
+        removed += count
+    return simplified, fields, removed
+
+
+def simplify_plan(plan, tolerance=DEFAULT_TOLERANCE):
+    '''
+        Simplify a loaded plan (plan_bundle.PlanBundle) in place: its
+        missions, and the indices into them.
+        returns:
+            number of items removed
+    '''
+    missions, fields, removed = simplify_missions({key: plan.items(key) for key in plan.missions}, plan.fields, tolerance)
+    plan.fields = fields
+    plan.missions = {key: np.array(items, dtype='<f8').reshape(-1, COLUMNS) for key, items in missions.items()}
+    return removed
+
+
+def _set_plan_fields(plan_file, values):
+    '''
+        Change field values in a plan file, leaving every other line as it is.
+    '''
+    with open(plan_file, 'r') as file:
+        lines = file.readlines()
+    for number, line in enumerate(lines):
+        key, separator, value = line.partition(':')
+        if separator and key.strip() in values:
+            lines[number] = key + separator + value.replace(value.strip(), values[key.strip()], 1)
+    with open(plan_file, 'w') as file:
+        file.writelines(lines)
+
+
+def simplify_plan_file(plan_file, tolerance=DEFAULT_TOLERANCE):
+    '''
+        Simplify every mission file of a plan in place, and rewrite the
+        plan's indices to follow the items they point at.
+        returns:
+            (number of items removed, list of problems); nothing is written
+            unless the plan is valid
+    '''
+    fields, missions, problems = validate_plan(plan_file)
+    if problems:
+        return 0, problems
+
+    simplified, new_fields, removed = simplify_missions(
+        {key: [tuple(row) for row in items.tolist()] for key, (_, items) in missions.items()}, fields, tolerance,
+    )
+    for key, (path, items) in missions.items():
+        if len(simplified[key]) != len(items):
+            write_mission_items(path, simplified[key])
+
+    changed = {key: value for key, value in new_fields.items() if value != fields[key]}
+    if changed:
+        _set_plan_fields(plan_file, changed)
+    return removed, []
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Remove nearly collinear points from QGC WPL missions and fences.")
+    parser.add_argument("file", help="QGC WPL file to simplify, or a plan file with --plan.")
+    parser.add_argument("--plan", action="store_true", help="Simplify every mission of a plan file in place and remap its indices.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help=f"Maximum deviation in meters. Default is {DEFAULT_TOLERANCE}.")
+    parser.add_argument("--keep", type=int, nargs='*', default=[], help="Sequence numbers that must be kept, e.g. the plan's detect_index.")
+    parser.add_argument("-o", "--output", default=None, help="Output file. Default is to overwrite the input.")
+
+    args = parser.parse_args()
+
+    if args.plan:
+        if args.output or args.keep:
+            parser.error("--plan simplifies in place and keeps the plan's own indices; -o and --keep don't apply")
+        removed, problems = simplify_plan_file(args.file, args.tolerance)
+        for problem in problems:
+            print(problem)
+        if problems:
+            exit(1)
+        print(f"Removed {removed} items from the missions of {args.file}.")
+        return
+
+    response = simplify_file(args.file, args.tolerance, args.output, args.keep)
+    if response == FILE_NOT_FOUND:
+        print(f"File {args.file} not found.")
+        exit(1)
+    if response == FILE_INVALID:
+        print(f"File {args.file} is not a valid QGC WPL file.")
+        exit(1)
+    removed, kept = response
+    print(f"Removed {removed} items from {args.file}.")
+    for old, new in kept.items():
+        if old != new:
+            print(f"Item {old} is now item {new}; update any plan index that points at it (or use --plan).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+'''
+Mission Plan Bundle
+
+2026-10-18
+PSU UAS
+
+Compiles a plan file and the mission files it references into one
+checksummed binary bundle. The plan is validated once, on the ground, when
+it is compiled; at boot the bundle is read with a single read call and its
+checksum verified, so a corrupted or half-written file on the SD card is
+rejected before takeoff instead of failing mid-flight.
+
+Layout (little-endian):
+    header      magic, version, mission count, index length, data length,
+                CRC-32 of everything after the header
+    index       JSON: the plan fields, and for each mission its source path,
+                offset into the data and item count
+    data        float64 mission arrays, one row of 12 QGC WPL columns per item
+
+Mission arrays are views into the buffer that was read, so loading copies
+nothing. read_plan loads either a bundle or a text plan into the same form,
+so the state machine takes its missions from memory either way; libraries
+that only load missions from a path (MAVez) get memory_paths(), which serve
+the verified missions from memory rather than from files on the SD card.
+
+Usage:
+    python plan_bundle.py ./backyard/plan.txt
+    python plan_bundle.py ./backyard/plan.txt -o ./backyard/backyard.uasplan
+    python uas_state_machine.py --plan ./backyard/plan.uasplan
+'''
+
+from mission_upload import load_mission_items, FILE_NOT_FOUND, FILE_INVALID
+import numpy as np
+import argparse
+import tempfile
+import shutil
+import struct
+import json
+import zlib
+import os
+
+
+# ============== Parameters =================
+BUNDLE_EXTENSION = '.uasplan'
+MAGIC = b'UASPLAN\x00'
+VERSION = 1
+ALIGNMENT = 8               # bytes; mission arrays start on float64 boundaries
+COLUMNS = 12                # QGC WPL columns per mission item
+INT_COLUMNS = (0, 1, 2, 3, 11)
+
+HEADER = struct.Struct('<8sHHIQI')
+
+# plan keys naming mission files, in upload order
+MISSION_KEYS = ('takeoff', 'detect', 'airdrop', 'land', 'geofence')
+
+# other required plan keys and how they are checked
+FIELD_TYPES = {
+    'home': 'coordinate',
+    'detect_index': int,
+    'airdrop_index': int,
+    'trigger_channel': int,
+    'trigger_value': int,
+    'trigger_wait_time': int,
+    'detection_entry': 'coordinate',
+    'detection_exit': 'coordinate',
+    'detection_width': float,
+    'airdrop_altitude': float,
+}
+
+# optional plan keys
+OPTIONAL_FIELD_TYPES = {
+    'simplify_tolerance': float,    # meters; missions are simplified when the plan is loaded
+}
+
+# plan keys holding an item index, and the mission they index
+PLAN_INDICES = {
+    'detect_index': 'detect',
+    'airdrop_index': 'airdrop',
+}
+
+# ============== Error codes ================
+BUNDLE_NOT_FOUND = 1001
+BUNDLE_CORRUPT = 1002
+BUNDLE_VERSION = 1003
+
+ERRORS = {
+    0: "No error",
+    BUNDLE_NOT_FOUND: "Plan bundle not found",
+    BUNDLE_CORRUPT: "Plan bundle is corrupt (checksum or layout mismatch)",
+    BUNDLE_VERSION: "Plan bundle was compiled by an incompatible version",
+}
+
+
+def parse_plan_file(filename):
+    '''
+        Read a colon-separated plan file.
+        returns:
+            dict of key -> value strings
+    '''
+    with open(filename, 'r') as file:
+        lines = file.readlines()
+
+    fields = {}
+    for line in lines:
+        # skip empty lines
+        if not line.strip():
+            continue
+        key, value = line.split(':', 1)
+        fields[key.strip()] = value.strip()
+    return fields
+
+
+def resolve_mission_path(path, plan_file):
+    '''
+        Mission paths in plan files are relative to the working directory
+        (e.g. ./backyard/takeoff.txt); fall back to the plan's own directory.
+    '''
+    if os.path.exists(path):
+        return path
+    local = os.path.join(os.path.dirname(plan_file), os.path.basename(path))
+    return local if os.path.exists(local) else path
+
+
+def validate_plan(plan_file):
+    '''
+        Check a plan file and load every mission it references.
+        returns:
+            (fields, missions, problems): the plan fields, a dict of mission
+            key -> (source path, item array), and a list of problems found;
+            the plan is valid when problems is empty
+    '''
+    try:
+        fields = parse_plan_file(plan_file)
+    except FileNotFoundError:
+        return {}, {}, [f"Plan file not found: {plan_file}"]
+    except ValueError as e:
+        return {}, {}, [f"Plan file is not 'key: value' lines: {e}"]
+
+    problems = []
+    for key, kind in {**FIELD_TYPES, **OPTIONAL_FIELD_TYPES}.items():
+        value = fields.get(key)
+        if value is None:
+            if key in FIELD_TYPES:
+                problems.append(f"Missing field '{key}'")
+            continue
+        try:
+            if kind == 'coordinate':
+                parts = [float(part) for part in value.split(',')]
+                if len(parts) != 3:
+                    raise ValueError
+            else:
+                kind(value)
+        except ValueError:
+            problems.append(f"Field '{key}' is not a valid {getattr(kind, '__name__', kind)}: {value}")
+
+    missions = {}
+    for key in MISSION_KEYS:
+        if key not in fields:
+            problems.append(f"Missing mission '{key}'")
+            continue
+        path = resolve_mission_path(fields[key], plan_file)
+        items = load_mission_items(path)
+        if items == FILE_NOT_FOUND:
+            problems.append(f"Mission '{key}' not found: {path}")
+        elif items == FILE_INVALID:
+            problems.append(f"Mission '{key}' is not valid QGC WPL: {path}")
+        elif not items:
+            problems.append(f"Mission '{key}' is empty: {path}")
+        else:
+            missions[key] = (path, np.array(items, dtype='<f8').reshape(-1, COLUMNS))
+
+    # mission indices must name items that exist
+    for index_key, mission_key in PLAN_INDICES.items():
+        if mission_key in missions and index_key in fields:
+            try:
+                index = int(fields[index_key])
+            except ValueError:
+                continue
+            if not 0 <= index < len(missions[mission_key][1]):
+                problems.append(f"'{index_key}' {index} is outside mission '{mission_key}' ({len(missions[mission_key][1])} items)")
+
+    return fields, missions, problems
+
+
+def _pad(length):
+    return -length % ALIGNMENT
+
+
+def write_bundle(filename, fields, missions):
+    '''
+        Write a bundle.
+        fields: plan fields (strings)
+        missions: dict of mission key -> (source path, item array)
+    '''
+    table = {}
+    chunks = []
+    offset = 0
+    for key, (source, items) in missions.items():
+        data = np.ascontiguousarray(items, dtype='<f8').tobytes()
+        table[key] = {'source': source, 'offset': offset, 'count': len(items)}
+        chunks.append(data)
+        offset += len(data)
+    data = b''.join(chunks)
+
+    index = json.dumps({'fields': fields, 'missions': table}).encode()
+    index += b' ' * _pad(HEADER.size + len(index))
+    body = index + data
+
+    header = HEADER.pack(MAGIC, VERSION, len(table), len(index), len(data), zlib.crc32(body))
+
+    # write beside the target and rename, so a bundle is never half-written
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(header + body)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, filename)
+
+
+def compile_plan(plan_file, out=None):
+    '''
+        Validate a plan and compile it into a bundle.
+        out: bundle path, or None for the plan path with BUNDLE_EXTENSION
+        returns:
+            list of problems; the bundle is written only when it is empty
+    '''
+    fields, missions, problems = validate_plan(plan_file)
+    if problems:
+        return problems
+    write_bundle(out or os.path.splitext(plan_file)[0] + BUNDLE_EXTENSION, fields, missions)
+    return []
+
+
+class PlanBundle:
+
+    def __init__(self, fields, missions, sources):
+        '''
+            fields: plan fields (strings)
+            missions: dict of mission key -> (n, 12) float64 item array
+            sources: dict of mission key -> path the mission was compiled from
+        '''
+        self.fields = fields
+        self.missions = missions
+        self.sources = sources
+
+        self._fds = []          # memory files behind memory_paths()
+        self._directory = None  # fallback directory where memory files aren't available
+
+
+    def items(self, key):
+        '''
+            Mission items as tuples, the form load_mission_items returns.
+        '''
+        rows = []
+        for row in self.missions[key].tolist():
+            for column in INT_COLUMNS:
+                row[column] = int(row[column])
+            rows.append(tuple(row))
+        return rows
+
+
+    def wpl_text(self, key):
+        '''
+            A mission as QGC WPL text.
+        '''
+        return "QGC WPL 110\n" + ''.join(
+            '\t'.join(str(value) if isinstance(value, int) else f"{value:.15g}" for value in item) + '\n'
+            for item in self.items(key)
+        )
+
+
+    def extract(self, directory):
+        '''
+            Write the missions out as QGC WPL files.
+            returns:
+                dict of mission key -> path written
+        '''
+        os.makedirs(directory, exist_ok=True)
+        paths = {}
+        for key in self.missions:
+            path = os.path.join(directory, f"{key}.txt")
+            with open(path, 'w') as file:
+                file.write(self.wpl_text(key))
+            paths[key] = path
+        return paths
+
+
+    def memory_paths(self):
+        '''
+            Paths that read the missions from memory (Linux memory files),
+            for libraries that only load missions from a path. Where memory
+            files aren't available the missions are extracted to a temporary
+            directory instead. Valid until release().
+            returns:
+                dict of mission key -> path
+        '''
+        if not hasattr(os, 'memfd_create'):
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix="plan_")
+            return self.extract(self._directory)
+
+        paths = {}
+        for key in self.missions:
+            fd = os.memfd_create(f"{key}.txt")
+            self._fds.append(fd)
+            data = memoryview(self.wpl_text(key).encode())
+            while data:
+                data = data[os.write(fd, data):]
+            paths[key] = f"/proc/self/fd/{fd}"
+        return paths
+
+
+    def release(self):
+        '''
+            Free what memory_paths() allocated.
+        '''
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+        if self._directory:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+
+def load_bundle(filename):
+    '''
+        Read and verify a bundle with a single read.
+        returns:
+            PlanBundle, or an error code
+    '''
+    try:
+        with open(filename, 'rb') as file:
+            buffer = file.read()
+    except FileNotFoundError:
+        return BUNDLE_NOT_FOUND
+
+    if len(buffer) < HEADER.size:
+        return BUNDLE_CORRUPT
+    magic, version, count, index_length, data_length, checksum = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        return BUNDLE_CORRUPT
+    if version != VERSION:
+        return BUNDLE_VERSION
+    if len(buffer) != HEADER.size + index_length + data_length:
+        return BUNDLE_CORRUPT
+
+    view = memoryview(buffer)
+    if zlib.crc32(view[HEADER.size:]) != checksum:
+        return BUNDLE_CORRUPT
+
+    try:
+        index = json.loads(bytes(view[HEADER.size:HEADER.size + index_length]))
+        data_start = HEADER.size + index_length
+        missions = {}
+        sources = {}
+        for key, entry in index['missions'].items():
+            missions[key] = np.frombuffer(
+                buffer, dtype='<f8', count=entry['count'] * COLUMNS, offset=data_start + entry['offset'],
+            ).reshape(-1, COLUMNS)
+            sources[key] = entry['source']
+    except (ValueError, KeyError, TypeError):
+        return BUNDLE_CORRUPT
+    if len(missions) != count:
+        return BUNDLE_CORRUPT
+
+    return PlanBundle(index['fields'], missions, sources)
+
+
+def read_plan(filename):
+    '''
+        Load a plan in either format: a compiled bundle (by its extension),
+        verified with a single read, or a text plan and the mission files it
+        references, validated as compile_plan would.
+        returns:
+            (PlanBundle, problems): the plan, or None with the list of
+            problems found
+    '''
+    if filename.endswith(BUNDLE_EXTENSION):
+        bundle = load_bundle(filename)
+        if isinstance(bundle, int):
+            return None, [f"{decode_error(bundle)}: {filename}"]
+        return bundle, []
+
+    fields, missions, problems = validate_plan(filename)
+    if problems:
+        return None, problems
+    return PlanBundle(
+        fields,
+        {key: items for key, (_, items) in missions.items()},
+        {key: source for key, (source, _) in missions.items()},
+    ), []
+
+
+def decode_error(error_code):
+    '''
+        Decode a plan bundle error code.
+    '''
+    return ERRORS.get(error_code, f"Unknown error code: {error_code}")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Validate mission plans and compile them into checksummed bundles.")
+    parser.add_argument("plans", nargs='+', help="Plan files (e.g. ./backyard/plan.txt).")
+    parser.add_argument("-o", "--output", default=None, help=f"Bundle path (single plan only). Default is the plan path with {BUNDLE_EXTENSION}.")
+    parser.add_argument("--check", action='store_true', help="Verify existing bundles instead of compiling.")
+
+    args = parser.parse_args()
+
+    if args.output and len(args.plans) > 1:
+        parser.error("--output takes a single plan")
+
+    failed = False
+    for plan in args.plans:
+        if args.check:
+            bundle = load_bundle(plan)
+            if isinstance(bundle, int):
+                print(f"{plan}: {decode_error(bundle)}")
+                failed = True
+            else:
+                counts = ', '.join(f"{key} {len(items)}" for key, items in bundle.missions.items())
+                print(f"{plan}: OK ({counts})")
+            continue
+
+        problems = compile_plan(plan, args.output)
+        if problems:
+            failed = True
+            print(f"{plan}: {len(problems)} problems")
+            for problem in problems:
+                print(f"    {problem}")
+        else:
+            print(f"{plan}: compiled to {args.output or os.path.splitext(plan)[0] + BUNDLE_EXTENSION}")
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
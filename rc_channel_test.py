@@ -1,9 +1,19 @@
 from MavEZ.flight_manger import Flight
+from mavlink_dispatcher import MessageDispatcher
+from rc_monitor import RCMonitor
 import time
 
 flight = Flight(connection_string='/dev/tty.usbmodem11301')
 
-flight.wait_for_channel_input(channel=6, value=982, timeout=10, wait_time=120, value_tolerance=100)
+dispatcher = MessageDispatcher(flight.controller.master)
+dispatcher.start()
+monitor = RCMonitor(dispatcher)
+monitor.start()
+
+response = monitor.wait_for_input(channel=6, value=982, tolerance=100, timeout=120)
+print(monitor.decode_error(response))
+for channel, debounce, link in monitor.latencies:
+    print(f"Channel {channel}: debounce {debounce * 1000:.0f} ms, link {link * 1000:.0f} ms")
 
 
 flight.controller.set_mode('FBWB')
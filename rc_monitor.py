@@ -0,0 +1,282 @@
+'''
+RC Channel Monitor
+
+2026-10-18
+PSU UAS
+
+Watches the RC_CHANNELS stream continuously instead of polling for one
+value. A small ring of recent samples is kept for every channel, and
+triggers with debounce and hysteresis fire callbacks on transitions, so
+takeoff and abort switches are neither missed nor tripped by a single
+noisy sample.
+
+Latency is measured for every transition: the debounce delay from the
+first in-band sample to the transition, and the link delay of that sample
+(receive time against the autopilot's time_boot_ms, relative to the
+fastest sample seen).
+'''
+
+from collections import deque
+import numpy as np
+import threading
+import time
+
+
+# ============== Parameters =================
+RING_SIZE = 32              # samples kept per channel
+CHANNELS = 18               # RC_CHANNELS carries chan1_raw .. chan18_raw
+DEBOUNCE_SAMPLES = 3        # consecutive samples a new state must hold
+HYSTERESIS = 50             # extra PWM margin before an active trigger releases
+UNUSED = 65535              # chanN_raw value for a channel that isn't sent
+
+# ============== Error codes ================
+TIMEOUT_ERROR = 901
+WAIT_CANCELLED = 902
+
+ERRORS = {
+    0: "No error",
+    TIMEOUT_ERROR: "Timed out waiting for RC input",
+    WAIT_CANCELLED: "Wait for RC input was cancelled",
+}
+
+
+class RCTrigger:
+
+    def __init__(self, channel, value, tolerance, callback=None, hysteresis=HYSTERESIS, debounce=DEBOUNCE_SAMPLES):
+        '''
+            channel: RC channel number (1-18)
+            value: PWM value the trigger is centered on
+            tolerance: PWM distance from value that activates the trigger
+            callback: callback(trigger, active) run on every transition
+            hysteresis: extra PWM margin before an active trigger releases
+            debounce: consecutive samples a new state must hold
+        '''
+        self.channel = channel
+        self.value = value
+        self.tolerance = tolerance
+        self.callback = callback
+        self.hysteresis = hysteresis
+        self.debounce = debounce
+
+        self.active = None                  # unknown until the first debounced state
+        self._pending = 0
+        self._pending_since = None
+        self._pending_delay = None
+
+        self.transitions = 0
+        self.last_latency = None            # (debounce delay, link delay) of the last transition
+
+
+    def update(self, pwm, now, link_delay):
+        '''
+            Feed one sample. The first debounced state is reported as a
+            transition too, active or released.
+            returns:
+                True if the trigger changed state
+        '''
+        margin = self.tolerance + (self.hysteresis if self.active else 0)
+        inside = abs(int(pwm) - self.value) <= margin
+
+        if inside == self.active:
+            self._pending = 0
+            self._pending_since = None
+            return False
+
+        if not self._pending:
+            self._pending_since = now
+            self._pending_delay = link_delay
+        self._pending += 1
+        if self._pending < self.debounce:
+            return False
+
+        self.active = inside
+        self.transitions += 1
+        self.last_latency = (now - self._pending_since, self._pending_delay)
+        self._pending = 0
+        self._pending_since = None
+
+        return True
+
+
+class RCMonitor:
+
+    def __init__(self, dispatcher, logger=None, ring_size=RING_SIZE):
+        '''
+            dispatcher: MessageDispatcher delivering RC_CHANNELS
+            logger: logger to report on
+            ring_size: samples kept per channel
+        '''
+        self.dispatcher = dispatcher
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._samples = np.zeros((ring_size, CHANNELS), dtype=np.uint16)
+        self._times = np.zeros(ring_size)
+        self._count = 0
+        self._fields = [f'chan{channel}_raw' for channel in range(1, CHANNELS + 1)]
+
+        self._clock_offset = None   # smallest (receive time - autopilot time) seen
+        self._last_boot_ms = 0
+        self.triggers = []
+        self._waits = []            # done events of the running wait_for_input calls
+        self._generation = 0        # bumped by cancel_waits
+        self.latencies = deque(maxlen=ring_size)    # (channel, debounce delay, link delay)
+
+
+    def start(self):
+        '''
+            Start monitoring RC_CHANNELS.
+        '''
+        self.dispatcher.add_listener(self.on_message)
+
+
+    def stop(self):
+        '''
+            Stop monitoring.
+        '''
+        self.dispatcher.remove_listener(self.on_message)
+
+
+    def add_trigger(self, channel, value, tolerance, callback=None, hysteresis=HYSTERESIS, debounce=DEBOUNCE_SAMPLES):
+        '''
+            Watch a channel for a PWM value. See RCTrigger.
+            returns:
+                the RCTrigger
+        '''
+        trigger = RCTrigger(channel, value, tolerance, callback, hysteresis, debounce)
+        with self._lock:
+            self.triggers.append(trigger)
+        return trigger
+
+
+    def remove_trigger(self, trigger):
+        with self._lock:
+            if trigger in self.triggers:
+                self.triggers.remove(trigger)
+
+
+    def on_message(self, msg):
+        '''
+            Store an RC_CHANNELS sample and update the triggers.
+            Runs on the dispatcher's reader thread.
+        '''
+        if msg.get_type() != 'RC_CHANNELS':
+            return
+
+        now = time.monotonic()
+        row = [getattr(msg, field) for field in self._fields]
+
+        # link delay relative to the fastest sample seen; the absolute offset
+        # between the clocks is unknown, the best case stands in for zero delay
+        offset = now - msg.time_boot_ms / 1000
+        fired = []
+        with self._lock:
+            # the autopilot clock restarts on reboot
+            if msg.time_boot_ms < self._last_boot_ms:
+                self._clock_offset = None
+            self._last_boot_ms = msg.time_boot_ms
+            if self._clock_offset is None or offset < self._clock_offset:
+                self._clock_offset = offset
+            link_delay = offset - self._clock_offset
+
+            slot = self._count % len(self._times)
+            self._samples[slot] = row
+            self._times[slot] = now
+            self._count += 1
+
+            for trigger in self.triggers:
+                pwm = row[trigger.channel - 1]
+                if pwm == UNUSED:
+                    continue
+                if trigger.update(pwm, now, link_delay):
+                    self.latencies.append((trigger.channel,) + trigger.last_latency)
+                    fired.append(trigger)
+
+        for trigger in fired:
+            if self.logger:
+                debounce, link = trigger.last_latency
+                state = "active" if trigger.active else "released"
+                self.logger.info(f"[RC] Channel {trigger.channel} {state} (debounce {debounce * 1000:.0f} ms, link {link * 1000:.0f} ms)")
+            if trigger.callback:
+                try:
+                    trigger.callback(trigger, trigger.active)
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f"[RC] Trigger callback raised: {e}")
+
+
+    def latest(self, channel):
+        '''
+            Most recent PWM value of a channel, or None before any sample.
+        '''
+        with self._lock:
+            if not self._count:
+                return None
+            return int(self._samples[(self._count - 1) % len(self._times), channel - 1])
+
+
+    def history(self, channel):
+        '''
+            Recent samples of a channel, oldest first.
+            returns:
+                (times, pwm) arrays
+        '''
+        with self._lock:
+            size = len(self._times)
+            n = min(self._count, size)
+            order = (np.arange(self._count - n, self._count)) % size
+            return self._times[order].copy(), self._samples[order, channel - 1].copy()
+
+
+    def wait_for_input(self, channel, value, tolerance=100, timeout=None):
+        '''
+            Block until a channel is switched to within tolerance of value
+            (debounced), or timeout seconds pass. The channel must be seen
+            released first: a switch already left in position when the wait
+            starts has to be switched off and on again.
+            returns:
+                0 when the input is received, TIMEOUT_ERROR, or
+                WAIT_CANCELLED if cancel_waits was called
+        '''
+        done = threading.Event()
+        released = threading.Event()
+
+        def on_transition(trigger, active):
+            if not active:
+                released.set()
+            elif released.is_set():
+                done.set()
+
+        with self._lock:
+            generation = self._generation
+            self._waits.append(done)
+        trigger = self.add_trigger(channel, value, tolerance, on_transition)
+        try:
+            received = done.wait(timeout)
+            with self._lock:
+                if self._generation != generation:
+                    return WAIT_CANCELLED
+            return 0 if received else TIMEOUT_ERROR
+        finally:
+            self.remove_trigger(trigger)
+            with self._lock:
+                self._waits.remove(done)
+
+
+    def cancel_waits(self):
+        '''
+            Make every running wait_for_input call return WAIT_CANCELLED now,
+            e.g. on abort. Later waits are not affected.
+        '''
+        with self._lock:
+            self._generation += 1
+            waits = list(self._waits)
+        for done in waits:
+            done.set()
+
+
+    def decode_error(self, error_code):
+        '''
+            Decode an RC monitor error code.
+        '''
+        return ERRORS.get(error_code, f"Unknown error code: {error_code}")
@@ -0,0 +1,140 @@
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+from pymavlink import mavutil
+from flight_recorder import (
+    TIMESTAMP, FlightRecorder, ReplayCamera, pace_replay, read_recording, recorded_passes, is_frame,
+)
+import numpy as np
+import time
+import cv2
+import os
+
+
+def write_recording(path, count):
+    encoder = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    with open(path, 'wb') as file:
+        for index in range(count):
+            packet = encoder.heartbeat_encode(1, 3, 0, 0, 0).pack(encoder)
+            file.write(TIMESTAMP.pack(int((1e9 + index * 0.01) * 1e6)) + packet)
+
+
+def test_replay_discards_sends(tmp_path):
+    path = str(tmp_path / 'flight.tlog')
+    write_recording(path, 3)
+    master = mavutil.mavlink_connection(path)
+    pace_replay(master, 1000)
+
+    # the log is opened read-only; commands sent by the state machine must not raise
+    master.mav.command_long_send(1, 1, 400, 0, 1, 0, 0, 0, 0, 0, 0)
+    master.mav.mission_count_send(1, 1, 0)
+
+    received = [master.recv_match(type='HEARTBEAT', blocking=True, timeout=1) for _ in range(3)]
+    assert all(msg is not None for msg in received)
+    assert master.recv_match(type='HEARTBEAT', blocking=True, timeout=0.01) is None
+    master.close()
+
+
+class FakeDispatcher:
+
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def dispatch(self, msg):
+        for listener in list(self.listeners):
+            listener(msg)
+
+
+def heartbeat(stamp):
+    encoder = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    msg = encoder.heartbeat_encode(1, 3, 0, 0, 0)
+    msg.pack(encoder)
+    msg._timestamp = stamp
+    return msg
+
+
+def test_recording_round_trip(tmp_path):
+    path = str(tmp_path / 'flight.tlog')
+    recorder = FlightRecorder(FakeDispatcher(), filename=path, buffer_size=64)
+    recorder.start()
+    for index in range(5):
+        recorder.dispatcher.dispatch(heartbeat(1e9 + index))
+    for index in range(3):
+        recorder.record_frame(index, 1e9 + 10 + index)
+    recorder.stop()
+
+    records = list(read_recording(path))
+    assert [stamp for stamp, _ in records] == [1e9 + index for index in range(5)] + [1e9 + 10 + index for index in range(3)]
+    assert [msg.get_type() for _, msg in records[:5]] == ['HEARTBEAT'] * 5
+    assert [msg.value for _, msg in records if is_frame(msg)] == [0, 1, 2]
+    assert recorder.bytes_written == os.path.getsize(path)
+    assert recorded_passes(path) == [[1e9 + 10, 1e9 + 11, 1e9 + 12]]
+
+
+class StalledFile:
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        time.sleep(0.3)
+        self.data += data
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_slow_writes_do_not_hold_up_the_reader(tmp_path):
+    recorder = FlightRecorder(FakeDispatcher(), filename=str(tmp_path / 'flight.tlog'), buffer_size=64)
+    recorder.start()
+    stalled = recorder._file = StalledFile()
+
+    start = time.monotonic()
+    for index in range(20):
+        recorder.dispatcher.dispatch(heartbeat(1e9 + index))
+    assert time.monotonic() - start < 0.2
+
+    recorder.stop()
+    assert recorder.messages == 20
+    assert len(stalled.data) == recorder.bytes_written == 20 * (TIMESTAMP.size + len(heartbeat(0).get_msgbuf()))
+
+
+def test_replay_camera_returns_recorded_passes(tmp_path):
+    path = str(tmp_path / 'flight_test.tlog')
+    recorder = FlightRecorder(FakeDispatcher(), filename=path)
+    recorder.start()
+    for index in range(2):
+        recorder.record_frame(index, 1e9 + index)
+    for index in range(3):
+        recorder.record_frame(index, 1e9 + 10 + index)
+    recorder.stop()
+
+    # the archiver kept the first pass only
+    pass_dir = tmp_path / 'images_test' / 'pass_1'
+    pass_dir.mkdir(parents=True)
+    for index in range(2):
+        cv2.imwrite(str(pass_dir / f"frame_{index:03d}.jpg"), np.full((8, 8, 3), index, dtype=np.uint8))
+
+    dispatcher = FakeDispatcher()
+    camera = ReplayCamera(path, dispatcher)
+    assert camera.image_dir == str(tmp_path / 'images_test')
+
+    # the replay delivers the frame markers of the first pass
+    for _, msg in list(read_recording(path))[:2]:
+        dispatcher.dispatch(msg)
+    assert camera.capture_images(20, 0, timeout=1) == 2
+    assert camera.capture_times == [1e9, 1e9 + 1]
+
+    # the second pass hasn't been replayed yet, and its frames weren't kept
+    start = time.monotonic()
+    assert camera.capture_images(20, 0, timeout=0.1) == 0
+    assert time.monotonic() - start >= 0.1
+    assert camera.capture_times == [1e9 + 10, 1e9 + 11, 1e9 + 12]
+    assert camera.capture_images(20, 0) == 0
@@ -0,0 +1,71 @@
+from geometry import (
+    geodetic_to_ecef, ecef_to_geodetic, get_projection, points_in_polygon, _cached_projection, WGS84_A,
+)
+import numpy as np
+
+ORIGIN = (38.3, -76.6, 0.0)
+
+
+def test_ecef_matches_known_values():
+    # equator at the prime meridian, the north pole, and the equator at 90 E
+    x, y, z = geodetic_to_ecef([0.0, 90.0, 0.0], [0.0, 0.0, 90.0], [0.0, 0.0, 100.0])
+    assert np.allclose(x, [WGS84_A, 0.0, 0.0], atol=1e-6)
+    assert np.allclose(y, [0.0, 0.0, WGS84_A + 100.0], atol=1e-6)
+    assert np.allclose(z, [0.0, 6356752.314245, 0.0], atol=1e-6)
+
+    lat, lon, alt = ecef_to_geodetic(x, y, z)
+    assert np.allclose(lat, [0.0, 90.0, 0.0], atol=1e-12)
+    assert np.allclose(lon, [0.0, 0.0, 90.0], atol=1e-12)
+    assert np.allclose(alt, [0.0, 0.0, 100.0], atol=1e-6)
+
+
+def test_enu_matches_known_values():
+    projection = get_projection(0.0, 0.0)
+    east, north, up = projection.forward([0.0, 0.001], [0.001, 0.0])
+    # 0.001 degrees along the equator, and along the meridian at the equator
+    assert np.allclose(east, [111.319491, 0.0], atol=1e-3)
+    assert np.allclose(north, [0.0, 110.574389], atol=1e-3)
+    assert np.all(np.abs(up) < 1e-2)
+
+
+def test_enu_round_trip():
+    rng = np.random.default_rng(3)
+    projection = get_projection(*ORIGIN)
+    lat = ORIGIN[0] + rng.uniform(-0.05, 0.05, 1000)
+    lon = ORIGIN[1] + rng.uniform(-0.05, 0.05, 1000)
+    alt = rng.uniform(0, 150, 1000)
+
+    east, north, up = projection.forward(lat, lon, alt)
+    back_lat, back_lon, back_alt = projection.inverse(east, north, up)
+    assert np.abs(back_lat - lat).max() < 1e-9
+    assert np.abs(back_lon - lon).max() < 1e-9
+    assert np.abs(back_alt - alt).max() < 1e-4
+
+    # and from the local frame back to itself
+    east, north = rng.uniform(-2000, 2000, (2, 100))
+    again = projection.forward(*projection.inverse(east, north, 30.0))
+    assert np.allclose(again, (east, north, np.full(100, 30.0)), atol=1e-6)
+
+
+def test_points_near_the_fence_edge():
+    square_x = [-100.0, 100.0, 100.0, -100.0]
+    square_y = [-100.0, -100.0, 100.0, 100.0]
+    x = [99.99, 100.01, -99.99, -100.01, 0.0, 0.0]
+    y = [0.0, 0.0, 50.0, 50.0, 99.99, 100.01]
+    assert points_in_polygon(x, y, square_x, square_y).tolist() == [True, False, True, False, True, False]
+
+    # the same checks through a projected fence, a centimetre either side
+    projection = get_projection(*ORIGIN)
+    fence_lat, fence_lon, _ = projection.inverse(square_x, square_y)
+    lat, lon, _ = projection.inverse(x, y)
+    assert projection.contains(fence_lat, fence_lon, lat, lon).tolist() == [True, False, True, False, True, False]
+
+
+def test_projection_cache_key_ignores_how_the_anchor_is_passed():
+    _cached_projection.cache_clear()
+    projection = get_projection(38.3, -76.6)
+    assert get_projection(38.3, -76.6, 0.0) is projection
+    assert get_projection(38.3, -76.6, alt=0) is projection
+    assert get_projection(np.float64(38.3), np.float64(-76.6)) is projection
+    assert _cached_projection.cache_info().currsize == 1
+    assert get_projection(38.3, -76.6, 10.0) is not projection
@@ -0,0 +1,139 @@
+import numpy as np
+from image_archiver import ImageArchiver
+import image_archiver
+import threading
+import time
+
+
+def frames(count):
+    return [np.full((48, 64, 3), index, dtype=np.uint8) for index in range(count)]
+
+
+def test_stop_drains_while_cpu_busy(tmp_path, monkeypatch):
+    monkeypatch.setattr(ImageArchiver, '_cpu_busy', staticmethod(lambda: True))
+    archiver = ImageArchiver(out_dir=str(tmp_path))
+    archiver.start()
+    archiver.submit(frames(3))
+
+    start = time.monotonic()
+    archiver.stop()
+    assert time.monotonic() - start < 5
+    assert archiver.archived == 1
+    assert (tmp_path / 'pass_1' / 'contact_sheet.jpg').exists()
+
+
+def test_stop_skips_what_the_deadline_leaves(tmp_path, monkeypatch):
+    archiver = ImageArchiver(out_dir=str(tmp_path))
+    archive = archiver._archive
+
+    def slow_archive(label, images):
+        time.sleep(0.3)
+        archive(label, images)
+
+    monkeypatch.setattr(archiver, '_archive', slow_archive)
+    archiver.start()
+    for _ in range(3):
+        archiver.submit(frames(1))
+
+    archiver.stop(timeout=0.1)
+    assert archiver.archived + archiver.skipped == 3
+    assert archiver.skipped >= 1
+
+
+def test_stop_without_drain_skips_queued(tmp_path):
+    archiver = ImageArchiver(out_dir=str(tmp_path))
+    archiver.pause()
+    archiver.start()
+    archiver.submit(frames(1))
+    archiver.submit(frames(1))
+    archiver.stop(drain=False)
+    assert archiver.archived + archiver.skipped == 2
+
+
+def test_submit_never_blocks_when_the_queue_is_full(tmp_path):
+    archiver = ImageArchiver(out_dir=str(tmp_path), queue_depth=2)
+    # not started, so nothing takes passes off the queue
+    start = time.monotonic()
+    assert [archiver.submit(frames(1)) for _ in range(4)] == [True, True, False, False]
+    assert time.monotonic() - start < 1
+    assert archiver.skipped == 2 and archiver.passes == 4
+
+
+def test_pause_holds_workers_until_resume(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_archiver, 'BUSY_WAIT', 0.02)
+    monkeypatch.setattr(ImageArchiver, '_cpu_busy', lambda self: False)
+    archiver = ImageArchiver(out_dir=str(tmp_path))
+    archiver.pause()
+    archiver.start()
+    try:
+        archiver.submit(frames(2))
+        time.sleep(0.3)
+        assert archiver.archived == 0
+        assert not (tmp_path / 'pass_1' / 'frame_000.jpg').exists()
+
+        archiver.resume()
+        deadline = time.monotonic() + 5
+        while archiver.archived == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert archiver.archived == 1
+        assert (tmp_path / 'pass_1' / 'frame_001.jpg').exists()
+    finally:
+        archiver.stop()
+
+
+def test_busy_cpu_holds_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_archiver, 'BUSY_WAIT', 0.02)
+    busy = [True]
+    monkeypatch.setattr(ImageArchiver, '_cpu_busy', lambda self: busy[0])
+    archiver = ImageArchiver(out_dir=str(tmp_path))
+    archiver.start()
+    try:
+        archiver.submit(frames(1))
+        time.sleep(0.2)
+        assert archiver.archived == 0
+        busy[0] = False
+        deadline = time.monotonic() + 5
+        while archiver.archived == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert archiver.archived == 1
+    finally:
+        archiver.stop()
+
+
+def test_stop_is_bounded_when_a_pass_hangs(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_archiver, 'STOP_GRACE', 0.2)
+    archiver = ImageArchiver(out_dir=str(tmp_path))
+    release = threading.Event()
+    monkeypatch.setattr(archiver, '_archive', lambda label, images: release.wait(10))
+    archiver.start()
+    archiver.submit(frames(1))
+    archiver.submit(frames(1))
+    time.sleep(0.1)
+
+    start = time.monotonic()
+    archiver.stop(timeout=0.1)
+    assert time.monotonic() - start < 2
+    assert archiver.skipped == 1    # the queued pass; the hung one is still running
+    release.set()
+
+
+def test_counters_are_consistent_across_threads(tmp_path):
+    archiver = ImageArchiver(out_dir=str(tmp_path), queue_depth=1)
+    threads = [threading.Thread(target=lambda: [archiver.submit([]) for _ in range(200)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert archiver.passes == 800
+    assert archiver.skipped == 799
+
+
+def test_cpu_busy_measures_the_recent_interval(tmp_path, monkeypatch):
+    archiver = ImageArchiver(out_dir=str(tmp_path))
+    ticks = iter([(100, 1000), (190, 1100), (195, 1200)])
+    monkeypatch.setattr(image_archiver, 'read_cpu_ticks', lambda: next(ticks))
+    monkeypatch.setattr(image_archiver, 'CPU_SAMPLE', 0)
+    # first check: 90 of 100 ticks busy over the sample
+    assert archiver._cpu_busy() is True
+    # next check: measured from the last one, 5 of 100 ticks busy
+    assert archiver._cpu_busy() is False
@@ -0,0 +1,43 @@
+from kml_to_wpl import convert_plan, iter_placemarks, MISSION, FENCE
+import warnings
+import io
+
+KML = b'''<?xml version="1.0"?><kml xmlns="http://www.opengis.net/kml/2.2"><Document>
+<Placemark><name>detect</name><LineString><coordinates>-76.1,38.1,0 -76.2,38.2,0</coordinates></LineString></Placemark>
+<Placemark><name>empty</name><LineString></LineString></Placemark>
+<Placemark><name>blank</name><LineString><coordinates> </coordinates></LineString></Placemark>
+<Placemark><name>fence</name><Polygon><outerBoundaryIs><LinearRing>
+<coordinates>-76.1,38.1 -76.2,38.1 -76.2,38.2 -76.1,38.1</coordinates>
+</LinearRing></outerBoundaryIs></Polygon></Placemark>
+</Document></kml>'''
+
+
+def test_empty_linestrings_are_skipped():
+    shapes = [(name, kind) for name, kind, _ in iter_placemarks(io.BytesIO(KML))]
+    assert shapes == [('detect', MISSION), ('fence', FENCE)]
+
+
+def test_same_name_in_two_inputs_does_not_overwrite(tmp_path):
+    for name in ('a.kml', 'b.kml'):
+        (tmp_path / name).write_bytes(KML)
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        written = convert_plan([str(tmp_path / 'a.kml'), str(tmp_path / 'b.kml')], str(tmp_path / 'out'))
+
+    paths = [path for path, _ in written]
+    assert len(paths) == len(set(paths)) == 4
+    assert len(caught) == 2
+
+
+def test_fence_is_written_in_the_fence_file_format(tmp_path):
+    (tmp_path / 'plan.kml').write_bytes(KML)
+    convert_plan([str(tmp_path / 'plan.kml')], str(tmp_path / 'out'))
+
+    lines = (tmp_path / 'out' / 'fence.txt').read_text().splitlines()
+    assert lines[0] == "QGC WPL 110"
+    assert lines[1] == "0\t0\t0\t5001\t3.000000\t0.000000\t0.000000\t0.000000\t38.100000\t-76.100000\t0.000000\t0"
+    assert len(lines) == 4
+
+    detect = (tmp_path / 'out' / 'detect.txt').read_text().splitlines()
+    assert detect[1] == "0\t0\t3\t16\t0\t0\t0\t0\t38.100000\t-76.100000\t30\t1"
@@ -0,0 +1,123 @@
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+from link_watchdog import (
+    LinkWatchdog, LINK_OK, LINK_DEGRADED, LINK_LOST,
+    HEARTBEAT_WARN_AGE, HEARTBEAT_LOST_AGE, ACK_LATENCY_WARN, MAV_TYPE_GCS,
+)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def sent(msg, seq, system=1, component=1):
+    msg._header = mavlink.MAVLink_header(msg.id, seq=seq % 256, srcSystem=system, srcComponent=component)
+    return msg
+
+
+def heartbeat(seq, kind=mavlink.MAV_TYPE_QUADROTOR):
+    return sent(mavlink.MAVLink_heartbeat_message(kind, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 0, 0, 3), seq)
+
+
+def attitude(seq):
+    return sent(mavlink.MAVLink_attitude_message(0, 0, 0, 0, 0, 0, 0), seq)
+
+
+def watched():
+    clock = FakeClock()
+    watchdog = LinkWatchdog(dispatcher=None, clock=clock)
+    changes = []
+    watchdog.add_callback(lambda state, reasons: changes.append(state))
+    return clock, watchdog, changes
+
+
+def test_snapshot_reports_rates_drops_and_latency():
+    clock, watchdog, _ = watched()
+    for seq in range(10):
+        watchdog.on_message(heartbeat(seq))
+        clock.now += 1.0
+    for seq in (10, 11, 14):     # 12 and 13 lost
+        watchdog.on_message(attitude(seq))
+        clock.now += 0.1
+
+    watchdog.command_sent(400)
+    clock.now += 0.25
+    watchdog.on_message(sent(mavlink.MAVLink_command_ack_message(400, 0), 15))
+
+    metrics = watchdog.snapshot()
+    assert metrics['state'] == "OK"
+    assert metrics['heartbeat_interval_mean'] == 1.0
+    assert abs(metrics['heartbeat_age'] - 1.55) < 1e-9
+    assert metrics['message_rates']['HEARTBEAT'] == 1.0
+    assert abs(metrics['message_rates']['ATTITUDE'] - 10.0) < 1e-9
+    assert metrics['received'] == 14 and metrics['dropped'] == 2
+    assert abs(metrics['drop_ratio'] - 2 / 16) < 1e-9
+    assert abs(metrics['ack_latency_max'] - 0.25) < 1e-9
+    assert metrics['pending_commands'] == 0
+
+
+def test_drop_ratio_threshold():
+    clock, watchdog, changes = watched()
+    watchdog.on_message(heartbeat(0))
+    for seq in range(1, 40):
+        watchdog.on_message(attitude(seq))
+    assert watchdog.check() == LINK_OK
+
+    # every other packet lost
+    for seq in range(41, 121, 2):
+        watchdog.on_message(attitude(seq))
+    assert watchdog.check() == LINK_DEGRADED
+    assert any('dropped' in reason for reason in watchdog.reasons)
+    assert changes == [LINK_DEGRADED]
+
+
+def test_heartbeat_thresholds_and_recovery():
+    clock, watchdog, changes = watched()
+    watchdog.on_message(heartbeat(0))
+
+    clock.now += HEARTBEAT_WARN_AGE - 0.1
+    assert watchdog.check() == LINK_OK
+    clock.now += 0.2
+    assert watchdog.check() == LINK_DEGRADED and watchdog.warning.is_set()
+    clock.now += HEARTBEAT_LOST_AGE
+    assert watchdog.check() == LINK_LOST
+
+    # a GCS heartbeat doesn't count; the vehicle's does
+    watchdog.on_message(heartbeat(1, kind=MAV_TYPE_GCS))
+    assert watchdog.state == LINK_LOST
+    watchdog.on_message(heartbeat(2))
+    assert watchdog.state == LINK_OK and not watchdog.warning.is_set()
+    assert changes == [LINK_DEGRADED, LINK_LOST, LINK_OK]
+
+
+def test_link_lost_when_no_heartbeat_ever_arrives():
+    clock, watchdog, changes = watched()
+    watchdog.on_message(attitude(0))    # traffic, but never a heartbeat
+
+    clock.now += HEARTBEAT_WARN_AGE
+    assert watchdog.check() == LINK_DEGRADED
+    clock.now += HEARTBEAT_LOST_AGE
+    assert watchdog.check() == LINK_LOST
+    assert watchdog.reasons[0].startswith("no heartbeat since start")
+    assert changes == [LINK_DEGRADED, LINK_LOST]
+    assert watchdog.snapshot()['heartbeat_age'] is None
+
+
+def test_unanswered_command_degrades_then_expires():
+    clock, watchdog, changes = watched()
+    watchdog.on_message(heartbeat(0))
+    watchdog.command_sent(176)
+
+    clock.now += ACK_LATENCY_WARN
+    watchdog.on_message(heartbeat(1))
+    assert watchdog.state == LINK_DEGRADED
+    assert "command ack latency" in watchdog.reasons[0]
+
+    clock.now += 5.0
+    watchdog.on_message(heartbeat(2))
+    assert watchdog.state == LINK_OK
+    assert watchdog.unacked == 1
@@ -0,0 +1,48 @@
+from log_store import LogStore, parse_log, build_flight
+import numpy as np
+
+
+def line(clock, message, level='INFO'):
+    return f"2026-10-18 {clock},000 - {level}\t- {message}\n"
+
+
+FLIGHT = (
+    line('10:00:00', "[Actions] Mission plan loaded: ./backyard/plan.txt")
+    + line('10:00:01', "[States] Current mission state: TAKEOFF")
+    + line('10:00:11', "[States] Current mission state: DETECT")
+    + line('10:00:12', "[Flight] Waiting for waypoint")
+    + line('10:00:41', "[States] Current mission state: LANDING")
+    # a coalesced repeat, written after the records that followed it
+    + line('10:00:20', "[Flight] Waiting for waypoint (repeated 7 more times in 5.0s)")
+    + line('10:01:01', "[States] Current mission state: MISSION COMPLETE")
+    + line('10:01:01', "[States] Operation ended.")
+)
+
+
+def test_coalesced_repeats_are_put_back_in_order():
+    records = parse_log(FLIGHT)
+    assert np.all(np.diff(records['times']) >= 0)
+    assert "[Flight] Waiting for waypoint" in records['messages'].tolist()
+    assert not any('repeated' in message for message in records['messages'].tolist())
+
+    columns = build_flight(0, 'log_2026-10-18_10-00-00.txt', records)
+    assert columns['flight_complete'].tolist() == [True]
+    assert columns['state_duration'].tolist() == [10, 30, 20, 0]
+
+
+def test_log_without_end_leaves_out_last_state(tmp_path):
+    logs = tmp_path / 'logs'
+    logs.mkdir()
+    (logs / 'log_2026-10-18_10-00-00.txt').write_text(FLIGHT)
+    # stops during landing, e.g. a crash
+    (logs / 'log_2026-10-18_11-00-00.txt').write_text(FLIGHT.split(line('10:01:01', "[States] Current mission state: MISSION COMPLETE"))[0])
+
+    store = LogStore(str(tmp_path / 'store'), str(logs))
+    assert store.ingest() == 2
+    assert [flight[5] for flight in store.flights()] == [True, False]
+
+    positions, seconds = store.state_durations('LANDING')
+    assert positions.tolist() == [0]
+    assert seconds.tolist() == [20]
+    assert store.state_durations('DETECT')[1].tolist() == [30, 30]
+    assert store.state_duration_by_plan('LANDING') == {'backyard': (20.0, 1)}
@@ -0,0 +1,121 @@
+from logging_config import CoalescingFilter, configure_logging, flush_logging
+import logging
+import time
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.times = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+        self.times.append(record.created)
+
+
+def make_logger(name, window=60):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = ListHandler()
+    logger.addHandler(handler)
+    coalescer = CoalescingFilter(handler, window=window)
+    handler.addFilter(coalescer)
+    return logger, handler, coalescer
+
+
+def log_at(logger, created, message):
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 0, message, None, None)
+    record.created = created
+    logger.handle(record)
+
+
+def test_repeats_are_coalesced():
+    logger, handler, coalescer = make_logger('test-coalesce')
+    for created in (100.0, 102.0, 107.5):
+        log_at(logger, created, "[Flight] Waiting for waypoint")
+    assert handler.messages == ["[Flight] Waiting for waypoint"]
+    coalescer.flush()
+    # the span the repeats actually covered, not the window
+    assert handler.messages[-1] == "[Flight] Waiting for waypoint (repeated 2 more times in 7.5s)"
+
+
+def test_states_and_warnings_pass_in_order():
+    logger, handler, coalescer = make_logger('test-passthrough')
+    logged = [
+        "[States] Current mission state: DETECT",
+        "[States] Current mission state: AIRDROP",
+        "[States] Current mission state: DETECT",
+        "[States] Current mission state: AIRDROP",
+    ]
+    for message in logged:
+        logger.info(message)
+    logger.warning("[Flight] Link degraded")
+    logger.warning("[Flight] Link degraded")
+    coalescer.flush()
+    assert handler.messages == logged + ["[Flight] Link degraded"] * 2
+    assert coalescer.suppressed == 0
+
+
+def test_summaries_are_written_in_time_order():
+    logger, handler, coalescer = make_logger('test-order', window=0.05)
+    for _ in range(3):
+        logger.info("[Flight] Waiting for waypoint")
+    logger.info("[Detect] Pass started")
+    time.sleep(0.1)
+    logger.info("[Detect] Pass complete")
+    coalescer.flush()
+
+    # the summary is written when the window closes, after the record that followed the repeats
+    assert handler.messages == [
+        "[Flight] Waiting for waypoint",
+        "[Detect] Pass started",
+        handler.messages[2],
+        "[Detect] Pass complete",
+    ]
+    assert handler.messages[2].startswith("[Flight] Waiting for waypoint (repeated 2 more times in ")
+    assert handler.times == sorted(handler.times)
+
+
+def test_records_from_child_loggers_are_coalesced():
+    logger, handler, coalescer = make_logger('test-parent')
+    child = logging.getLogger('test-parent.flight')
+    for _ in range(3):
+        child.info("[Flight] Waiting for waypoint")
+    assert handler.messages == ["[Flight] Waiting for waypoint"]
+    assert coalescer.suppressed == 2
+
+
+def test_configure_logging_gives_each_vehicle_its_own_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root_handler = ListHandler()
+    logging.getLogger().addHandler(root_handler)
+    loggers = [configure_logging(name) for name in ('vehicle-a', 'vehicle-b')]
+    try:
+        assert configure_logging('vehicle-a') is loggers[0]
+        assert len(loggers[0].handlers) == 2   # no duplicates on a second call
+
+        for logger in loggers:
+            assert not logger.propagate
+            logger.info(f"[Flight] {logger.name} waiting")
+            logger.info(f"[Flight] {logger.name} waiting")
+            flush_logging(logger)
+
+        for name in ('vehicle-a', 'vehicle-b'):
+            files = list((tmp_path / 'flight_logs').glob(f"log_{name}_*.txt"))
+            assert len(files) == 1
+            lines = files[0].read_text().splitlines()
+            assert len(lines) == 2
+            assert lines[0].endswith(f"[Flight] {name} waiting")
+            assert f"[Flight] {name} waiting (repeated 1 more times in " in lines[1]
+
+        # nothing reached the root logger
+        assert root_handler.messages == []
+    finally:
+        logging.getLogger().removeHandler(root_handler)
+        for logger in loggers:
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
@@ -0,0 +1,203 @@
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+from mavlink_dispatcher import MessageDispatcher
+import threading
+import queue
+import time
+
+
+class FakeLink:
+    '''
+        Stands in for a mavutil connection; messages are fed through inbox.
+    '''
+
+    def __init__(self):
+        self.inbox = queue.Queue()
+        self.messages = {}
+        self.sent = []
+
+    def write(self, buf):
+        self.sent.append(buf)
+
+    def recv_match(self, condition=None, type=None, blocking=False, timeout=None):
+        try:
+            msg = self.inbox.get(timeout=timeout) if blocking else self.inbox.get_nowait()
+        except queue.Empty:
+            return None
+        self.messages[msg.get_type()] = msg
+        return msg
+
+
+def reached(seq):
+    return mavlink.MAVLink_mission_item_reached_message(seq)
+
+
+def started():
+    link = FakeLink()
+    dispatcher = MessageDispatcher(link)
+    dispatcher.start()
+    return link, dispatcher
+
+
+def settle(link):
+    while not link.inbox.empty():
+        time.sleep(0.01)
+    time.sleep(0.05)
+
+
+def test_reply_arriving_before_recv_match_is_delivered():
+    link, dispatcher = started()
+    try:
+        link.write(b'request')
+        # the reply beats the caller to recv_match
+        link.inbox.put(mavlink.MAVLink_mission_ack_message(255, 190, 0))
+        settle(link)
+
+        msg = link.recv_match(type='MISSION_ACK', blocking=True, timeout=1)
+        assert msg is not None and msg.type == 0
+        # each message is returned once
+        assert link.recv_match(type='MISSION_ACK', blocking=False) is None
+        assert link.sent == [b'request']
+    finally:
+        dispatcher.stop()
+
+
+def test_recv_match_ignores_messages_from_before_the_exchange():
+    link, dispatcher = started()
+    try:
+        # a stale ack from an earlier exchange, then a new request
+        link.inbox.put(mavlink.MAVLink_mission_ack_message(255, 190, 1))
+        settle(link)
+        link.write(b'request')
+
+        assert link.recv_match(type='MISSION_ACK', blocking=True, timeout=0.2) is None
+
+        # and without any send, only what arrives during the call
+        link.inbox.put(reached(1))
+        settle(link)
+        results = []
+        reader = threading.Thread(target=lambda: results.append(link.recv_match(type='MISSION_ITEM_REACHED', blocking=True, timeout=0.2)))
+        reader.start()
+        reader.join()
+        assert results == [None]
+    finally:
+        dispatcher.stop()
+
+
+def test_exchange_cursor_moves_to_the_next_send_after_a_receive():
+    link, dispatcher = started()
+    try:
+        link.write(b'count')
+        link.inbox.put(mavlink.MAVLink_mission_request_int_message(255, 190, 0))
+        settle(link)
+        assert link.recv_match(type='MISSION_REQUEST_INT', blocking=True, timeout=1).seq == 0
+
+        # a duplicate request for item 0 arrives; item 0 is answered, then item 1 is requested
+        link.inbox.put(mavlink.MAVLink_mission_request_int_message(255, 190, 0))
+        settle(link)
+        link.write(b'item 0')
+        link.inbox.put(mavlink.MAVLink_mission_request_int_message(255, 190, 1))
+        settle(link)
+        assert link.recv_match(type='MISSION_REQUEST_INT', blocking=True, timeout=1).seq == 1
+    finally:
+        dispatcher.stop()
+
+
+def test_recv_match_returns_messages_that_arrive_during_the_call():
+    link, dispatcher = started()
+    try:
+        link.inbox.put(reached(1))
+        settle(link)
+
+        threading.Timer(0.1, link.inbox.put, args=(reached(2),)).start()
+        msg = link.recv_match(type='MISSION_ITEM_REACHED', blocking=True, timeout=2)
+        assert msg is not None and msg.seq == 2
+    finally:
+        dispatcher.stop()
+
+
+def test_recv_match_condition_consumes_failing_messages():
+    link, dispatcher = started()
+    try:
+        def feed():
+            for seq in (3, 4, 5):
+                link.inbox.put(reached(seq))
+
+        threading.Timer(0.1, feed).start()
+        msg = link.recv_match(condition='MISSION_ITEM_REACHED.seq == 5', type='MISSION_ITEM_REACHED', blocking=True, timeout=2)
+        assert msg is not None and msg.seq == 5
+    finally:
+        dispatcher.stop()
+
+
+def test_concurrent_readers_both_see_new_messages():
+    link, dispatcher = started()
+    try:
+        results = []
+
+        def read():
+            results.append(link.recv_match(type='MISSION_ITEM_REACHED', blocking=True, timeout=2))
+
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        for reader in readers:
+            reader.start()
+        time.sleep(0.1)
+        link.inbox.put(reached(6))
+        link.inbox.put(reached(7))
+        for reader in readers:
+            reader.join()
+
+        assert sorted(msg.seq for msg in results) == [6, 7]
+    finally:
+        dispatcher.stop()
+
+
+def test_wait_for_waypoint_reached_resolves():
+    link, dispatcher = started()
+    try:
+        response = dispatcher.wait_for_waypoint_reached(8, timeout=2)
+        link.inbox.put(reached(7))
+        link.inbox.put(reached(8))
+        assert response.result(timeout=2) == 0
+    finally:
+        dispatcher.stop()
+
+
+def test_cancel_waits_ends_blocked_recv_match_and_futures():
+    link, dispatcher = started()
+    try:
+        response = dispatcher.wait_for_waypoint_reached(9, timeout=100)
+        results = []
+        reader = threading.Thread(target=lambda: results.append(
+            link.recv_match(type='MISSION_ITEM_REACHED', blocking=True, timeout=100)))
+        reader.start()
+        time.sleep(0.1)
+
+        start = time.monotonic()
+        dispatcher.cancel_waits()
+        reader.join(timeout=2)
+        assert not reader.is_alive() and results == [None]
+        assert time.monotonic() - start < 2
+        assert dispatcher.decode_error(response.result(timeout=1)) == "Wait was cancelled"
+
+        # waits started afterwards are unaffected
+        threading.Timer(0.1, link.inbox.put, args=(reached(10),)).start()
+        assert link.recv_match(type='MISSION_ITEM_REACHED', blocking=True, timeout=2).seq == 10
+    finally:
+        dispatcher.stop()
+
+
+def test_replay_returns_recorded_replies_whatever_the_timing():
+    link = FakeLink()
+    dispatcher = MessageDispatcher(link, replay=True)
+    dispatcher.start()
+    try:
+        # the recorded ack comes up before the replayed request is sent
+        link.inbox.put(mavlink.MAVLink_mission_ack_message(255, 190, 0))
+        settle(link)
+        link.write(b'request')
+
+        msg = link.recv_match(type='MISSION_ACK', blocking=True, timeout=1)
+        assert msg is not None and msg.type == 0
+        assert link.recv_match(type='MISSION_ACK', blocking=False) is None
+    finally:
+        dispatcher.stop()
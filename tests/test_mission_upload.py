@@ -0,0 +1,251 @@
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+from mission_upload import MissionUploader, changed_ranges, items_from_mission
+from types import SimpleNamespace
+import mission_upload
+import io
+
+
+class FakeMaster:
+
+    def __init__(self):
+        self.mav = mavlink.MAVLink(io.BytesIO())
+        self.target_system = 1
+        self.target_component = 1
+
+
+class FakeDispatcher:
+
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def dispatch(self, msg):
+        for listener in self.listeners:
+            listener(msg)
+
+
+ITEMS = [
+    (0, 0, 3, 16, 0.0, 0.0, 0.0, 0.0, 38.298355, -76.639143, 0.0, 1),
+    (1, 0, 3, 16, 0.0, 0.0, 0.0, 0.0, 38.298333, -76.639149, 30.0, 1),
+    (2, 0, 3, 16, 0.0, 0.0, 0.0, 0.0, 38.298316, -76.639159, 30.0, 1),
+]
+
+
+def other_sender_upload(master, items):
+    master.mav.mission_count_send(1, 1, len(items))
+    for seq, current, frame, command, p1, p2, p3, p4, lat, lon, alt, autocontinue in items:
+        master.mav.mission_item_int_send(1, 1, seq, frame, command, current, autocontinue,
+                                         p1, p2, p3, p4, int(round(lat * 1e7)), int(round(lon * 1e7)), alt)
+
+
+def test_changed_ranges():
+    new = list(ITEMS)
+    new[2] = ITEMS[2][:8] + (0.0, 0.0, 30.0, 1)
+    assert changed_ranges(ITEMS, new) == [(2, 2)]
+    assert changed_ranges(ITEMS, ITEMS[:2]) is None
+
+
+def test_watch_confirms_accepted_upload_from_another_sender():
+    master, dispatcher = FakeMaster(), FakeDispatcher()
+    uploader = MissionUploader(master)
+    uploader.watch(dispatcher)
+
+    other_sender_upload(master, ITEMS)
+    assert uploader.confirmed is None
+    dispatcher.dispatch(mavlink.MAVLink_mission_ack_message(255, 0, mavlink.MAV_MISSION_ACCEPTED))
+    assert uploader.confirmed == ITEMS
+
+
+def test_watch_invalidates_on_rejected_or_incomplete_upload():
+    master, dispatcher = FakeMaster(), FakeDispatcher()
+    uploader = MissionUploader(master)
+    uploader.watch(dispatcher)
+    uploader.confirmed = list(ITEMS)
+
+    other_sender_upload(master, ITEMS[:2] + [ITEMS[1]])
+    assert uploader.confirmed is None
+    dispatcher.dispatch(mavlink.MAVLink_mission_ack_message(255, 0, mavlink.MAV_MISSION_ERROR))
+    assert uploader.confirmed is None
+
+    master.mav.mission_count_send(1, 1, 3)
+    master.mav.mission_item_int_send(1, 1, 0, 3, 16, 0, 1, 0, 0, 0, 0, 0, 0, 0)
+    dispatcher.dispatch(mavlink.MAVLink_mission_ack_message(255, 0, mavlink.MAV_MISSION_ACCEPTED))
+    assert uploader.confirmed is None
+
+
+def test_unwatch_restores_senders():
+    master, dispatcher = FakeMaster(), FakeDispatcher()
+    original = master.mav.mission_count_send
+    uploader = MissionUploader(master)
+    uploader.watch(dispatcher)
+    uploader.unwatch()
+    assert master.mav.mission_count_send == original
+    assert not dispatcher.listeners
+
+
+class FakeAutopilot:
+    '''
+        Stands in for a mavutil connection to an autopilot that runs the
+        mission upload protocol. Replies are queued as the uploader sends.
+    '''
+
+    def __init__(self, reject_partial=False, silent_partial=False):
+        self.mav = mavlink.MAVLink(self, srcSystem=255, srcComponent=190)
+        self.target_system = 1
+        self.target_component = 1
+        self.reject_partial = reject_partial
+        self.silent_partial = silent_partial
+
+        self._parser = mavlink.MAVLink(None)
+        self._replies = []
+        self._last = None
+        self.mission = []
+        self.received = []
+
+    def write(self, buf):
+        for msg in self._parser.parse_buffer(buf) or []:
+            self.received.append(msg.get_type())
+            self._handle(msg)
+
+    def _reply(self, msg):
+        self._replies.append(msg)
+
+    def _handle(self, msg):
+        kind = msg.get_type()
+        if kind == 'MISSION_COUNT':
+            self.mission = [None] * msg.count
+            self._last = msg.count - 1
+            self._reply(mavlink.MAVLink_mission_request_int_message(255, 190, 0))
+        elif kind == 'MISSION_WRITE_PARTIAL_LIST':
+            if self.silent_partial:
+                return
+            if self.reject_partial:
+                self._reply(mavlink.MAVLink_mission_ack_message(255, 190, mavlink.MAV_MISSION_UNSUPPORTED))
+                return
+            self._last = msg.end_index
+            self._reply(mavlink.MAVLink_mission_request_int_message(255, 190, msg.start_index))
+        elif kind == 'MISSION_ITEM_INT':
+            self.mission[msg.seq] = (
+                msg.seq, msg.current, msg.frame, msg.command, msg.param1, msg.param2, msg.param3, msg.param4,
+                msg.x / 1e7, msg.y / 1e7, msg.z, msg.autocontinue,
+            )
+            if msg.seq < self._last:
+                self._reply(mavlink.MAVLink_mission_request_int_message(255, 190, msg.seq + 1))
+            else:
+                self._reply(mavlink.MAVLink_mission_ack_message(255, 190, mavlink.MAV_MISSION_ACCEPTED))
+        elif kind == 'COMMAND_LONG':
+            self._reply(mavlink.MAVLink_command_ack_message(msg.command, mavlink.MAV_RESULT_ACCEPTED))
+
+    def recv_match(self, condition=None, type=None, blocking=False, timeout=None):
+        types = [type] if isinstance(type, str) else type
+        for index, msg in enumerate(self._replies):
+            if types is None or msg.get_type() in types:
+                return self._replies.pop(index)
+        return None
+
+
+def moved(items, index, lat):
+    items = list(items)
+    items[index] = items[index][:8] + (lat,) + items[index][9:]
+    return items
+
+
+def test_full_upload_then_partial_write_of_changed_items():
+    autopilot = FakeAutopilot()
+    uploader = MissionUploader(autopilot)
+
+    assert uploader.upload(ITEMS) == 0
+    assert autopilot.mission == ITEMS
+    assert autopilot.received.count('MISSION_ITEM_INT') == 3
+
+    autopilot.received.clear()
+    new = moved(ITEMS, 2, 38.2984)
+    assert uploader.upload(new) == 0
+    assert autopilot.mission == new
+    assert autopilot.received == ['MISSION_WRITE_PARTIAL_LIST', 'MISSION_ITEM_INT']
+    assert uploader.confirmed == new
+
+    assert uploader.stats == {
+        'uploads': 2,
+        'full_uploads': 1,
+        'partial_uploads': 1,
+        'fallbacks': 0,
+        'items_sent': 4,
+        'round_trips': 6,
+        'round_trips_saved': 2,
+    }
+    assert uploader.summary() == "2 uploads (1 partial, 1 full, 0 fallbacks), 4 items sent, 2 round trips saved"
+
+
+def test_unchanged_mission_sends_nothing():
+    autopilot = FakeAutopilot()
+    uploader = MissionUploader(autopilot)
+    uploader.upload(ITEMS)
+    autopilot.received.clear()
+
+    assert uploader.upload(ITEMS) == 0
+    assert autopilot.received == []
+    assert uploader.stats['round_trips_saved'] == 4
+
+
+def test_rejected_partial_write_falls_back_to_full_upload():
+    autopilot = FakeAutopilot(reject_partial=True)
+    uploader = MissionUploader(autopilot)
+    uploader.upload(ITEMS)
+    autopilot.received.clear()
+
+    new = moved(ITEMS, 1, 38.2990)
+    assert uploader.upload(new) == 0
+    assert autopilot.mission == new
+    assert autopilot.received[0] == 'MISSION_WRITE_PARTIAL_LIST'
+    assert autopilot.received[1] == 'MISSION_COUNT'
+    assert uploader.stats['fallbacks'] == 1
+    assert uploader.stats['full_uploads'] == 2
+    assert uploader.stats['partial_uploads'] == 0
+
+
+def test_silent_partial_write_falls_back_after_retries(monkeypatch):
+    monkeypatch.setattr(mission_upload, 'ITEM_TIMEOUT', 0.01)
+    autopilot = FakeAutopilot(silent_partial=True)
+    uploader = MissionUploader(autopilot)
+    uploader.upload(ITEMS)
+    autopilot.received.clear()
+
+    new = moved(ITEMS, 1, 38.2990)
+    assert uploader.upload(new) == 0
+    assert autopilot.received.count('MISSION_WRITE_PARTIAL_LIST') == mission_upload.MAX_RETRIES + 1
+    assert autopilot.mission == new
+    assert uploader.stats['fallbacks'] == 1
+
+
+def test_failed_full_upload_forgets_confirmed_mission(monkeypatch):
+    monkeypatch.setattr(mission_upload, 'ITEM_TIMEOUT', 0.01)
+    autopilot = FakeAutopilot()
+    uploader = MissionUploader(autopilot)
+    uploader.upload(ITEMS)
+
+    autopilot._handle = lambda msg: None
+    assert uploader.upload(ITEMS[:2]) == mission_upload.UPLOAD_TIMEOUT
+    assert uploader.confirmed is None
+
+
+def test_set_current_waits_for_ack():
+    autopilot = FakeAutopilot()
+    uploader = MissionUploader(autopilot)
+    assert uploader.set_current(1, reset=True) == 0
+    assert autopilot.received == ['COMMAND_LONG']
+
+
+def test_items_from_mission_reads_mavez_items():
+    mission = SimpleNamespace(mission_items=[
+        SimpleNamespace(seq=seq, current=current, frame=frame, command=command, auto_continue=autocontinue,
+                        param1=p1, param2=p2, param3=p3, param4=p4,
+                        x=int(round(lat * 1e7)), y=int(round(lon * 1e7)), z=alt)
+        for seq, current, frame, command, p1, p2, p3, p4, lat, lon, alt, autocontinue in ITEMS
+    ])
+    assert items_from_mission(mission) == ITEMS
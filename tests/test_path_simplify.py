@@ -0,0 +1,115 @@
+from path_simplify import (
+    simplify_fence, simplify_path, simplify_missions, simplify_plan_file, write_mission_items, _boundary_distances,
+)
+from mission_upload import load_mission_items
+from geometry import get_projection, points_in_polygon
+import numpy as np
+
+ORIGIN = (38.3, -76.6)
+EPSILON = 1e-3
+
+
+def jagged_ring(rng, count):
+    '''
+        Star-shaped ring with random spikes, in local meters.
+    '''
+    angles = np.sort(rng.uniform(0, 2 * np.pi, count))
+    radii = rng.uniform(40, 200, count) * np.where(rng.random(count) < 0.3, 0.4, 1.0)
+    return np.column_stack((radii * np.cos(angles), radii * np.sin(angles)))
+
+
+def simplified(points, tolerance, expand):
+    projection = get_projection(*ORIGIN)
+    lat, lon, _ = projection.inverse(points[:, 0], points[:, 1])
+    new_lat, new_lon = simplify_fence(lat, lon, tolerance, expand)
+    east, north, _ = projection.forward(new_lat, new_lon)
+    return np.column_stack((east, north))
+
+
+def test_inclusion_fence_keeps_every_original_vertex_inside():
+    rng = np.random.default_rng(7)
+    for _ in range(300):
+        points = jagged_ring(rng, int(rng.integers(8, 60)))
+        fence = simplified(points, float(rng.uniform(1, 10)), expand=True)
+        outside = ~points_in_polygon(points[:, 0], points[:, 1], fence[:, 0], fence[:, 1])
+        if outside.any():
+            assert _boundary_distances(points[outside], fence).max() <= EPSILON
+
+
+def test_exclusion_fence_keeps_every_original_vertex_outside():
+    rng = np.random.default_rng(11)
+    for _ in range(300):
+        points = jagged_ring(rng, int(rng.integers(8, 60)))
+        fence = simplified(points, float(rng.uniform(1, 10)), expand=False)
+        inside = points_in_polygon(points[:, 0], points[:, 1], fence[:, 0], fence[:, 1])
+        if inside.any():
+            assert _boundary_distances(points[inside], fence).max() <= EPSILON
+
+
+def test_fence_simplification_removes_collinear_vertices():
+    side = np.linspace(0, 100, 11)
+    square = np.vstack((
+        np.column_stack((side, np.zeros(11))),
+        np.column_stack((np.full(10, 100.0), side[1:])),
+        np.column_stack((side[::-1][1:], np.full(10, 100.0))),
+        np.column_stack((np.zeros(9), side[::-1][1:-1])),
+    ))
+    fence = simplified(square, 1.0, expand=True)
+    assert len(fence) == 4
+
+
+def test_path_keeps_ends_and_drops_collinear_points():
+    projection = get_projection(*ORIGIN)
+    lat, lon, _ = projection.inverse(np.linspace(0, 100, 11), np.zeros(11))
+    mask = simplify_path(lat, lon, 1.0)
+    assert mask.tolist() == [True] + [False] * 9 + [True]
+
+
+def straight_items(count):
+    projection = get_projection(*ORIGIN)
+    lat, lon, _ = projection.inverse(np.linspace(0, 10 * (count - 1), count), np.zeros(count))
+    return [(seq, 0, 3, 16, 0.0, 0.0, 0.0, 0.0, round(float(a), 6), round(float(o), 6), 30.0, 1) for seq, (a, o) in enumerate(zip(lat, lon))]
+
+
+def test_simplify_missions_keeps_and_remaps_plan_indices():
+    missions = {'detect': straight_items(11), 'airdrop': straight_items(6)}
+    fields = {'detect_index': '7', 'airdrop_index': '5', 'home': '38.3,-76.6,0'}
+
+    simplified, new_fields, removed = simplify_missions(missions, fields, 1.0)
+
+    assert [item[0] for item in simplified['detect']] == [0, 1, 2]
+    assert simplified['detect'][int(new_fields['detect_index'])][8:10] == missions['detect'][7][8:10]
+    assert simplified['airdrop'][int(new_fields['airdrop_index'])][8:10] == missions['airdrop'][5][8:10]
+    assert new_fields['home'] == fields['home'] and fields['detect_index'] == '7'
+    assert removed == 8 + 4
+
+
+def test_simplify_plan_file_rewrites_missions_and_indices(tmp_path):
+    from plan_bundle import MISSION_KEYS, parse_plan_file
+    missions = {key: straight_items(11) for key in MISSION_KEYS}
+    for key, items in missions.items():
+        write_mission_items(str(tmp_path / f"{key}.txt"), items)
+    (tmp_path / 'plan.txt').write_text(
+        ''.join(f"{key}: {tmp_path / key}.txt\n" for key in MISSION_KEYS)
+        + "home:               38.3,-76.6,0\n"
+        + "detect_index:       4\n"
+        + "airdrop_index:      9\n"
+        + "trigger_channel: 6\ntrigger_value: 2006\ntrigger_wait_time: 10000\n"
+        + "detection_entry: 38.3,-76.6,30\ndetection_exit: 38.3,-76.6,30\ndetection_width: 30\nairdrop_altitude: 20\n"
+    )
+
+    removed, problems = simplify_plan_file(str(tmp_path / 'plan.txt'), 1.0)
+    assert problems == [] and removed > 0
+
+    fields = parse_plan_file(str(tmp_path / 'plan.txt'))
+    detect = load_mission_items(str(tmp_path / 'detect.txt'))
+    airdrop = load_mission_items(str(tmp_path / 'airdrop.txt'))
+    assert detect[int(fields['detect_index'])][8:10] == missions['detect'][4][8:10]
+    assert airdrop[int(fields['airdrop_index'])][8:10] == missions['airdrop'][9][8:10]
+    assert "detect_index:       1\n" in (tmp_path / 'plan.txt').read_text()
+
+
+def test_written_missions_use_six_decimal_coordinates(tmp_path):
+    items = [(0, 0, 3, 16, 0.0, 0.0, 0.0, 0.0, 38.123456789, -76.987654321, 30.0, 1)]
+    write_mission_items(str(tmp_path / 'mission.txt'), items)
+    assert (tmp_path / 'mission.txt').read_text().splitlines()[1] == "0\t0\t3\t16\t0\t0\t0\t0\t38.123457\t-76.987654\t30\t1"
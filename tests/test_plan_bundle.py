@@ -0,0 +1,100 @@
+from plan_bundle import (
+    compile_plan, load_bundle, read_plan, HEADER,
+    BUNDLE_EXTENSION, BUNDLE_NOT_FOUND, BUNDLE_CORRUPT, BUNDLE_VERSION, MISSION_KEYS,
+)
+from mission_upload import load_mission_items
+import shutil
+import struct
+import os
+
+TESTING = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testing')
+
+FIELDS = '''home: 40.83608,-77.69343,0
+detect_index: 1
+airdrop_index: 1
+trigger_channel: 6
+trigger_value: 2006
+trigger_wait_time: 10000
+airdrop_altitude: 22
+detection_entry: 40.8364,-77.6942,22
+detection_exit: 40.8370,-77.6948,22
+detection_width: 30
+'''
+
+
+def write_plan(directory):
+    for key in MISSION_KEYS:
+        shutil.copy(os.path.join(TESTING, f"{key}.txt"), directory / f"{key}.txt")
+    (directory / 'plan.txt').write_text(
+        ''.join(f"{key}: {key}.txt\n" for key in MISSION_KEYS) + FIELDS)
+    return str(directory / 'plan.txt')
+
+
+def compiled(directory):
+    plan_file = write_plan(directory)
+    assert compile_plan(plan_file) == []
+    return os.path.splitext(plan_file)[0] + BUNDLE_EXTENSION
+
+
+def test_bundle_round_trip(tmp_path):
+    bundle = load_bundle(compiled(tmp_path))
+    assert not isinstance(bundle, int)
+    assert bundle.fields['detect_index'] == '1'
+    for key in MISSION_KEYS:
+        assert bundle.items(key) == load_mission_items(str(tmp_path / f"{key}.txt"))
+        assert bundle.sources[key] == str(tmp_path / f"{key}.txt")
+
+
+def test_corrupt_bundles_are_rejected(tmp_path):
+    path = compiled(tmp_path)
+    data = (tmp_path / 'plan.uasplan').read_bytes()
+
+    flipped = bytearray(data)
+    flipped[-1] ^= 0xff
+    (tmp_path / 'flipped.uasplan').write_bytes(bytes(flipped))
+    assert load_bundle(str(tmp_path / 'flipped.uasplan')) == BUNDLE_CORRUPT
+
+    for length in (len(data) - 8, HEADER.size, 4):
+        (tmp_path / 'short.uasplan').write_bytes(data[:length])
+        assert load_bundle(str(tmp_path / 'short.uasplan')) == BUNDLE_CORRUPT
+
+    versioned = bytearray(data)
+    struct.pack_into('<H', versioned, 8, 99)
+    (tmp_path / 'versioned.uasplan').write_bytes(bytes(versioned))
+    assert load_bundle(str(tmp_path / 'versioned.uasplan')) == BUNDLE_VERSION
+
+    assert load_bundle(str(tmp_path / 'missing.uasplan')) == BUNDLE_NOT_FOUND
+    assert not isinstance(load_bundle(path), int)
+
+
+def test_read_plan_dispatches_on_format(tmp_path):
+    bundle_path = compiled(tmp_path)
+
+    # the bundle is used even after the files it was compiled from are gone
+    for key in MISSION_KEYS:
+        os.remove(tmp_path / f"{key}.txt")
+    plan, problems = read_plan(bundle_path)
+    assert problems == [] and plan.items('detect') == load_mission_items(os.path.join(TESTING, 'detect.txt'))
+
+    # a text plan is validated and loaded from its mission files
+    plan, problems = read_plan(write_plan(tmp_path))
+    assert problems == [] and plan.items('land') == load_mission_items(os.path.join(TESTING, 'land.txt'))
+
+    (tmp_path / 'plan.uasplan').write_bytes(b'not a bundle')
+    plan, problems = read_plan(bundle_path)
+    assert plan is None and problems
+
+    os.remove(tmp_path / 'land.txt')
+    plan, problems = read_plan(str(tmp_path / 'plan.txt'))
+    assert plan is None and any('land' in problem for problem in problems)
+
+
+def test_memory_paths_serve_the_missions(tmp_path):
+    plan, _ = read_plan(compiled(tmp_path))
+    paths = plan.memory_paths()
+    try:
+        for key in MISSION_KEYS:
+            assert not paths[key].startswith(str(tmp_path))
+            assert load_mission_items(paths[key]) == plan.items(key)
+    finally:
+        plan.release()
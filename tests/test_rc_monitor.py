@@ -0,0 +1,83 @@
+from rc_monitor import RCMonitor, TIMEOUT_ERROR, WAIT_CANCELLED
+import threading
+import time
+
+
+class Sample:
+
+    def __init__(self, time_boot_ms, channel, pwm):
+        self.time_boot_ms = time_boot_ms
+        for index in range(1, 19):
+            setattr(self, f'chan{index}_raw', 1000)
+        setattr(self, f'chan{channel}_raw', pwm)
+
+    def get_type(self):
+        return 'RC_CHANNELS'
+
+
+class FakeDispatcher:
+
+    def add_listener(self, callback):
+        pass
+
+    def remove_listener(self, callback):
+        pass
+
+
+class Feeder:
+
+    def __init__(self, monitor, channel):
+        self.monitor = monitor
+        self.channel = channel
+        self.boot_ms = 0
+
+    def send(self, pwm, count=5):
+        for _ in range(count):
+            self.boot_ms += 20
+            self.monitor.on_message(Sample(self.boot_ms, self.channel, pwm))
+
+
+def start_wait(monitor, **kwargs):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(monitor.wait_for_input(6, 2000, timeout=kwargs.get('timeout', 2))))
+    thread.start()
+    # let the wait register its trigger
+    deadline = time.monotonic() + 1
+    while not monitor.triggers and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return thread, result
+
+
+def test_switch_left_on_does_not_confirm():
+    monitor = RCMonitor(FakeDispatcher())
+    feeder = Feeder(monitor, 6)
+    feeder.send(2000)   # already on before the wait
+
+    thread, result = start_wait(monitor, timeout=0.3)
+    feeder.send(2000)
+    thread.join()
+    assert result == [TIMEOUT_ERROR]
+
+
+def test_switch_flipped_on_confirms():
+    monitor = RCMonitor(FakeDispatcher())
+    feeder = Feeder(monitor, 6)
+    feeder.send(2000)
+
+    thread, result = start_wait(monitor)
+    feeder.send(2000)
+    feeder.send(1000)
+    feeder.send(2000)
+    thread.join()
+    assert result == [0]
+
+
+def test_cancel_ends_wait():
+    monitor = RCMonitor(FakeDispatcher())
+    thread, result = start_wait(monitor, timeout=5)
+    start = time.monotonic()
+    monitor.cancel_waits()
+    thread.join()
+    assert result == [WAIT_CANCELLED]
+    assert time.monotonic() - start < 1
+    assert not monitor.triggers
@@ -0,0 +1,129 @@
+import importlib
+import logging
+import threading
+import types
+import sys
+import pytest
+
+
+STATES = dict(
+    PREFLIGHT=0, TAKEOFF_WAIT=1, TAKEOFF=2, DETECT=3, AIRDROP=4, LANDING=5, COMPLETE=6,
+    IDLE=0, FLYING=1, OK=0, ABORT=1,
+    PREFLIGHT_INCOMPLETE=0, PREFLIGHT_COMPLETE=1,
+    DETECT_INCOMPLETE=0, DETECT_COMPLETE=1, DETECT_FAIL=2,
+    PAYLOAD_PRESENT=0, PAYLOAD_RELEASED=1,
+    AIRDROPS_INCOMPLETE=0, AIRDROPS_COMPLETE=1,
+)
+
+
+class FakeWatchdog:
+
+    def __init__(self):
+        self.warning = threading.Event()
+        self.state = 0
+
+    def snapshot(self):
+        return {'state': "OK", 'reasons': []}
+
+
+class FakeOperation:
+    '''
+        Stands in for uas_state_actions.Operation. The plan names what the
+        vehicle does: 'fly' runs every state, 'raise' raises in TAKEOFF and
+        'bad-plan' fails to load.
+    '''
+
+    def __init__(self, connection_string=None, replay_speed=None, name=None):
+        self.name = name
+        self.logger = logging.getLogger(f"fleet-test.{name}")
+        self.watchdog = FakeWatchdog()
+        self.status = STATES['OK']
+        self.flight_state = STATES['IDLE']
+        self.next_mission_state = STATES['PREFLIGHT']
+        self.closed = 0
+        self.plan = None
+
+    def load_plan(self, plan):
+        if plan == 'bad-plan':
+            raise ValueError("plan has no home")
+        self.plan = plan
+
+    def _advance(self):
+        self.next_mission_state += 1
+
+    def preflight_check(self):
+        self._advance()
+
+    def takeoff_wait(self):
+        self._advance()
+
+    def takeoff(self):
+        if self.plan == 'raise':
+            raise RuntimeError("lost the autopilot")
+        self.flight_state = STATES['FLYING']
+        self._advance()
+
+    def detect(self):
+        self._advance()
+
+    def airdrop(self):
+        self._advance()
+
+    def land(self):
+        self.flight_state = STATES['IDLE']
+        self._advance()
+
+    def append_next_mission(self):
+        pass
+
+    def close(self):
+        self.closed += 1
+
+
+@pytest.fixture
+def state_machine(monkeypatch, tmp_path):
+    # the real actions need MAVez and the cameras; the state machine only needs the operation's interface
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(sys.modules, 'uas_state_actions', types.SimpleNamespace(Operation=FakeOperation, **STATES))
+    monkeypatch.delitem(sys.modules, 'uas_state_machine', raising=False)
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    module = importlib.import_module('uas_state_machine')
+    yield module
+    sys.modules.pop('uas_state_machine', None)
+    for handler in root.handlers[len(handlers):]:
+        root.removeHandler(handler)
+        handler.close()
+
+
+def test_run_returns_metrics_when_an_action_raises(state_machine):
+    operation = FakeOperation(name='alpha')
+    operation.load_plan('raise')
+
+    metrics = state_machine.run(operation)
+
+    assert metrics['status'] == "ERROR"
+    assert metrics['error'] == "lost the autopilot"
+    assert list(metrics['state_durations']) == ["PREFLIGHT", "TAKEOFF WAIT", "TAKEOFF"]
+    assert metrics['link'] == {'state': "OK", 'reasons': []}
+    assert operation.closed == 1
+
+
+def test_run_vehicle_runs_every_state(state_machine):
+    metrics = state_machine.run_vehicle('alpha', 'tcp:127.0.0.1:5762', 'fly')
+    assert metrics['status'] == "OK" and 'error' not in metrics
+    assert list(metrics['state_durations']) == ["PREFLIGHT", "TAKEOFF WAIT", "TAKEOFF", "DETECT", "AIRDROP", "LANDING"]
+
+
+def test_one_vehicle_failing_does_not_stop_the_fleet(state_machine):
+    results = state_machine.run_fleet([
+        ('alpha', 'tcp:127.0.0.1:5762', 'fly'),
+        ('bravo', 'tcp:127.0.0.1:5772', 'bad-plan'),
+        ('charlie', 'tcp:127.0.0.1:5782', 'raise'),
+        ('delta', 'tcp:127.0.0.1:5792', 'fly'),
+    ])
+
+    assert [result['name'] for result in results] == ['alpha', 'bravo', 'charlie', 'delta']
+    assert [result['status'] for result in results] == ["OK", "ERROR", "ERROR", "OK"]
+    assert results[1] == {'name': 'bravo', 'status': "ERROR", 'error': "plan has no home"}
+    assert results[2]['error'] == "lost the autopilot" and 'TAKEOFF' in results[2]['state_durations']
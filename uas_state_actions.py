@@ -11,9 +11,19 @@ This module implements the actions for the UAS state machine.
 from MAVez.Coordinate import Coordinate
 from MAVez.Mission import Mission
 from MAVez.flight_manger import Flight
-from logging_config import configure_logging
+from logging_config import configure_logging, flush_logging
+from mavlink_dispatcher import MessageDispatcher
+from link_watchdog import LinkWatchdog, LINK_LOST
+from flight_recorder import FlightRecorder, ReplayCamera, images_dir_for, pace_replay
+from image_archiver import ImageArchiver
+from mission_upload import MissionUploader, items_from_mission
+from geometry import get_projection
+from rc_monitor import RCMonitor
+from plan_bundle import BUNDLE_EXTENSION, read_plan
+from path_simplify import simplify_plan
 from LionSight2 import lion_sight_2
 from UASCamera2 import UAS_camera
+import os
 import time
 import cv2
 
@@ -57,31 +67,81 @@ AIRDROPS_COMPLETE = 1
 
 # ============== Parameters =================
 MAX_DETECT_ATTEMPTS = 2
+AIRDROP_PASS_TIMEOUT = 300  # seconds to finish an airdrop pass before the next one is sent
+FIRST_MISSION_ITEM = 1      # mission seq 0 is home; the first item flown is 1
 
 
 
 
 class Operation:
 
-    def __init__(self, connection_string='/dev/ttyACM0'):
+    def __init__(self, connection_string='/dev/ttyACM0', replay_speed=None, name=None):
+        """
+        connection_string: autopilot connection, or a .tlog recording to replay
+        replay_speed: replay the recording at this multiple of real time;
+            None for a live flight, which is recorded
+        name: vehicle name; gives the operation its own logger and log files
+            when several run in one process
+        """
+        self.name = name
+        self.closed = False
 
         # Configure logging
-        self.logger = configure_logging()
+        self.logger = configure_logging(name)
 
         # Initialize components
         self.flight = Flight(connection_string=connection_string)
         self.flight.set_logger(self.logger)
 
-        self.camera = UAS_camera.get_camera(self.flight, self.flight.logger)  # Get real camera or emulator
+        # recordings are paced by their timestamps before anything reads them
+        if replay_speed:
+            pace_replay(self.flight.controller.master, replay_speed)
+
+        # single reader for the link; Flight's waits are served from it
+        self.dispatcher = MessageDispatcher(self.flight.controller.master, logger=self.logger, replay=bool(replay_speed))
+        self.dispatcher.start()
+        self.rc_monitor = RCMonitor(self.dispatcher, logger=self.logger)
+        self.rc_monitor.start()
+        self.watchdog = LinkWatchdog(self.dispatcher, logger=self.logger)
+        self.watchdog.add_callback(self.link_changed)
+        self.watchdog.start()
+
+        # diffs airdrop rebuilds against what the autopilot holds; follows Flight's own uploads
+        self.uploader = MissionUploader(self.flight.controller.master, logger=self.logger)
+        self.uploader.watch(self.dispatcher)
+
+        # record live flights so they can be replayed later
+        self.recorder = None
+        if not replay_speed:
+            self.recorder = FlightRecorder(self.dispatcher, logger=self.logger, name=name)
+            self.recorder.start()
+
+        if replay_speed:
+            # replays capture the recorded passes: their frame times and archived frames
+            self.camera = ReplayCamera(connection_string, self.dispatcher, logger=self.logger)
+        else:
+            self.camera = UAS_camera.get_camera(self.flight, self.flight.logger)  # Get real camera or emulator
         self.detection = lion_sight_2.get_ls2(logger=self.flight.logger)  # Get real detection or emulator
+
+        # archives detection frames in the background once detection is done with them;
+        # beside the recording, where a replay looks for them
+        self.archiver = ImageArchiver(
+            out_dir=images_dir_for(self.recorder.filename) if self.recorder else None,
+            logger=self.logger,
+            name=name,
+        )
+        self.archiver.start()
         
         # Initialize mission parameters
         self.mission_plan = None
+        self.plan = None
+        self.missions = {}
 
         self.detect_index = None
         self.airdrop_index = None
 
         self.home_coordinates = None
+        self.projection = None
         self.takeoff_mission = None
         self.landing_mission = None
         self.geofence_mission = None
@@ -91,9 +151,11 @@ class Operation:
         self.trigger_channel = None
         self.trigger_value = None
         self.trigger_wait_time = None
+        self.abort_trigger = None
 
         self.airdrop_altitude = 20
         self.drop_count = 0
+        self.airdrop_items = None   # rebuilt airdrop mission waiting to be sent by the uploader
 
         # Initialize states
         self.next_mission_state = None
@@ -116,23 +178,40 @@ class Operation:
 
     def load_plan(self, filename):
         """
-        Load the mission plan from a file.
+        Load the mission plan from a plan file, or from a compiled bundle
+        (see plan_bundle.py). Missions are read once, here; later checks use
+        the items held in memory.
         """
-        with open(filename, 'r') as file:
-            lines = file.readlines()
-        self.mission_plan = {}
-        for line in lines:
-            # skip empty lines
-            if line == '\n':
-                continue
-            # extract key and value from line and add to mission plan
-            key, value = line.split(':')
-            self.mission_plan[key.strip()] = value.strip()
-        
+        plan, problems = read_plan(filename)
+        if plan is None:
+            for problem in problems:
+                self.logger.critical(f"[Actions] {problem}")
+            self.status = ABORT
+            self.next_mission_state = COMPLETE
+            return
+
+        # simplify before anything reads the indices, so they follow their items
+        removed = 0
+        if 'simplify_tolerance' in plan.fields:
+            removed = simplify_plan(plan, float(plan.fields['simplify_tolerance']))
+            self.logger.info(f"[Actions] Simplified missions: {removed} items removed.")
+
+        self.plan = plan
+        self.missions = {key: plan.items(key) for key in plan.missions}
+        self.mission_plan = dict(plan.fields)
+        if filename.endswith(BUNDLE_EXTENSION) or removed:
+            # Flight loads missions by path; serve the verified (or simplified) missions from memory
+            self.mission_plan.update(plan.memory_paths())
+        else:
+            self.mission_plan.update(plan.sources)
+
         # convert home coordinates to Coordinate object
         lat, lon, alt = self.mission_plan['home'].split(',')
         self.mission_plan['home'] = Coordinate(float(lat), float(lon), float(alt))
 
+        # local ENU frame for mission geometry, anchored at home
+        self.projection = get_projection(float(lat), float(lon), float(alt))
+
         self.takeoff_mission = self.mission_plan['takeoff']
         self.landing_mission = self.mission_plan['land']
         self.geofence_mission = self.mission_plan['geofence']
@@ -149,6 +228,15 @@ class Operation:
 
         self.airdrop_altitude = float(self.mission_plan['airdrop_altitude'])
 
+        # optional RC abort switch
+        if 'abort_channel' in self.mission_plan and not self.abort_trigger:
+            self.abort_trigger = self.rc_monitor.add_trigger(
+                int(self.mission_plan['abort_channel']),
+                int(self.mission_plan['abort_value']),
+                tolerance=100,
+                callback=self.abort_switch,
+            )
+
         # set detection plan
         detection_entry = self.mission_plan['detection_entry'].split(',')
         detection_exit = self.mission_plan['detection_exit'].split(',')
@@ -160,7 +248,49 @@ class Operation:
 
         self.next_mission_state = PREFLIGHT
 
-        self.logger.info("[Actions] Mission plan loaded.")
+        self.logger.info(f"[Actions] Mission plan loaded: {filename}")
+
+
+    def frame_times(self, start, end):
+        """
+        Capture time of each frame of the last pass: the camera's own timestamps
+        when it keeps them (capture_times, or the modification times of image
+        files), otherwise spread evenly over the capture from start to end.
+        """
+        images = self.camera.images
+        times = getattr(self.camera, 'capture_times', None)
+        if times is not None and len(times) == len(images):
+            return list(times)
+        if images and all(isinstance(image, str) for image in images):
+            try:
+                return [os.path.getmtime(image) for image in images]
+            except OSError:
+                pass
+        if len(images) < 2:
+            return [end] * len(images)
+        step = (end - start) / len(images)
+        return [start + step * (index + 1) for index in range(len(images))]
+
+
+    def close(self):
+        """
+        Release background resources held by the operation. Safe to call more than once.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        # recorder first: its tail matters more than the image archive
+        if self.recorder:
+            self.recorder.stop()
+        self.archiver.stop()
+        self.rc_monitor.stop()
+        self.uploader.unwatch()
+        self.logger.info(f"[Upload] {self.uploader.summary()}.")
+        self.watchdog.stop()
+        self.dispatcher.stop()
+        if self.plan:
+            self.plan.release()
+        flush_logging(self.logger)
     
 
     def append_next_mission(self):
@@ -174,9 +304,12 @@ class Operation:
             self.logger.info("Detection mission appended.")
 
         elif self.next_mission_state == AIRDROP:
-            # append airdrop mission
-            self.flight.append_airdrop_mission()
-            self.logger.info("[Actions] Airdrop mission appended.")
+            # rebuilt airdrop missions are sent by the uploader, not queued on Flight
+            if self.airdrop_items is None:
+                self.flight.append_airdrop_mission()
+                self.logger.info("[Actions] Airdrop mission appended.")
+            else:
+                self.logger.info("[Actions] Airdrop mission rebuilt for next target.")
         
         elif self.next_mission_state == LANDING:
             # append landing mission
@@ -203,6 +336,7 @@ class Operation:
         # only run preflight check on first run
         if self.preflight_state == PREFLIGHT_INCOMPLETE:
             # pass preflight check to flight manager
+            self.uploader.invalidate()  # Flight may write missions; the uploader's copy is stale
             response = self.flight.preflight_check(self.landing_mission, self.geofence_mission, self.home_coordinates)
             if response: # any response means preflight check failed
                 self.logger.critical(f"[Actions] Preflight checks failed. {response}")
@@ -213,9 +347,9 @@ class Operation:
                 self.logger.info("[Actions] Preflight checks passed.")
 
                 # validate missions; response is 0 if successful
-                detect_response = self.validate_mission_file(self.detection_mission)
-                airdrop_response = self.validate_mission_file(self.airdrop_mission)
-                takeoff_response = self.validate_mission_file(self.takeoff_mission)
+                detect_response = self.validate_mission('detect')
+                airdrop_response = self.validate_mission('airdrop')
+                takeoff_response = self.validate_mission('takeoff')
 
                 # if any mission fails to load, abort
                 if detect_response or airdrop_response or takeoff_response:
@@ -224,6 +358,11 @@ class Operation:
                     return
                 
                 self.logger.info("[Actions] All missions validated.")
+
+                # waypoints outside the fence would trip the fence failsafe in flight
+                outside = self.check_missions_in_fence()
+                if outside:
+                    self.logger.warning(f"[Actions] {outside} mission waypoints are outside the geofence.")
                 
         # if everything is ok:
         self.preflight_state = PREFLIGHT_COMPLETE
@@ -238,13 +377,11 @@ class Operation:
 
         self.logger.info("[Actions] Waiting for takeoff confirmation...")
 
-        # wait_for_channel_input blocks until the channel input is received or timeout
-        response = self.flight.wait_for_channel_input(self.trigger_channel, self.trigger_value, wait_time=self.trigger_wait_time, value_tolerance=100) # TODO: determine channel and value
-        #input("Press enter to simulate takeoff confirmation...") # TODO: remove this line and uncomment the line above
-        response = 0
-        # if response is not 0, takeoff confirmation failed (timeout)
+        # wait_for_input blocks until the switch is flipped on (debounced), timeout (seconds) or abort
+        response = self.rc_monitor.wait_for_input(self.trigger_channel, self.trigger_value, tolerance=100, timeout=self.trigger_wait_time)
+        # if response is not 0, takeoff confirmation failed (timeout or abort)
         if response:
-            self.logger.critical("[Actions] Takeoff confirmation failed.")
+            self.logger.critical(f"[Actions] Takeoff confirmation failed: {self.rc_monitor.decode_error(response)}")
             self.status = ABORT
             self.next_mission_state = COMPLETE # still on ground, so mission is complete
 
@@ -254,11 +391,34 @@ class Operation:
 
     
 
+    def link_changed(self, state, reasons):
+        """
+        Abort as soon as the link is lost, without waiting out the current action's timeout.
+        """
+        if state == LINK_LOST:
+            self.logger.critical(f"[Actions] Link lost ({', '.join(reasons)}). Aborting...")
+            self.status = ABORT
+            self.dispatcher.cancel_waits()
+            self.rc_monitor.cancel_waits()
+
+
+    def abort_switch(self, trigger, active):
+        """
+        Abort when the RC abort switch is thrown, ending the current action's waits.
+        """
+        if active:
+            self.logger.critical(f"[Actions] Abort switch on channel {trigger.channel}. Aborting...")
+            self.status = ABORT
+            self.dispatcher.cancel_waits()
+            self.rc_monitor.cancel_waits()
+
+
     def takeoff(self):
         """
         Perform takeoff.
         """
         self.logger.info("[Actions] Taking off...")
+        self.uploader.invalidate()
         response = self.flight.takeoff(self.takeoff_mission)
         self.flight_state = FLYING # assume flying after takeoff, even if takeoff fails
 
@@ -292,6 +452,7 @@ class Operation:
         # wait and send detection mission
         self.logger.info("[Actions] Waiting to send detection mission...")
         self.flight.detect_mission.load_mission_from_file(self.detection_mission)
+        self.uploader.invalidate()
         self.flight.wait_and_send_next_mission()
 
 
@@ -310,12 +471,25 @@ class Operation:
         
         self.logger.info("[Actions] Starting detection...")
 
-        # take photos
-        self.camera.capture_images(20, 0)
-        
-        # perform detection
-        self.detection.images = self.camera.images
-        targets = self.detection.detect()
+        # keep archival off the CPU until detection is done
+        self.archiver.pause()
+        try:
+            # take photos
+            capture_start = time.time()
+            self.camera.capture_images(20, 0)
+            if self.recorder:
+                for index, timestamp in enumerate(self.frame_times(capture_start, time.time())):
+                    self.recorder.record_frame(index, timestamp)
+
+            # perform detection
+            self.detection.images = self.camera.images
+            targets = self.detection.detect()
+
+            # hand the frames to the archiver; never blocks, skips the pass if it is behind
+            self.archiver.submit(self.camera.images)
+        finally:
+            # a failed capture or detection must not leave archival paused
+            self.archiver.resume()
 
         # check for detection results
         if targets: # for successful detection
@@ -364,7 +538,11 @@ class Operation:
         print("===============AIRDROPPING===============")
         # wait and send airdrop mission
         self.logger.info("[Actions] Waiting to send airdrop mission...")
-        self.flight.wait_and_send_next_mission()
+        if self.airdrop_items is None:
+            self.uploader.invalidate()
+            self.flight.wait_and_send_next_mission()
+        elif self.send_airdrop_rebuild():
+            return
         
 
         # # targets must exist to perform airdrop
@@ -426,22 +604,70 @@ class Operation:
             self.next_mission_state = LANDING
         else: # odd drops can continue to next mission
             self.logger.info(f"[Actions] Payload {self.drop_count} away. Continuing to next airdrop.")
-            self.flight.build_airdrop_mission(
-                target_coordinate=self.targets[self.drop_count],  # use first target for airdrop mission
-                airdrop_mission_file= self.airdrop_mission,  # use airdrop mission file from mission plan
-                target_index=self.airdrop_index,  # use airdrop index from mission plan
-                altitude=self.airdrop_altitude,  # set altitude for airdrop pass
-                drop_count=self.drop_count,  # increment drop count for next airdrop
-            )
+            # only the target waypoint changes, so the uploader sends just that item
+            self.airdrop_items = self.build_airdrop_items(self.targets[self.drop_count])
             self.next_mission_state = AIRDROP # continue to airdrop next target
 
 
+    def build_airdrop_items(self, target):
+        """
+        Build the airdrop mission for a target with Flight's own builder and
+        return its items, so the uploader sends exactly what Flight would.
+        Returns an error code if the mission could not be built.
+        """
+        response = self.flight.build_airdrop_mission(
+            target_coordinate=target,
+            airdrop_mission_file=self.airdrop_mission,
+            target_index=self.airdrop_index,
+            altitude=self.airdrop_altitude,
+            drop_count=self.drop_count,
+        )
+        if response:
+            return response
+        return items_from_mission(self.flight.airdrop_mission)
+
+
+    def send_airdrop_rebuild(self):
+        """
+        Send a rebuilt airdrop mission once the current pass is flown.
+        The mission flown has the same length, so Flight's later waits still line up.
+        Returns an error code and aborts on failure.
+        """
+        items, self.airdrop_items = self.airdrop_items, None
+        if isinstance(items, int):
+            self.logger.critical(f"[Actions] Airdrop mission could not be rebuilt: {self.flight.decode_error(items)}")
+            self.status = ABORT
+            self.next_mission_state = LANDING
+            return items
+
+        response = self.flight.wait_for_waypoint_reached(len(items) - 1, AIRDROP_PASS_TIMEOUT)
+        if response:
+            self.logger.critical(f"[Actions] Airdrop pass not finished: {self.flight.decode_error(response)}")
+        else:
+            # start the new pass the way Flight.wait_and_send_next_mission does after a send:
+            # reset the mission, then AUTO; seq 0 is the home slot, so the pass starts at the first real item
+            response = self.uploader.upload(items) or self.uploader.set_current(FIRST_MISSION_ITEM, reset=True)
+            if response:
+                self.logger.critical(f"[Actions] Airdrop mission not sent: {self.uploader.decode_error(response)}")
+            else:
+                response = self.flight.controller.set_mode('AUTO')
+                if response:
+                    self.logger.critical(f"[Actions] Airdrop mission not started: {self.flight.decode_error(response)}")
+        if response:
+            self.status = ABORT
+            self.next_mission_state = LANDING
+            return response
+
+        return 0
+
+
     def land(self):
         """
         Perform landing.
         """
         # wait and send landing mission
         self.logger.info("[Actions] Waiting to send landing mission...")
+        self.uploader.invalidate()
         self.flight.wait_and_send_next_mission()
 
         # wait to be landed
@@ -487,48 +713,80 @@ class Operation:
         self.next_mission_state = TAKEOFF_WAIT # TODO: set to preflight for re-takeoff
         
 
-    def validate_mission_file(self, filename):
+    def check_missions_in_fence(self):
+        """
+        Check every mission waypoint against the geofence's inclusion polygons.
+        Returns the number of waypoints outside all of them.
+        """
+        fence = self.missions.get('geofence')
+        if not fence:
+            return 0
+
+        # split the fence file into polygons; param1 of a polygon vertex is the
+        # vertex count, but other fence items (e.g. circles, where it is the radius) stand alone
+        polygons = []
+        index = 0
+        while index < len(fence):
+            command = fence[index][3]
+            count = max(int(fence[index][4]), 1) if command in (5001, 5002) else 1
+            if command == 5001:   # MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION
+                polygon = fence[index:index + count]
+                polygons.append(([item[8] for item in polygon], [item[9] for item in polygon]))
+            index += count
+        if not polygons:
+            return 0
+
+        outside = 0
+        for key in ('takeoff', 'detect', 'airdrop', 'land'):
+            items = self.missions.get(key)
+            if not items:
+                continue
+
+            # skip items without a position (e.g. commands, home placeholders)
+            waypoints = [item for item in items if item[8] or item[9]]
+            if not waypoints:
+                continue
+            lat = [item[8] for item in waypoints]
+            lon = [item[9] for item in waypoints]
+
+            inside = False
+            for fence_lat, fence_lon in polygons:
+                inside = inside | self.projection.contains(fence_lat, fence_lon, lat, lon)
+
+            for item, ok in zip(waypoints, inside):
+                if not ok:
+                    self.logger.warning(f"[Actions] Waypoint {item[0]} of the {key} mission is outside the geofence.")
+                    outside += 1
+
+        return outside
+
+
+    def validate_mission(self, key):
         '''
-            Validate a mission from a file.
-            filename: str
-            start: int
-            end: int
+            Validate a loaded mission.
+            key: str
             returns:
-                0 if the mission was loaded successfully
-                201 if the file was not found
-                202 if the file was empty
+                0 if the mission is loaded and has items
+                501 if the mission was not loaded
+                502 if the mission is empty or has malformed items
         '''
-        FILE_NOT_FOUND = 501
-        FILE_EMPTY = 502
+        MISSION_NOT_LOADED = 501
+        MISSION_INVALID = 502
 
-        try:
-            with open(filename, 'r') as file:
-                lines = file.readlines()
-        except FileNotFoundError:
+        items = self.missions.get(key)
+        if items is None:
             if self.logger:
-                self.logger.error(f'[Actions] File {filename} not found')
-            return FILE_NOT_FOUND
+                self.logger.error(f'[Actions] Mission {key} is not loaded')
+            return MISSION_NOT_LOADED
 
-        if len(lines) == 0:
+        if not items or any(len(item) != 12 for item in items):
             if self.logger:
-                self.logger.error(f'[Actions] File {filename} is empty')
-            return FILE_EMPTY
-
-        for line in lines[1:]:
-            # skip empty lines
-            if line == '\n':
-                continue
+                self.logger.error(f'[Actions] Mission {key} is empty or invalid')
+            return MISSION_INVALID
 
-            parts = line.strip().split('\t')
-            if len(parts) != 12:
-                if self.logger:
-                    self.logger.error(f'[Actions] Invalid line in file {filename}: {line}')
-                return FILE_EMPTY
-        
         if self.logger:
-            self.logger.info(f'[Actions] Mission file {filename} is valid')
+            self.logger.info(f'[Actions] Mission {key} is valid')
         return 0
-        
 
 
 def main():
@@ -13,8 +13,11 @@ From MAVLink directory:
 '''
 
 import uas_state_actions
+import link_watchdog
 from logging_config import configure_logging
+from concurrent.futures import ThreadPoolExecutor
 import argparse
+import time
 
 # Configure logging
 logger = configure_logging()
@@ -68,29 +71,15 @@ def translate_mission_state(state):
     return state_translation.get(state, "Unknown State")
 
 
-def main():
-
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--connection",
-        type=str,
-        default="/dev/ttyACM0",
-        help="Connection string for the UAS. For Pi to Cube, use '/dev/ttyACM0'. For SITL, use 'tcp:127.0.0.1:5762. On Windows, check Device Manager under 'Ports (COM & LPT)'. On MacOS, run 'ls /dev/tty.*' to find the correct port. On Linux, run 'ls /dev/ttyUSB* /dev/ttyACM*' to find the correct port.",
-    )
-    parser.add_argument(
-        "--plan",
-        type=str,
-        default="./comp-left->west/plan.txt",
-        help="Path to the mission plan file. Default is './comp-left->west/plan.txt'. Naming convention: 'comp-left->west' indicates the runway to the left from the village, taking off towards the west. Other options: 'comp-left->east', 'comp-right->west', 'comp-right->east'.",
-    )
-
-    args = parser.parse_args()
-
-    # Initialize operation
-    operation = uas_state_actions.Operation(connection_string=args.connection)
-
-    # Load mission plan
-    operation.load_plan(args.plan)
+def run(operation):
+    """
+    Run an operation's state machine until the mission is complete.
+    Returns the operation's metrics: final status, total and per-state
+    durations in seconds, and the last link health snapshot. An action
+    that raises ends the run with status ERROR; the metrics up to that
+    point are still returned, with the error.
+    """
+    logger = operation.logger  # each operation logs to its own files
 
     # Define actions
     actions = {
@@ -102,38 +91,168 @@ def main():
         LANDING: operation.land
     }
 
-    while operation.next_mission_state != COMPLETE:
+    state_durations = {}
+    start_time = time.monotonic()
+    state, state_start = operation.next_mission_state, start_time
+    error = None
 
-        logger.info(f"[States] Current mission state: {translate_mission_state(operation.next_mission_state)}")
+    # close even when an action raises, so the recording and logs keep their tail
+    try:
+        while operation.next_mission_state != COMPLETE:
 
-        # get action corresponding to the next mission state
-        action = actions.get(operation.next_mission_state) 
+            state = operation.next_mission_state
+            logger.info(f"[States] Current mission state: {translate_mission_state(state)}")
+            state_start = time.monotonic()
 
-        # Verify that the mission state is valid
-        if action:
+            # get action corresponding to the next mission state
+            action = actions.get(state) 
+
+            # Verify that the mission state is valid
+            if action:
             
-            # Check for abort
-            if operation.status == ABORT:
+                # Check link health before committing to the next action
+                if operation.watchdog.warning.is_set():
+                    metrics = operation.watchdog.snapshot()
+                    logger.warning(f"[States] Link {metrics['state']}: {', '.join(metrics['reasons'])}")
+                    if operation.watchdog.state == link_watchdog.LINK_LOST:
+                        operation.status = ABORT
+
+                # Check for abort
+                if operation.status == ABORT:
 
-                logger.critical("[States] Operation aborted.")
-                # just end the mission if we are idle or landing
-                if operation.flight_state == IDLE or operation.next_mission_state == LANDING:
-                    operation.next_mission_state = COMPLETE
+                    logger.critical("[States] Operation aborted.")
+                    # just end the mission if we are idle or landing
+                    if operation.flight_state == IDLE or operation.next_mission_state == LANDING:
+                        operation.next_mission_state = COMPLETE
                 
-                else: # in the air
-                    operation.next_mission_state = LANDING # otherwise we need to land
+                    else: # in the air
+                        operation.next_mission_state = LANDING # otherwise we need to land
             
-            # Execute the action
-            else:
-                action()
-                operation.append_next_mission()
+                # Execute the action
+                else:
+                    action()
+                    operation.append_next_mission()
                 
 
+            else:
+                operation.next_mission_state = LANDING  # Fallback to landing state
+                operation.status = ABORT
+
+            name = translate_mission_state(state)
+            state_durations[name] = state_durations.get(name, 0) + time.monotonic() - state_start
+
+    except Exception as e:
+        logger.exception(f"[States] Action raised: {e}")
+        error = str(e)
+        name = translate_mission_state(state)
+        state_durations[name] = state_durations.get(name, 0) + time.monotonic() - state_start
+
+    finally:
+        link = operation.watchdog.snapshot()
+        operation.close()
+        logger.info("[States] Operation ended.")
+
+    metrics = {
+        'name': operation.name,
+        'status': "ERROR" if error else "ABORT" if operation.status == ABORT else "OK",
+        'duration': time.monotonic() - start_time,
+        'state_durations': state_durations,
+        'link': link,
+    }
+    if error:
+        metrics['error'] = error
+    return metrics
+
+
+def run_vehicle(name, connection, plan, replay_speed=None):
+    """
+    Build, plan and run one named operation. Used as a fleet worker.
+    """
+    operation = None
+    try:
+        operation = uas_state_actions.Operation(connection_string=connection, replay_speed=replay_speed, name=name)
+        operation.load_plan(plan)
+        return run(operation)
+
+    except Exception as e:
+        # one vehicle failing must not take the rest of the fleet down
+        logger.exception(f"[States] Vehicle {name} failed: {e}")
+        if operation:
+            operation.close()
+        return {'name': name, 'status': "ERROR", 'error': str(e)}
+
+
+def run_fleet(vehicles, replay_speed=None, max_workers=None):
+    """
+    Run several operations concurrently from one process.
+    vehicles: list of (name, connection string, plan file)
+    max_workers: threads to run them on; defaults to one per vehicle
+    Returns each vehicle's metrics, in the order given.
+    """
+    logger.info(f"[States] Starting fleet of {len(vehicles)} vehicles.")
+
+    # actions block on the link, so each operation gets its own worker thread
+    with ThreadPoolExecutor(max_workers=max_workers or len(vehicles), thread_name_prefix='operation') as pool:
+        futures = [pool.submit(run_vehicle, name, connection, plan, replay_speed) for name, connection, plan in vehicles]
+        results = [future.result() for future in futures]
+
+    for result in results:
+        if 'error' in result:
+            logger.error(f"[States] {result['name']}: {result['status']} ({result['error']})")
         else:
-            operation.next_mission_state = LANDING  # Fallback to landing state
-            operation.status = ABORT
-    
-    logger.info("[States] Operation ended.")
+            logger.info(f"[States] {result['name']}: {result['status']} in {result['duration']:.1f}s")
+
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--connection",
+        type=str,
+        default="/dev/ttyACM0",
+        help="Connection string for the UAS. For Pi to Cube, use '/dev/ttyACM0'. For SITL, use 'tcp:127.0.0.1:5762. On Windows, check Device Manager under 'Ports (COM & LPT)'. On MacOS, run 'ls /dev/tty.*' to find the correct port. On Linux, run 'ls /dev/ttyUSB* /dev/ttyACM*' to find the correct port.",
+    )
+    parser.add_argument(
+        "--plan",
+        type=str,
+        default="./comp-left->west/plan.txt",
+        help="Path to the mission plan file. Default is './comp-left->west/plan.txt'. Naming convention: 'comp-left->west' indicates the runway to the left from the village, taking off towards the west. Other options: 'comp-left->east', 'comp-right->west', 'comp-right->east'. A bundle compiled with plan_bundle.py (.uasplan) is verified and loaded in one read.",
+    )
+
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=None,
+        help="Replay a flight recording instead of flying. Pass the .tlog from ./flight_logs as --connection and the speed multiplier here, e.g. 60.",
+    )
+
+    parser.add_argument(
+        "--vehicle",
+        nargs=3,
+        action="append",
+        metavar=("NAME", "CONNECTION", "PLAN"),
+        help="Run several vehicles from one process, each with its own connection, plan and log files. Repeat once per vehicle, e.g. --vehicle sitl1 tcp:127.0.0.1:5762 ./backyard/plan.txt --vehicle sitl2 tcp:127.0.0.1:5772 ./backyard/plan.txt. Overrides --connection and --plan.",
+    )
+
+    args = parser.parse_args()
+
+    if args.vehicle:
+        run_fleet(args.vehicle, replay_speed=args.replay_speed)
+        return
+
+    # Initialize operation
+    operation = uas_state_actions.Operation(connection_string=args.connection, replay_speed=args.replay_speed)
+
+    # Load mission plan
+    try:
+        operation.load_plan(args.plan)
+    except BaseException:
+        operation.close()
+        raise
+
+    run(operation)
 
 
 if __name__ == "__main__":